@@ -0,0 +1,281 @@
+"""
+Reports over every account at once. All users' sets, weigh-ins and planners are read in one pass into NumPy column
+blocks, and every metric is computed with grouped sums over those columns instead of one get_points call per user.
+
+    python analytics.py [--backend json] [--path userdata.json]
+
+Needs NumPy, which the GUI itself doesn't.
+"""
+import argparse
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from catalog import WorkoutCatalog, catalog
+from history import to_ordinal
+from storage import Storage, open_storage
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def _group_slopes(groups: np.ndarray, x: np.ndarray, y: np.ndarray, count: int) -> np.ndarray:
+    """
+    Least-squares slope of y over x inside every group, all groups at once.
+
+    Args:
+        groups: Group index of every point, 0 to count - 1.
+        x: The x values.
+        y: The y values.
+        count: Number of groups.
+
+    Returns:
+        The slope for each group, NaN for groups with fewer than two distinct x values.
+    """
+    n = np.bincount(groups, minlength=count).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Centre x inside each group first, day ordinals are big enough for x squared to lose precision otherwise
+        mean_x = np.bincount(groups, weights=x, minlength=count) / n
+        dx = x - mean_x[groups]
+        sxy = np.bincount(groups, weights=dx * y, minlength=count)
+        sxx = np.bincount(groups, weights=dx * dx, minlength=count)
+        slopes = sxy / sxx
+    slopes[~(sxx > 0)] = np.nan
+    return slopes
+
+
+def _days_on_weekday(first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """
+    Args:
+        first: First day ordinal of each range.
+        last: Last day ordinal of each range, inclusive.
+
+    Returns:
+        A (ranges, 7) array with how many Mondays, Tuesdays, ... fall in each range.
+    """
+    # Day ordinal 1 is a Monday, so days with weekday w are the ones where ordinal % 7 == (w + 1) % 7
+    remainders = (np.arange(7) + 1) % 7
+    return (last[:, None] - remainders) // 7 - (first[:, None] - 1 - remainders) // 7
+
+
+class Cohort:
+    """
+    Column blocks for the whole user base.
+
+    Sets: user, exercise, day ordinal, weight, reps and sets, one row per logged set. Workouts that don't track a
+    column (cardio has no weight, reps or sets) have NaN there, and the metrics that need it skip those rows.
+    Weigh-ins: user, day ordinal and weight, one row per weigh-in.
+    Planner: a (users, 7, groups) boolean block, True where the user planned that muscle group on that weekday.
+    """
+    def __init__(self, users: List[str], exercises: List[str], groups: List[str], exercise_group: np.ndarray,
+                 sets: Dict[str, np.ndarray], weigh_ins: Dict[str, np.ndarray], planner: np.ndarray):
+        self.users = users
+        self.exercises = exercises
+        self.groups = groups
+        self.exercise_group = exercise_group
+        self.sets = sets
+        self.weigh_ins = weigh_ins
+        self.planner = planner
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[str, Dict]], workouts: WorkoutCatalog = catalog) -> 'Cohort':
+        """
+        Builds the column blocks from user records.
+
+        Args:
+            records: (username, record) pairs, e.g. from Storage.all_records.
+            workouts: The workout catalog, for each exercise's muscle group.
+
+        Returns:
+            The cohort.
+        """
+        exercises = list(workouts.ids())
+        exercise_index = {workout_id: i for i, workout_id in enumerate(exercises)}
+        groups = sorted({workouts.get(workout_id)['group'] for workout_id in exercises})
+        group_index = {group: i for i, group in enumerate(groups)}
+        exercise_group = np.array([group_index[workouts.get(workout_id)['group']] for workout_id in exercises],
+                                  dtype=np.int64)
+
+        users = []
+        set_columns = {name: [] for name in ('user', 'exercise', 'dates', 'weight', 'reps', 'sets')}
+        weigh_in_columns = {name: [] for name in ('user', 'dates', 'weight')}
+        planned = []
+        for user, record in records:
+            u = len(users)
+            users.append(user)
+            for key, lists in record.items():
+                if key == 'weight':
+                    dates = lists.get('dates', [])
+                    weigh_in_columns['user'].append(np.full(len(dates), u, dtype=np.int64))
+                    weigh_in_columns['dates'].append(np.array([to_ordinal(d) for d in dates], dtype=np.int64))
+                    weigh_in_columns['weight'].append(np.array(lists.get('weight', []), dtype=np.float64))
+                elif key in exercise_index:
+                    dates = lists.get('dates', [])
+                    n = len(dates)
+                    set_columns['user'].append(np.full(n, u, dtype=np.int64))
+                    set_columns['exercise'].append(np.full(n, exercise_index[key], dtype=np.int64))
+                    set_columns['dates'].append(np.array([to_ordinal(d) for d in dates], dtype=np.int64))
+                    for column in ('weight', 'reps', 'sets'):
+                        values = lists.get(column)
+                        set_columns[column].append(np.array(values, dtype=np.float64) if values is not None
+                                                   else np.full(n, np.nan))
+            for day, day_groups in record.get('planner', {}).items():
+                if day in WEEKDAYS:
+                    planned.extend((u, WEEKDAYS.index(day), group_index[group])
+                                   for group in day_groups if group in group_index)
+
+        def stack(columns: Dict[str, list], dtypes: Dict[str, type]) -> Dict[str, np.ndarray]:
+            return {name: np.concatenate(blocks) if blocks else np.empty(0, dtype=dtypes[name])
+                    for name, blocks in columns.items()}
+
+        int_columns = {'user': np.int64, 'exercise': np.int64, 'dates': np.int64}
+        sets = stack(set_columns, {name: int_columns.get(name, np.float64) for name in set_columns})
+        weigh_ins = stack(weigh_in_columns, {name: int_columns.get(name, np.float64) for name in weigh_in_columns})
+
+        planner = np.zeros((len(users), 7, len(groups)), dtype=bool)
+        if planned:
+            planned = np.array(planned, dtype=np.int64)
+            planner[planned[:, 0], planned[:, 1], planned[:, 2]] = True
+        return cls(users, exercises, groups, exercise_group, sets, weigh_ins, planner)
+
+    @classmethod
+    def load(cls, storage: Storage, workouts: WorkoutCatalog = catalog) -> 'Cohort':
+        """
+        Args:
+            storage: Where to read every user from.
+            workouts: The workout catalog.
+
+        Returns:
+            The cohort of every user in the storage.
+        """
+        return cls.from_records(storage.all_records(), workouts)
+
+    def progression(self) -> Dict[str, Tuple[float, int]]:
+        """
+        Average progression per exercise: the least-squares slope of weight over time for every user who logged the
+        exercise on at least two different days, averaged over those users.
+
+        Returns:
+            Workout id to (average weight gained per week, number of users averaged), for exercises with any.
+        """
+        weighted = ~np.isnan(self.sets['weight'])
+        # Only the (user, exercise) pairs someone actually logged get a group, not every user times every exercise
+        pair_keys = self.sets['user'][weighted] * len(self.exercises) + self.sets['exercise'][weighted]
+        pairs, groups = np.unique(pair_keys, return_inverse=True)
+        slopes = _group_slopes(groups.ravel(), self.sets['dates'][weighted].astype(np.float64),
+                               self.sets['weight'][weighted], len(pairs)) * 7
+        valid = ~np.isnan(slopes)
+        pair_exercises = pairs[valid] % len(self.exercises)
+        users_per_exercise = np.bincount(pair_exercises, minlength=len(self.exercises))
+        totals = np.bincount(pair_exercises, weights=slopes[valid], minlength=len(self.exercises))
+        return {self.exercises[i]: (float(totals[i] / users_per_exercise[i]), int(users_per_exercise[i]))
+                for i in np.flatnonzero(users_per_exercise)}
+
+    def adherence(self) -> np.ndarray:
+        """
+        How closely each user follows their planner: of the planned days between their first and last logged set,
+        the share on which they logged at least one exercise from a muscle group planned for that weekday.
+
+        Returns:
+            One value from 0 to 1 per user (in self.users order), NaN for users with no sets or no planned days.
+        """
+        count = len(self.users)
+        users = self.sets['user']
+        dates = self.sets['dates']
+        weekdays = (dates - 1) % 7
+        on_plan = self.planner[users, weekdays, self.exercise_group[self.sets['exercise']]]
+
+        # Distinct (user, day) pairs that hit the plan
+        span = int(dates.max()) + 1 if len(dates) else 1
+        days_hit = np.unique(users[on_plan] * span + dates[on_plan])
+        hits = np.bincount(days_hit // span, minlength=count).astype(np.float64)
+
+        # Each user's first and last logged day, an empty range for users with no sets
+        logged = np.bincount(users, minlength=count) > 0
+        first = np.full(count, np.iinfo(np.int64).max, dtype=np.int64)
+        last = np.full(count, np.iinfo(np.int64).min, dtype=np.int64)
+        np.minimum.at(first, users, dates)
+        np.maximum.at(last, users, dates)
+        first[~logged] = 1
+        last[~logged] = 0
+
+        planned_days = (_days_on_weekday(first, last) * self.planner.any(axis=2)).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = hits / planned_days
+        result[planned_days == 0] = np.nan
+        return result
+
+    def weight_trends(self) -> np.ndarray:
+        """
+        Returns:
+            Each user's body weight trend in weight per week (least-squares slope over their weigh-ins), NaN for
+            users with fewer than two.
+        """
+        return _group_slopes(self.weigh_ins['user'], self.weigh_ins['dates'].astype(np.float64),
+                             self.weigh_ins['weight'], len(self.users)) * 7
+
+    def weekly_volume(self, window: int = 4) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Total volume (weight x reps x sets) the whole cohort lifted each week, smoothed with a rolling mean. Sets of
+        workouts without all three columns don't count.
+
+        Args:
+            window: Number of weeks in the rolling mean.
+
+        Returns:
+            The Monday of every week (day ordinals) and the rolling mean of that week's volume.
+        """
+        dates = self.sets['dates']
+        if len(dates) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        mondays = dates - (dates - 1) % 7
+        first = int(mondays.min())
+        weeks = (mondays - first) // 7
+        lifted = self.sets['weight'] * self.sets['reps'] * self.sets['sets']
+        volume = np.bincount(weeks, weights=np.nan_to_num(lifted))
+        # Rolling mean over the last window weeks, shorter at the start
+        totals = np.cumsum(volume)
+        totals[window:] = totals[window:] - totals[:-window]
+        divisors = np.minimum(np.arange(1, len(volume) + 1), window)
+        return first + 7 * np.arange(len(volume)), totals / divisors
+
+    def report(self) -> Dict[str, object]:
+        """
+        Returns:
+            Every cohort metric in plain Python types, for printing or dumping to JSON.
+        """
+        adherence = self.adherence()
+        trends = self.weight_trends()
+        return {
+            'users': len(self.users),
+            'sets': int(len(self.sets['dates'])),
+            'progression': self.progression(),
+            'mean_adherence': float(np.nanmean(adherence)) if np.any(~np.isnan(adherence)) else None,
+            'mean_weight_trend': float(np.nanmean(trends)) if np.any(~np.isnan(trends)) else None,
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', default=None, help='storage backend, defaults to WORKOUT_STORAGE or json')
+    parser.add_argument('--path', default=None, help='storage path, defaults to WORKOUT_DATA or the backend default')
+    args = parser.parse_args(argv)
+
+    storage = open_storage(args.backend, args.path)
+    try:
+        report = Cohort.load(storage).report()
+    finally:
+        storage.close()
+
+    print(f"{report['users']} users, {report['sets']} logged sets")
+    for workout_id, (per_week, users) in sorted(report['progression'].items()):
+        print(f'  {catalog.get(workout_id)["name"]}: {per_week:+.2f} per week over {users} users')
+    if report['mean_adherence'] is not None:
+        print(f"Average planner adherence: {report['mean_adherence']:.0%}")
+    if report['mean_weight_trend'] is not None:
+        print(f"Average body weight trend: {report['mean_weight_trend']:+.2f} per week")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
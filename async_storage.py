@@ -0,0 +1,162 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from history import History
+from storage import Storage
+
+
+def _resolve(future: asyncio.Future, error: Optional[Exception] = None) -> None:
+    # A waiter that was cancelled may still have had its write saved, there's nobody left to tell
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(None)
+
+
+class AsyncStorage:
+    """
+    asyncio front for a Storage. Every call runs on one worker thread (the backends aren't safe to use from several
+    threads at once), so the event loop never blocks on disk.
+
+    Writes are group committed: append_sets and log_weight only queue the write and wait. A single flush task takes
+    everything queued so far and hands it to Storage.write_batch, so writes that arrive while a flush is on disk all
+    share the next one (one rewrite of userdata.json, one SQLite transaction, one journal write) instead of each
+    paying for their own. Backends that hold writes back themselves (the journal's batched fsyncs, the binary
+    store) are flushed at the end of every batch, before any waiter is told its write was saved.
+    """
+    def __init__(self, storage: Storage, max_batch: int = 512):
+        """
+        Args:
+            storage: The storage to drive.
+            max_batch: Most writes put into one flush.
+        """
+        self.storage = storage
+        self.max_batch = max_batch
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='storage')
+        self._pending: List[Tuple[Tuple, asyncio.Future]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        # How many flushes and writes went to disk, to see how well writes are being grouped
+        self.flushes = 0
+        self.writes = 0
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        """
+        Runs a blocking call on the storage thread.
+
+        Args:
+            fn: The function to call.
+            *args: Arguments for fn.
+
+        Returns:
+            What fn returned.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def load_user(self, user: str) -> Dict:
+        return await self.run(self.storage.load_user, user)
+
+    async def has_user(self, user: str) -> bool:
+        return await self.run(self.storage.has_user, user)
+
+    async def get_planner(self, user: str) -> Dict[str, List[str]]:
+        return await self.run(self.storage.get_planner, user)
+
+    async def get_history(self, user: str, tag: str) -> History:
+        return await self.run(self.storage.get_history, user, tag)
+
+    async def append_sets(self, user: str, rows: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """
+        Queues logged sets and waits until they are on disk.
+        """
+        await self._write(('sets', user, rows))
+
+    async def log_weight(self, user: str, date, weight: int) -> None:
+        """
+        Queues a weigh-in and waits until it is on disk.
+        """
+        await self._write(('weight', user, date, weight))
+
+    async def _write(self, op: Tuple) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((op, future))
+        if self._flusher is None:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush())
+        await future
+
+    async def _flush(self) -> None:
+        """
+        Writes queued operations in batches until the queue is empty.
+        """
+        try:
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                if self.storage.atomic_batches:
+                    groups = [batch]
+                else:
+                    # Only one user's writes are all-or-nothing, so each user gets their own commit
+                    by_user = {}
+                    for op, future in batch:
+                        by_user.setdefault(op[1], []).append((op, future))
+                    groups = list(by_user.values())
+                results = []
+                for group in groups:
+                    results.extend(await self._write_group(group))
+                await self._sync(results)
+                for future, error in results:
+                    _resolve(future, error)
+                self.flushes += 1
+                self.writes += len(batch)
+        finally:
+            self._flusher = None
+
+    async def _write_group(self, group: List[Tuple[Tuple, asyncio.Future]]
+                           ) -> List[Tuple[asyncio.Future, Optional[Exception]]]:
+        """
+        Returns:
+            Each write's future with the error it failed with, None if it was written.
+        """
+        try:
+            await self.run(self.storage.write_batch, [op for op, _ in group])
+        except Exception:
+            # Nothing in the group was saved. One bad write (e.g. an unknown user) shouldn't fail everyone else's,
+            # so retry them one by one
+            results = []
+            for op, future in group:
+                try:
+                    await self.run(self.storage.write_batch, [op])
+                except Exception as e:
+                    results.append((future, e))
+                else:
+                    results.append((future, None))
+            return results
+        return [(future, None) for _, future in group]
+
+    async def _sync(self, results: List[Tuple[asyncio.Future, Optional[Exception]]]) -> None:
+        """
+        Flushes the storage once for a whole batch, so the writes in it are on disk before anyone is told so. If that
+        fails, every write in the batch fails with the error.
+        """
+        flush = getattr(self.storage, 'flush', None)
+        if flush is None or all(error is not None for _, error in results):
+            return
+        try:
+            await self.run(flush)
+        except Exception as e:
+            results[:] = [(future, error or e) for future, error in results]
+
+    async def drain(self) -> None:
+        """
+        Waits until every queued write is on disk.
+        """
+        while self._flusher is not None:
+            await asyncio.shield(self._flusher)
+
+    def close(self) -> None:
+        """
+        Stops the storage thread once queued calls have finished. Doesn't close the storage itself.
+        """
+        self.executor.shutdown(wait=True)
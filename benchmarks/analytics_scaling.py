@@ -0,0 +1,83 @@
+"""
+Scaling benchmark for analytics.py. Builds synthetic user bases of growing size, loads each into a Cohort and runs
+every report, then checks that the time per logged set stays flat (linear scaling) up to the largest size.
+Exits with status 1 if the largest run costs more than --tolerance times the smallest per set.
+
+Usage:
+    python benchmarks/analytics_scaling.py [--sizes 10000 100000 1000000] [--sets-per-user 1000] [--tolerance 2]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import Cohort  # noqa: E402
+from catalog import catalog  # noqa: E402
+
+START = datetime.date(2023, 1, 2).toordinal()
+
+
+def synthetic_records(total_sets: int, sets_per_user: int, seed: int = 0):
+    """
+    Yields (username, record) pairs with total_sets logged sets between them, spread over random exercises, plus a
+    weigh-in every week and the default planner.
+    """
+    rng = random.Random(seed)
+    exercises = catalog.ids()
+    # Dates are stored as strings, so the benchmark pays for parsing them like a real load does
+    dates = [datetime.date.fromordinal(START + day).strftime('%m/%d/%Y') for day in range(3 * 365)]
+    planner = {'Sunday': [], 'Monday': ['Chest'], 'Tuesday': ['Back'], 'Wednesday': ['Legs'],
+               'Thursday': ['Shoulders'], 'Friday': ['Cardio'], 'Saturday': []}
+    for u in range(max(1, total_sets // sets_per_user)):
+        record = {'info': {}, 'planner': planner,
+                  'weight': {'dates': dates[::7][:sets_per_user // 10],
+                             'weight': [rng.randint(150, 220) for _ in dates[::7][:sets_per_user // 10]]}}
+        for workout_id in exercises:
+            record[workout_id] = {'dates': [], 'weight': [], 'reps': [], 'sets': [], 'notes': []}
+        for i in range(sets_per_user):
+            lists = record[rng.choice(exercises)]
+            lists['dates'].append(dates[i * len(dates) // sets_per_user])
+            lists['weight'].append(rng.randint(20, 300))
+            lists['reps'].append(rng.randint(1, 12))
+            lists['sets'].append(rng.randint(1, 5))
+            lists['notes'].append('')
+        yield f'user{u}', record
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='total logged sets for each run')
+    parser.add_argument('--sets-per-user', type=int, default=1000)
+    parser.add_argument('--tolerance', type=float, default=2.0,
+                        help='largest allowed ratio between the biggest and smallest run, per set')
+    args = parser.parse_args()
+
+    per_set = []
+    for size in args.sizes:
+        records = list(synthetic_records(size, args.sets_per_user))
+        start = time.perf_counter()
+        cohort = Cohort.from_records(records)
+        loaded = time.perf_counter()
+        cohort.report()
+        cohort.weekly_volume()
+        done = time.perf_counter()
+        sets = len(cohort.sets['dates'])
+        per_set.append((done - start) / sets)
+        print(f'{sets:>9} sets, {len(cohort.users):>6} users: load {loaded - start:.2f}s, '
+              f'reports {done - loaded:.3f}s, {per_set[-1] * 1e6:.2f}us per set')
+
+    ratio = per_set[-1] / per_set[0]
+    if ratio > args.tolerance:
+        print(f'FAIL: per-set cost grew {ratio:.1f}x from the smallest to the largest run')
+        return 1
+    print(f'OK: per-set cost changed {ratio:.1f}x from the smallest to the largest run')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
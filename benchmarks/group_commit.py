@@ -0,0 +1,78 @@
+"""
+Compares logging sets one blocking call at a time (submit_session) with the same sets sent as concurrent requests
+through async_submit_session, whose writes are group committed. Prints the throughput of both and how many writes
+shared each flush.
+
+Usage:
+    python benchmarks/group_commit.py [--backend json] [--users 50] [--requests 2000] [--concurrency 100]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import processing  # noqa: E402
+from storage import open_storage  # noqa: E402
+
+
+def new_record() -> dict:
+    return {'info': {}, 'weight': {'weight': [], 'dates': []}, 'planner': {},
+            'benchPress': {'dates': [], 'weight': [], 'reps': [], 'sets': [], 'notes': []}}
+
+
+def entries(i: int) -> dict:
+    return {'Bench Press': f'01/{i % 28 + 1:02d}/2024,{100 + i % 50},5,3,'}
+
+
+async def concurrent(requests: int, users: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            await processing.async_submit_session(f'user{i % users}', entries(i))
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', default='json')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for mode in ('blocking', 'async'):
+            processing.use_storage(open_storage(args.backend, os.path.join(tmp, f'{mode}.data')))
+            for u in range(args.users):
+                processing.storage.create_user(f'user{u}', new_record())
+            start = time.perf_counter()
+            if mode == 'blocking':
+                for i in range(args.requests):
+                    processing.submit_session(f'user{i % args.users}', entries(i))
+            else:
+                asyncio.run(concurrent(args.requests, args.users, args.concurrency))
+            results[mode] = time.perf_counter() - start
+            saved = sum(len(processing.get_points('benchPress', 'weight', f'user{u}')[0]) for u in range(args.users))
+            print(f'{mode:>8}: {args.requests / results[mode]:8.0f} sets/s, {saved} saved', end='')
+            driver = processing._async_storage
+            if mode == 'async' and driver is not None:
+                print(f', {driver.writes / max(driver.flushes, 1):.1f} writes per flush', end='')
+            print()
+            if saved != args.requests:
+                print('FAIL: sets were lost')
+                return 1
+        processing.storage.close()
+    print(f'Group commit speed-up: {results["blocking"] / results["async"]:.1f}x')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Cold start benchmark for the app. Imports the GUI module in a fresh interpreter with `python -X importtime`, adds up
+the time spent importing, and exits with status 1 if it's over budget or if a module that should only load on demand
+(pandas, matplotlib) was pulled in at startup.
+
+Usage:
+    python benchmarks/import_time.py [--module gui] [--budget-ms 1500] [--runs 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported just to show the login screen
+LAZY_MODULES = ('pandas', 'matplotlib')
+
+
+def measure(module: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Imports a module in a new interpreter and reads the -X importtime report.
+
+    Args:
+        module: The module to import.
+
+    Returns:
+        A tuple where:
+            - The first value is the total import time in milliseconds.
+            - The second value maps every imported top-level package to its cumulative time in milliseconds.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'Importing {module} failed:\n{result.stderr}')
+
+    packages = {}
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # The module's own line comes last and its cumulative time covers everything it imported
+        if name.strip() == module and not name.startswith('  '):
+            total = int(cumulative) / 1000
+        top = name.strip().split('.')[0]
+        packages[top] = max(packages.get(top, 0.0), int(cumulative) / 1000)
+    return total, packages
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='gui', help='module to import (default gui)')
+    parser.add_argument('--budget-ms', type=float, default=1500, help='fail above this many milliseconds')
+    parser.add_argument('--runs', type=int, default=5, help='take the fastest of this many runs')
+    args = parser.parse_args()
+
+    best = None
+    packages = {}
+    for _ in range(args.runs):
+        total, packages = measure(args.module)
+        best = total if best is None else min(best, total)
+
+    print(f'import {args.module}: {best:.1f} ms (budget {args.budget_ms:.0f} ms, best of {args.runs})')
+    for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:10]:
+        print(f'  {name:<20} {ms:8.1f} ms')
+
+    failed = False
+    loaded = [name for name in LAZY_MODULES if name in packages]
+    if loaded:
+        print(f'FAIL: imported at startup: {", ".join(loaded)}')
+        failed = True
+    if best > args.budget_ms:
+        print('FAIL: over budget')
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Scaling benchmark for recompute.py. Builds a synthetic user base with dates still stored as mm/dd/yyyy strings,
+converts it with the recompute:ordinal_dates transform using more and more worker processes, and prints the speed-up
+over one worker. Every run starts from a fresh copy of the data. The sharded backend scales best since every worker
+reads only its own users' files.
+
+Usage:
+    python benchmarks/recompute_scaling.py [--backend sharded] [--users 2000] [--sets 500] [--workers 1 2 4]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history import format_date  # noqa: E402
+from recompute import recompute  # noqa: E402
+from storage import open_storage  # noqa: E402
+from suite import synthetic_catalog, synthetic_users  # noqa: E402
+
+
+def legacy_users(users: int, sets: int):
+    for user, record in synthetic_users(synthetic_catalog(100), users, sets, seed=0):
+        for key, lists in record.items():
+            if key not in ('info', 'planner'):
+                lists['dates'] = [format_date(date) for date in lists['dates']]
+        yield user, record
+
+
+def build(backend: str, path: str, users: int, sets: int) -> None:
+    if backend == 'json':
+        # One write of the whole file instead of a rewrite per user
+        with open(path, 'w') as f:
+            json.dump(dict(legacy_users(users, sets)), f)
+        return
+    storage = open_storage(backend, path)
+    try:
+        for user, record in legacy_users(users, sets):
+            storage.save_user(user, record)
+    finally:
+        storage.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', default='sharded')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--sets', type=int, default=500, help='logged sets per user')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--chunk', type=int, default=None)
+    args = parser.parse_args()
+
+    print(f'{os.cpu_count()} cores, {args.users} users x {args.sets} sets ({args.backend})')
+    first = None
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'userdata')
+            build(args.backend, path, args.users, args.sets)
+            start = time.perf_counter()
+            counts = recompute(args.backend, path, 'recompute:ordinal_dates', workers, args.chunk)
+            elapsed = time.perf_counter() - start
+        if counts['changed'] != args.users:
+            print(f'FAIL: {counts["changed"]} of {args.users} users were converted')
+            return 1
+        if first is None:
+            first = elapsed
+        # Relative to the first run, scaled up to what it would be against a single worker
+        speed_up = first / elapsed * args.workers[0]
+        print(f'{workers:>3} workers: {elapsed:6.2f}s, {args.users / elapsed:7.0f} users/s, {speed_up:.2f}x '
+              f'({speed_up / workers:.0%} of linear)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Throughput benchmark for server.py. Starts the server on a Unix socket over a scratch copy of the data, creates some
+accounts, then runs concurrent keep-alive clients that each send a mix of requests (set submissions, weigh-ins,
+points queries and session generation) and reports requests per second and p50/p99 latency.
+
+Usage:
+    python benchmarks/server_throughput.py [--clients 32] [--requests 200] [--users 8] [--backend journal]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from client import AsyncClient  # noqa: E402
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_client(socket_path: str, client_id: int, requests: int, users: int, latencies: list) -> int:
+    """
+    Sends requests requests on one connection, cycling through the endpoints.
+
+    Returns:
+        How many requests didn't come back with status 200.
+    """
+    client = AsyncClient(unix=socket_path)
+    failures = 0
+    for i in range(requests):
+        user = f'bench{(client_id + i) % users}'
+        kind = i % 4
+        start = time.perf_counter()
+        if kind == 0:
+            status, _ = await client.request('POST', '/sets', user=user,
+                                             entries={'Bench Press': f'01/{i % 28 + 1:02d}/2024,{100 + i % 50},5,3,'})
+        elif kind == 1:
+            status, _ = await client.request('POST', '/weigh-ins', user=user, weight=150 + i % 30,
+                                             date=738886 + i % 365)
+        elif kind == 2:
+            status, _ = await client.request('GET', '/points', user=user, tag='benchPress', focus='weight', width=400)
+        else:
+            status, _ = await client.request('GET', '/session', user=user, day='Monday')
+        latencies.append(time.perf_counter() - start)
+        failures += status != 200
+    await client.close()
+    return failures
+
+
+async def wait_for_socket(path: str, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise TimeoutError('server did not start')
+        await asyncio.sleep(0.05)
+
+
+async def benchmark(args: argparse.Namespace, socket_path: str) -> int:
+    await wait_for_socket(socket_path)
+    setup = AsyncClient(unix=socket_path)
+    for u in range(args.users):
+        await setup.request('POST', '/accounts', username=f'bench{u}', password='pw')
+    await setup.close()
+
+    latencies = []
+    start = time.perf_counter()
+    failures = await asyncio.gather(*(run_client(socket_path, c, args.requests, args.users, latencies)
+                                      for c in range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    total = args.clients * args.requests
+    print(f'{args.backend}: {args.clients} clients sent {total} requests in {elapsed:.2f}s '
+          f'({total / elapsed:.0f} req/s), p50 {percentile(latencies, 0.5) * 1000:.1f}ms, '
+          f'p99 {percentile(latencies, 0.99) * 1000:.1f}ms')
+    if sum(failures):
+        print(f'FAIL: {sum(failures)} requests failed')
+        return 1
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=200, help='requests sent by each client')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--backend', default='journal')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The server reads workouts.json and login.csv from its working directory
+        shutil.copy(os.path.join(ROOT, 'workouts.json'), tmp)
+        with open(os.path.join(tmp, 'login.csv'), 'w', newline='') as f:
+            f.write(',Users,Passwords\n')
+        socket_path = os.path.join(tmp, 'server.sock')
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server.py'), '--unix', socket_path,
+                                   '--backend', args.backend], cwd=tmp, stdout=subprocess.DEVNULL)
+        try:
+            return asyncio.run(benchmark(args, socket_path))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Multi-process stress test for the storage layer. Starts N writer processes against one shared storage, each logging
+sets and weigh-ins for the same users at the same time, then checks that every single entry made it to disk.
+Exits with status 1 if anything was lost.
+
+Usage:
+    python benchmarks/stress_concurrency.py [--backend json] [--writers 8] [--entries 50] [--users 2]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import open_storage  # noqa: E402
+
+# Backends that can be shared by several processes
+SHARED_BACKENDS = ('json', 'sharded', 'sqlite')
+
+
+def new_record() -> dict:
+    return {
+        'info': {},
+        'weight': {'weight': [], 'dates': []},
+        'planner': {},
+        'benchPress': {'dates': [], 'weight': [], 'reps': [], 'sets': [], 'notes': []},
+    }
+
+
+def weigh_in_date(writer_id: int, entry: int) -> int:
+    return 700000 + writer_id * 10000 + entry
+
+
+def writer(backend: str, path: str, writer_id: int, entries: int, users: int) -> None:
+    """
+    Logs entries sets and entries weigh-ins, spread over the users. Every entry is tagged so it can be found later.
+    """
+    storage = open_storage(backend, path)
+    for i in range(entries):
+        user = f'user{i % users}'
+        storage.append_set(user, 'benchPress', {'dates': '01/01/2024', 'weight': writer_id, 'reps': i, 'sets': 1,
+                                                'notes': f'{writer_id}-{i}'})
+        # Unique date (day ordinal) per writer and entry so no weigh-in is meant to replace another
+        storage.log_weight(user, weigh_in_date(writer_id, i), i)
+    storage.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', default='json', choices=SHARED_BACKENDS)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--entries', type=int, default=50, help='sets (and weigh-ins) logged by each writer')
+    parser.add_argument('--users', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'userdata')
+        storage = open_storage(args.backend, path)
+        for u in range(args.users):
+            storage.create_user(f'user{u}', new_record())
+        storage.close()
+
+        start = time.perf_counter()
+        processes = [multiprocessing.Process(target=writer,
+                                             args=(args.backend, path, w, args.entries, args.users))
+                     for w in range(args.writers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+        crashed = [process.exitcode for process in processes if process.exitcode != 0]
+
+        storage = open_storage(args.backend, path)
+        expected_notes = {f'{w}-{i}' for w in range(args.writers) for i in range(args.entries)}
+        expected_dates = {weigh_in_date(w, i) for w in range(args.writers) for i in range(args.entries)}
+        notes = set()
+        dates = set()
+        for u in range(args.users):
+            notes.update(storage.get_points(f'user{u}', 'benchPress', 'notes')[1])
+            dates.update(storage.get_points(f'user{u}', 'weight', 'weight')[0])
+        storage.close()
+
+    total = args.writers * args.entries * 2
+    print(f'{args.backend}: {args.writers} writers logged {total} entries in {elapsed:.2f}s '
+          f'({total / elapsed:.0f} entries/s)')
+    lost_sets = len(expected_notes - notes)
+    lost_weights = len(expected_dates - dates)
+    if crashed or lost_sets or lost_weights:
+        print(f'FAIL: {len(crashed)} writers crashed, lost {lost_sets} sets and {lost_weights} weigh-ins')
+        return 1
+    print('OK: nothing lost')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
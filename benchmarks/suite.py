@@ -0,0 +1,265 @@
+"""
+Benchmark suite for the processing functions the GUI calls. For every scale it generates a synthetic catalog of N
+exercises and a user base of M users with K logged sets each, loads them into the chosen backend, then times
+run_login, run_account_create, send_to_file, log_weight, get_points and pick_workout and reports calls per second and
+p50/p99 latency.
+
+Results can be saved as a baseline and later runs compared against it, e.g. before and after a change:
+
+    python benchmarks/suite.py --save benchmarks/baseline-json.json
+    python benchmarks/suite.py --compare benchmarks/baseline-json.json
+
+--compare exits with status 1 if any function got more than --threshold slower at p50.
+
+Usage:
+    python benchmarks/suite.py [--backend json] [--scales small medium] [--calls 200] [--seed 0]
+                               [--cache through|back] [--save PATH] [--compare PATH] [--threshold 0.25]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# (exercises, users, sets per user)
+SCALES = {
+    'small': (50, 20, 200),
+    'medium': (200, 200, 1000),
+    'large': (1000, 1000, 2000),
+}
+
+GROUPS = ('Chest', 'Back', 'Legs', 'Shoulders', 'Cardio')
+WEIGHTED = ['dates', 'weight', 'reps', 'sets', 'notes']
+CARDIO = ['dates', 'time', 'pace', 'distance', 'notes']
+PLANNER = {'Sunday': [], 'Monday': ['Chest'], 'Tuesday': ['Back'], 'Wednesday': ['Legs'],
+           'Thursday': ['Shoulders'], 'Friday': ['Cardio'], 'Saturday': []}
+DAYS = list(PLANNER)
+START = datetime.date(2023, 1, 2).toordinal()
+
+def synthetic_catalog(exercises: int) -> Dict[str, Dict]:
+    """
+    Returns:
+        A workouts.json document with exercises entries spread evenly over the muscle groups.
+    """
+    catalog = {}
+    for i in range(exercises):
+        group = GROUPS[i % len(GROUPS)]
+        catalog[f'exercise{i}'] = {'name': f'Exercise {i}', 'group': group,
+                                   'type': 'independent' if group == 'Cardio' else 'Weighted',
+                                   'attributes': CARDIO if group == 'Cardio' else WEIGHTED}
+    return catalog
+
+
+def synthetic_users(catalog: Dict[str, Dict], users: int, sets: int, seed: int) -> Iterator[Tuple[str, Dict]]:
+    """
+    Yields (username, record) pairs, each with sets logged sets over random exercises (two a day from START), a
+    weigh-in every tenth set and the default planner.
+    """
+    rng = random.Random(seed)
+    ids = list(catalog)
+    for u in range(users):
+        record = {'info': {}, 'planner': PLANNER, 'weight': {'dates': [], 'weight': []}}
+        for i in range(sets):
+            ordinal = START + i // 2
+            workout_id = rng.choice(ids)
+            lists = record.setdefault(workout_id, {attribute: [] for attribute in catalog[workout_id]['attributes']})
+            lists['dates'].append(ordinal)
+            lists['notes'].append('')
+            if 'weight' in lists:
+                lists['weight'].append(rng.randint(20, 300))
+                lists['reps'].append(rng.randint(1, 12))
+                lists['sets'].append(rng.randint(1, 5))
+            else:
+                lists['time'].append(rng.randint(10, 60))
+                lists['pace'].append(rng.randint(4, 12))
+                lists['distance'].append(rng.randint(1, 20))
+            if i % 10 == 0:
+                record['weight']['dates'].append(ordinal)
+                record['weight']['weight'].append(rng.randint(150, 220))
+        yield f'user{u}', record
+
+
+def build(directory: str, backend: str, exercises: int, users: int, sets: int, seed: int) -> str:
+    """
+    Writes workouts.json, login.csv and the user data for one scale into directory.
+
+    Returns:
+        The storage path for the backend.
+    """
+    from storage import open_storage
+
+    catalog = synthetic_catalog(exercises)
+    with open(os.path.join(directory, 'workouts.json'), 'w') as f:
+        json.dump(catalog, f)
+    with open(os.path.join(directory, 'login.csv'), 'w', newline='') as f:
+        f.write(',Users,Passwords\n')
+        for u in range(users):
+            f.write(f'{u + 1},user{u},pw{u}\n')
+
+    records = synthetic_users(catalog, users, sets, seed)
+    path = os.path.join(directory, f'userdata.{backend}')
+    if backend == 'json':
+        # One write of the whole file instead of a rewrite per user
+        with open(path, 'w') as f:
+            json.dump(dict(records), f)
+        return path
+    storage = open_storage(backend, path)
+    try:
+        for user, record in records:
+            storage.save_user(user, record)
+    finally:
+        storage.close()
+    return path
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(call: Callable[[int], None], calls: int) -> Dict[str, float]:
+    """
+    Times call(0) ... call(calls - 1) one by one.
+
+    Returns:
+        Calls per second and the p50/p99 latency in milliseconds.
+    """
+    latencies = []
+    for i in range(calls):
+        start = time.perf_counter()
+        call(i)
+        latencies.append(time.perf_counter() - start)
+    return {'calls_per_s': len(latencies) / sum(latencies),
+            'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000}
+
+
+def run_scale(backend: str, exercises: int, users: int, sets: int, calls: int, seed: int,
+              cache: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Generates one scale in a scratch directory and times every benchmarked function against it. cache puts a
+    CachedStorage in front of the backend, 'through' for write-through or 'back' for write-back.
+
+    Returns:
+        function name -> measure() result.
+    """
+    import processing
+    from cache import CachedStorage
+    from storage import open_storage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The catalog and login directory read workouts.json and login.csv from the working directory
+        os.chdir(tmp)
+        path = build(tmp, backend, exercises, users, sets, seed)
+        storage = open_storage(backend, path)
+        if cache is not None:
+            storage = CachedStorage(storage, write_back=cache == 'back')
+        processing.use_storage(storage)
+        processing.catalog.refresh()
+
+        rng = random.Random(seed)
+        user = [f'user{rng.randrange(users)}' for _ in range(calls)]
+        weighted = [record['name'] for record in processing.catalog.records.values() if record['group'] != 'Cardio']
+        today = START + sets // 2
+
+        timings = {}
+        timings['run_login'] = measure(lambda i: processing.run_login(user[i], f'pw{user[i][4:]}'), calls)
+        timings['run_account_create'] = measure(lambda i: processing.run_account_create(f'new{i}', 'pw'), calls)
+        timings['send_to_file'] = measure(
+            lambda i: processing.send_to_file(weighted[i % len(weighted)], [today + i, 100 + i % 50, 5, 3, ''],
+                                              user[i]), calls)
+        timings['log_weight'] = measure(lambda i: processing.log_weight(150 + i % 50, today + i, user[i]), calls)
+        timings['get_points'] = measure(
+            lambda i: processing.get_points(processing.catalog.id_for(weighted[i % len(weighted)]), 'weight',
+                                            user[i]), calls)
+        timings['pick_workout'] = measure(lambda i: processing.pick_workout(DAYS[i % len(DAYS)], user[i]), calls)
+
+        processing.storage.close()
+        os.chdir(ROOT)
+    return timings
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: Dict[str, Dict], baseline: Dict, threshold: float) -> int:
+    """
+    Prints how every function moved against the baseline.
+
+    Returns:
+        How many functions got more than threshold slower at p50.
+    """
+    regressions = 0
+    print(f'\nAgainst baseline {baseline["commit"]} ({baseline["backend"]}, {baseline["date"]}):')
+    for scale, timings in results.items():
+        for function, now in timings.items():
+            before = baseline['results'].get(scale, {}).get(function)
+            if before is None:
+                continue
+            change = now['p50_ms'] / before['p50_ms'] - 1
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f'{scale:>7} {function:<20} p50 {before["p50_ms"]:8.3f} -> {now["p50_ms"]:8.3f}ms '
+                  f'({change:+.0%}), {before["calls_per_s"]:9.0f} -> {now["calls_per_s"]:9.0f} calls/s{flag}')
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', default='json')
+    parser.add_argument('--scales', nargs='+', default=['small', 'medium'], choices=SCALES)
+    parser.add_argument('--calls', type=int, default=200, help='calls timed for each function')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache', choices=['through', 'back'], default=None,
+                        help='put the record cache in front of the backend, write-through or write-back')
+    parser.add_argument('--save', default=None, help='write the results to this baseline file')
+    parser.add_argument('--compare', default=None, help='compare the results with this baseline file')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='p50 slow-down against the baseline that counts as a regression (0.25 = 25%%)')
+    args = parser.parse_args()
+    # Relative to where the command was run, before run_scale moves around
+    save = args.save and os.path.abspath(args.save)
+    baseline_path = args.compare and os.path.abspath(args.compare)
+
+    results = {}
+    for scale in args.scales:
+        exercises, users, sets = SCALES[scale]
+        print(f'{scale}: {exercises} exercises, {users} users x {sets} sets ({args.backend})')
+        results[scale] = run_scale(args.backend, exercises, users, sets, args.calls, args.seed, args.cache)
+        for function, timing in results[scale].items():
+            print(f'  {function:<20} {timing["calls_per_s"]:9.0f} calls/s   p50 {timing["p50_ms"]:8.3f}ms   '
+                  f'p99 {timing["p99_ms"]:8.3f}ms')
+
+    if save:
+        with open(save, 'w') as f:
+            json.dump({'commit': git_commit(), 'date': datetime.date.today().isoformat(), 'backend': args.backend,
+                       'cache': args.cache, 'python': platform.python_version(), 'calls': args.calls,
+                       'results': results}, f, indent=2)
+        print(f'Saved baseline to {args.save}')
+    if baseline_path:
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f'FAIL: {regressions} functions regressed by more than {args.threshold:.0%}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Iterable, List, Tuple
+
+import instrument
+from storage import Storage, record_version
+
+HEADER = b'WUB2'
+# Files from before slots held two copies, converted to the current layout when opened
+OLD_HEADER = b'WUB1'
+FOOTER_MAGIC = b'WUBI'
+# Index offset, index length, magic
+FOOTER = struct.Struct('<QI4s')
+# Slot offset, slot capacity, username length (the username bytes follow)
+ENTRY = struct.Struct('<QII')
+# Sequence number, data length, CRC32 of the data, at the start of each copy in a slot
+COPY = struct.Struct('<QII')
+
+
+class BinaryStorage(Storage):
+    """
+    Keeps every user's record in its own slot of one binary file that is read through mmap, so looking up a user
+    only decodes that user's bytes instead of the whole user base.
+
+    Layout: the 'WUB2' header, then slots, then an index of username -> (offset, capacity), then a footer pointing
+    at that index. A slot is split into two copies, each a sequence number, length and CRC32 followed by the JSON
+    encoded record. The copy with the highest sequence number whose checksum matches is the current record.
+
+    Copies are given spare room, so most updates write the user's older copy in place and the current one is left
+    alone until the new one is complete: a crash part way through leaves a copy that fails its checksum and the
+    previous record is read instead. When a record outgrows its slot it is written to a new slot at the end of the
+    file followed by a new index and footer, and the old slot becomes garbage that compact() cleans up.
+    """
+    def __init__(self, path: str = 'userdata.bin', slack: float = 2.0, min_slot: int = 256):
+        """
+        Opens the file, creating an empty one if needed, and reads the index.
+
+        Args:
+            path: The binary snapshot file.
+            slack: Each copy in a new slot has room for this many times the record's size.
+            min_slot: Smallest room for a record in each copy of a slot, in bytes.
+        """
+        self.path = path
+        self.slack = slack
+        self.min_slot = min_slot
+        self._lock = threading.Lock()
+        if not os.path.exists(path):
+            self._write_empty(path)
+        self._open()
+
+    @staticmethod
+    def _write_empty(path: str) -> None:
+        with open(path, 'wb') as f:
+            f.write(HEADER + FOOTER.pack(len(HEADER), 0, FOOTER_MAGIC))
+
+    def _open(self) -> None:
+        """
+        Maps the file and loads the index from the last complete footer.
+        """
+        self._file = open(self.path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = self._map[:len(HEADER)]
+        if header not in (HEADER, OLD_HEADER):
+            raise ValueError(f'{self.path} is not a binary user file')
+
+        # A crash while relocating a slot can leave a torn tail, so walk back to the last footer that checks out
+        end = len(self._map)
+        while True:
+            position = self._map.rfind(FOOTER_MAGIC, 0, end)
+            if position < 0:
+                raise ValueError(f'{self.path} has no readable index')
+            start = position + len(FOOTER_MAGIC) - FOOTER.size
+            if start >= len(HEADER):
+                index_offset, index_length, _ = FOOTER.unpack_from(self._map, start)
+                if index_offset + index_length == start:
+                    break
+            end = position
+
+        self.index = {}
+        offset = index_offset
+        while offset < start:
+            slot_offset, capacity, name_length = ENTRY.unpack_from(self._map, offset)
+            offset += ENTRY.size
+            name = self._map[offset:offset + name_length].decode('utf-8')
+            offset += name_length
+            self.index[name] = (slot_offset, capacity)
+        self._end = start + FOOTER.size
+        self._live = sum(capacity for _, capacity in self.index.values())
+        if header == OLD_HEADER:
+            # Slots there are a bare record padded with spaces
+            self._rewrite((name, self._new_slot(self._map[offset:offset + capacity].rstrip(b' '), 1))
+                          for name, (offset, capacity) in self.index.items())
+
+    def _remap(self) -> None:
+        if len(self._map) < os.fstat(self._file.fileno()).st_size:
+            self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _encode_index(self) -> bytes:
+        parts = []
+        for name, (offset, capacity) in self.index.items():
+            encoded = name.encode('utf-8')
+            parts.append(ENTRY.pack(offset, capacity, len(encoded)) + encoded)
+        return b''.join(parts)
+
+    def users(self) -> List[str]:
+        with self._lock:
+            return list(self.index)
+
+    def has_user(self, user: str) -> bool:
+        with self._lock:
+            return user in self.index
+
+    def _read_slot(self, offset: int, capacity: int) -> Tuple[int, int, bytes]:
+        """
+        Finds the current copy in a slot. Caller holds the lock.
+
+        Returns:
+            Which copy it is (0 or 1), its sequence number and the encoded record.
+        """
+        if offset + capacity > len(self._map):
+            self._remap()
+        half = capacity // 2
+        best = None
+        for copy in (0, 1):
+            start = offset + copy * half
+            sequence, length, crc = COPY.unpack_from(self._map, start)
+            # Sequence 0 is a copy that was never written
+            if sequence == 0 or length > half - COPY.size:
+                continue
+            data = self._map[start + COPY.size:start + COPY.size + length]
+            if zlib.crc32(data) == crc and (best is None or sequence > best[1]):
+                best = (copy, sequence, data)
+        if best is None:
+            raise ValueError(f'{self.path}: both copies of the slot at {offset} are damaged')
+        return best
+
+    def load_user(self, user: str) -> Dict:
+        with self._lock:
+            return instrument.loads_json(self._read_slot(*self.index[user])[2])
+
+    def commit(self, user: str, record: Dict, version: int) -> bool:
+        with self._lock:
+            if user in self.index:
+                if record_version(instrument.loads_json(self._read_slot(*self.index[user])[2])) != version:
+                    return False
+            record.setdefault('info', {})['version'] = version + 1
+            self._save(user, json.dumps(record).encode('utf-8'))
+        return True
+
+    def save_user(self, user: str, record: Dict) -> None:
+        data = json.dumps(record).encode('utf-8')
+        with self._lock:
+            self._save(user, data)
+
+    @staticmethod
+    def _copy(data: bytes, sequence: int) -> bytes:
+        return COPY.pack(sequence, len(data), zlib.crc32(data)) + data
+
+    def _new_slot(self, data: bytes, sequence: int) -> bytes:
+        """
+        Returns:
+            A whole slot with room to spare, holding data as its first copy and an unwritten second copy.
+        """
+        half = COPY.size + max(self.min_slot, int(len(data) * self.slack))
+        copy = self._copy(data, sequence)
+        return copy + b'\x00' * (2 * half - len(copy))
+
+    def _save(self, user: str, data: bytes) -> None:
+        """
+        Writes an encoded record over the older copy in the user's slot, moving it to a new slot if it doesn't fit.
+        Caller holds the lock.
+        """
+        slot = self.index.get(user)
+        sequence = 1
+        if slot is not None:
+            copy, sequence, _ = self._read_slot(*slot)
+            sequence += 1
+            half = slot[1] // 2
+            if len(data) <= half - COPY.size:
+                self._pwrite(self._copy(data, sequence), slot[0] + (1 - copy) * half)
+                return
+
+        new_slot = self._new_slot(data, sequence)
+        capacity = len(new_slot)
+        offset = self._end
+        self.index[user] = (offset, capacity)
+        if slot is not None:
+            self._live -= slot[1]
+        self._live += capacity
+        index = self._encode_index()
+        index_offset = offset + capacity
+        self._pwrite(new_slot + index + FOOTER.pack(index_offset, len(index), FOOTER_MAGIC), offset)
+        self._end = index_offset + len(index) + FOOTER.size
+
+        # Garbage is old slots plus old indexes, clean it up once it outweighs the live data
+        if self._end - self._live > max(self._live, 1 << 20):
+            self._compact()
+
+    def _pwrite(self, data: bytes, offset: int) -> None:
+        os.pwrite(self._file.fileno(), data, offset)
+        if instrument.ENABLED:
+            instrument.count('bytes_written', len(data))
+
+    def flush(self) -> None:
+        """
+        Forces everything written so far onto disk.
+        """
+        with self._lock:
+            os.fsync(self._file.fileno())
+
+    def _compact(self) -> None:
+        """
+        Copies every live slot into a fresh file and swaps it in. Caller holds the lock.
+        """
+        self._remap()
+        self._rewrite((name, self._map[offset:offset + capacity]) for name, (offset, capacity) in self.index.items())
+
+    def _rewrite(self, slots: Iterable[Tuple[str, bytes]]) -> None:
+        """
+        Writes the given slots into a fresh file, swaps it in and reopens it. Caller holds the lock.
+        """
+        tmp_path = self.path + '.tmp'
+        new_index = {}
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER)
+            offset = len(HEADER)
+            for name, slot in slots:
+                f.write(slot)
+                new_index[name] = (offset, len(slot))
+                offset += len(slot)
+            self.index = new_index
+            index = self._encode_index()
+            f.write(index + FOOTER.pack(offset, len(index), FOOTER_MAGIC))
+            if instrument.ENABLED:
+                instrument.count('bytes_written', f.tell())
+            f.flush()
+            os.fsync(f.fileno())
+        self._map.close()
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._open()
+
+    def compact(self) -> None:
+        """
+        Rewrites the file without the garbage left by relocated slots.
+        """
+        with self._lock:
+            self._compact()
+
+    def close(self) -> None:
+        with self._lock:
+            self._map.close()
+            self._file.close()
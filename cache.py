@@ -0,0 +1,289 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import instrument
+from history import History, date_index
+from storage import Storage, apply_writes
+
+
+class _Entry:
+    __slots__ = ('record', 'loaded_at', 'histories', 'weight_index')
+
+    def __init__(self, loaded_at: float):
+        # Read from the backend the first time something needs it, a graph only needs the history
+        self.record: Optional[Dict] = None
+        self.loaded_at = loaded_at
+        # Column histories from the backend's get_history, dropped when a write touches them
+        self.histories = {}
+        # date_index of the record's weigh-ins, built by the first weigh-in logged through the cache
+        self.weight_index: Optional[Dict[int, int]] = None
+
+
+class CachedStorage(Storage):
+    """
+    Keeps the decoded records of recently used users in memory in front of another backend, so graphs, session
+    generation and logging don't re-read the user from disk (and on the json backend parse every user) each time.
+
+    The cache holds at most max_users records, dropping the least recently used one, and a record is read again once
+    it is older than ttl seconds so changes made by other front-ends sharing the data show up. Writes are applied to
+    the cached record and either passed straight on to the backend (write-through) or, with write_back, held until
+    flush() is called, the record is dropped from the cache, max_pending writes are waiting, or the program exits.
+    Held writes are sent with one Storage.write_batch, so a write-back flush costs one write however many sets were
+    logged.
+
+    Histories come from the backend's own get_history (the json sidecar, one indexed query on sqlite) and are cached
+    next to the record, which is only read once something needs it.
+
+    Reads that need the version counter (load_versioned, so update_user and commit) skip the cache and go to the
+    backend after flushing the user's held writes.
+    """
+    def __init__(self, backend: Storage, max_users: int = 64, ttl: float = 60.0, write_back: bool = False,
+                 max_pending: int = 100):
+        """
+        Args:
+            backend: The storage to cache.
+            max_users: Most user records kept in memory.
+            ttl: Seconds a cached record is trusted before it is read again.
+            write_back: Hold writes until flush instead of writing them straight away.
+            max_pending: Flush once this many writes are held.
+        """
+        self.backend = backend
+        self.path = getattr(backend, 'path', None)
+        self.max_users = max_users
+        self.ttl = ttl
+        self.write_back = write_back
+        self.max_pending = max_pending
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._pending: List[Tuple] = []
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flushes = 0
+        atexit.register(self.flush)
+
+    @property
+    def atomic_batches(self) -> bool:
+        # Held writes only live in memory until the flush
+        return self.write_back or self.backend.atomic_batches
+
+    @classmethod
+    def from_env(cls, backend: Storage) -> Storage:
+        """
+        Wraps a backend as set up by WORKOUT_CACHE_SIZE (records kept, 0 turns the cache off, default 64),
+        WORKOUT_CACHE_TTL (seconds, default 60) and WORKOUT_WRITE_BACK (1 to hold writes until flush).
+
+        Returns:
+            The cached storage, or the backend itself if the cache is off.
+        """
+        size = int(os.environ.get('WORKOUT_CACHE_SIZE', '64'))
+        if size <= 0:
+            return backend
+        return cls(backend, size, float(os.environ.get('WORKOUT_CACHE_TTL', '60')),
+                   os.environ.get('WORKOUT_WRITE_BACK', '') not in ('', '0'))
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            The hit, miss, eviction and flush counters, and how many records and writes are held.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'flushes': self.flushes,
+                    'cached': len(self._entries), 'pending': len(self._pending)}
+
+    def _count(self, name: str) -> None:
+        setattr(self, name, getattr(self, name) + 1)
+        if instrument.ENABLED:
+            instrument.count(f'cache_{name}')
+
+    def _entry(self, user: str) -> _Entry:
+        """
+        Returns the user's cache entry, starting an empty one if there is none or it expired. Caller holds the lock.
+        """
+        now = time.monotonic()
+        entry = self._entries.get(user)
+        if entry is not None and now - entry.loaded_at <= self.ttl:
+            self._entries.move_to_end(user)
+            return entry
+        if entry is not None:
+            # Expired, held writes have to reach the backend before it is read again
+            self._drop(user)
+        entry = self._entries[user] = _Entry(now)
+        while len(self._entries) > self.max_users:
+            self._drop(next(iter(self._entries)))
+            self._count('evictions')
+        return entry
+
+    def _record(self, user: str) -> Dict:
+        """
+        Returns the user's cached record, reading it from the backend on a miss. Caller holds the lock.
+        """
+        entry = self._entry(user)
+        if entry.record is not None:
+            self._count('hits')
+            return entry.record
+        self._count('misses')
+        try:
+            entry.record = self.backend.load_user(user)
+        except KeyError:
+            self._entries.pop(user, None)
+            raise
+        return entry.record
+
+    def _drop(self, user: str) -> None:
+        """
+        Removes a user from the cache, flushing first if they have held writes. Caller holds the lock.
+        """
+        self._flush_user(user)
+        self._entries.pop(user, None)
+
+    def flush(self) -> None:
+        """
+        Sends every held write to the backend, then flushes the backend too if it holds writes back itself (the
+        journal's batched fsyncs).
+        """
+        with self._lock:
+            self._flush_pending()
+            flush = getattr(self.backend, 'flush', None)
+            if flush is not None:
+                flush()
+
+    def _flush_pending(self) -> None:
+        # Only the held writes, for reads that need them in the backend but not necessarily on disk. Caller holds
+        # the lock.
+        if self._pending:
+            self.backend.write_batch(self._pending)
+            self._pending = []
+            self._count('flushes')
+
+    def _flush_user(self, user: str) -> None:
+        # Everything goes in the one batch, holding some users' writes back wouldn't save anything
+        if any(op[1] == user for op in self._pending):
+            self._flush_pending()
+
+    def users(self) -> List[str]:
+        with self._lock:
+            self._flush_pending()
+            return self.backend.users()
+
+    def has_user(self, user: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(user)
+            if entry is not None and entry.record is not None:
+                return True
+            return self.backend.has_user(user)
+
+    def load_user(self, user: str) -> Dict:
+        with self._lock:
+            # A copy, callers are allowed to change what they get back
+            return json.loads(json.dumps(self._record(user)))
+
+    def load_users(self, users: List[str]) -> Iterator[Tuple[str, Dict]]:
+        with self._lock:
+            self._flush_pending()
+        return self.backend.load_users(users)
+
+    def all_records(self) -> Iterator[Tuple[str, Dict]]:
+        with self._lock:
+            self._flush_pending()
+        return self.backend.all_records()
+
+    def get_planner(self, user: str) -> Dict[str, List[str]]:
+        with self._lock:
+            return {day: list(groups) for day, groups in self._record(user).get('planner', {}).items()}
+
+    def get_points(self, user: str, tag: str, focus: str) -> Tuple[List, List]:
+        with self._lock:
+            target_data = self._record(user).get(tag, {})
+            return list(target_data.get('dates', [])), list(target_data.get(focus, []))
+
+    def get_history(self, user: str, tag: str) -> History:
+        with self._lock:
+            entry = self._entry(user)
+            history = entry.histories.get(tag)
+            if history is not None:
+                self._count('hits')
+                return history
+            self._count('misses')
+            if any(op[1] == user for op in self._pending):
+                # The backend hasn't seen the held writes yet, the record has them
+                history = History.from_lists(entry.record.get(tag, {}))
+            else:
+                history = self.backend.get_history(user, tag)
+            entry.histories[tag] = history
+            return history
+
+    def save_user(self, user: str, record: Dict) -> None:
+        with self._lock:
+            self._flush_user(user)
+            self.backend.save_user(user, record)
+            self._entries.pop(user, None)
+
+    def create_user(self, user: str, record: Dict) -> None:
+        with self._lock:
+            self.backend.create_user(user, record)
+            self._entries.pop(user, None)
+
+    def load_versioned(self, user: str) -> Tuple[Dict, int]:
+        with self._lock:
+            self._flush_user(user)
+            return self.backend.load_versioned(user)
+
+    def commit(self, user: str, record: Dict, version: int) -> bool:
+        with self._lock:
+            self._flush_user(user)
+            self._entries.pop(user, None)
+            return self.backend.commit(user, record, version)
+
+    def commit_many(self, changes: List[Tuple[str, Dict, int]]) -> List[str]:
+        with self._lock:
+            self._flush_pending()
+            for user, _, _ in changes:
+                self._entries.pop(user, None)
+            return self.backend.commit_many(changes)
+
+    def append_sets(self, user: str, rows: List[Tuple[str, Dict[str, Any]]]) -> None:
+        self.write_batch([('sets', user, rows)])
+
+    def log_weight(self, user: str, date, weight: int) -> None:
+        self.write_batch([('weight', user, date, weight)])
+
+    def write_batch(self, ops: List[Tuple]) -> None:
+        with self._lock:
+            if self.write_back:
+                # Read everyone first so an unknown user fails the batch before anything is held
+                entries = {}
+                for op in ops:
+                    self._record(op[1])
+                    entries[op[1]] = self._entries[op[1]]
+                self._pending.extend(ops)
+            else:
+                self.backend.write_batch(ops)
+                entries = {op[1]: self._entries[op[1]] for op in ops if op[1] in self._entries}
+            for user, entry in entries.items():
+                user_ops = [op for op in ops if op[1] == user]
+                if entry.record is not None:
+                    if entry.weight_index is None and any(op[0] == 'weight' for op in user_ops):
+                        entry.weight_index = date_index(entry.record['weight']['dates'])
+                    apply_writes(entry.record, user_ops, entry.weight_index)
+                for op in user_ops:
+                    if op[0] == 'sets':
+                        for workout_id, _ in op[2]:
+                            entry.histories.pop(workout_id, None)
+                    else:
+                        entry.histories.pop('weight', None)
+            if len(self._pending) >= self.max_pending:
+                self._flush_pending()
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            # The backend is closed below, there is nothing left for the exit flush to do
+            atexit.unregister(self.flush)
+            self._entries.clear()
+            self.backend.close()
@@ -0,0 +1,132 @@
+import os
+from typing import Dict, List, Optional
+
+import instrument
+
+
+class WorkoutCatalog:
+    """
+    Holds workouts.json in memory with lookup indexes so processing functions don't have to re-read and scan the
+    file on every call. The file is only parsed again when its modification time changes.
+    """
+    def __init__(self, path: str = 'workouts.json'):
+        """
+        Sets up an empty catalog, the file is loaded on first use
+
+        Args:
+            path: Location of the workouts file.
+        """
+        self.path = path
+        self._mtime = None
+        self.records = {}
+        self.name_to_id = {}
+        self.by_group = {}
+        self.by_type = {}
+        self.names = []
+
+    def refresh(self) -> None:
+        """
+        Reloads the file and rebuilds the indexes if it has changed since it was last read.
+        """
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+
+        with open(self.path, 'r') as f:
+            workouts = instrument.load_json(f)
+
+        name_to_id = {}
+        by_group = {}
+        by_type = {}
+        names = []
+        for workout_id, record in workouts.items():
+            name = record['name']
+            names.append(name)
+            name_to_id[name] = workout_id
+            by_group.setdefault(record['group'], []).append(name)
+            by_type.setdefault(record['type'], []).append(name)
+
+        self.records = workouts
+        self.name_to_id = name_to_id
+        self.by_group = by_group
+        self.by_type = by_type
+        self.names = names
+        self._mtime = mtime
+
+    def ids(self) -> List[str]:
+        """
+        Returns:
+            All workout ids in file order.
+        """
+        self.refresh()
+        return list(self.records)
+
+    def get(self, workout_id: str) -> Optional[Dict]:
+        """
+        Args:
+            workout_id: The workout id (e.g. 'benchPress').
+
+        Returns:
+            The workout record, or None if there is no workout with that id.
+        """
+        self.refresh()
+        return self.records.get(workout_id)
+
+    def id_for(self, name: str) -> Optional[str]:
+        """
+        Args:
+            name: The display name of the workout (e.g. 'Bench Press').
+
+        Returns:
+            The workout id, or None if the name isn't in the catalog.
+        """
+        self.refresh()
+        return self.name_to_id.get(name)
+
+    def record_for(self, name: str) -> Optional[Dict]:
+        """
+        Args:
+            name: The display name of the workout.
+
+        Returns:
+            The workout record, or None if the name isn't in the catalog.
+        """
+        self.refresh()
+        workout_id = self.name_to_id.get(name)
+        if workout_id is None:
+            return None
+        return self.records[workout_id]
+
+    def group(self, group: str) -> List[str]:
+        """
+        Args:
+            group: The muscle group (e.g. 'Chest').
+
+        Returns:
+            The names of all workouts in that group.
+        """
+        self.refresh()
+        return self.by_group.get(group, [])
+
+    def of_type(self, workout_type: str) -> List[str]:
+        """
+        Args:
+            workout_type: The workout type (e.g. 'Weighted').
+
+        Returns:
+            The names of all workouts of that type.
+        """
+        self.refresh()
+        return self.by_type.get(workout_type, [])
+
+    def all_names(self) -> List[str]:
+        """
+        Returns:
+            The names of every workout in file order.
+        """
+        self.refresh()
+        return self.names
+
+
+# The one catalog every module looks workouts up in, so workouts.json is parsed once and re-read only when it changes
+catalog = WorkoutCatalog()
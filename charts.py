@@ -0,0 +1,142 @@
+import datetime
+from array import array
+from typing import Optional, Sequence
+
+from PyQt6.QtWidgets import QVBoxLayout, QWidget
+
+
+def format_ordinal(value: float, position: int) -> str:
+    """
+    Tick formatter for graphs whose x values are day ordinals.
+    """
+    return datetime.date.fromordinal(max(1, int(value))).strftime("%m/%d/%Y")
+
+
+class ProgressChart(QWidget):
+    """
+    One graph that lives for the whole session. The figure, canvas and line are made the first time there is data to
+    show (so matplotlib still isn't imported at startup) and after that only the line's data changes.
+
+    Adding a point that fits inside the current axes only redraws the line on top of a saved copy of the background
+    (blitting) instead of redrawing the whole figure.
+    """
+    def __init__(self, title: str, ylabel: str, parent: Optional[QWidget] = None):
+        """
+        Args:
+            title: Graph title.
+            ylabel: Label for the y axis.
+            parent: Parent widget.
+        """
+        super().__init__(parent)
+        self.title = title
+        self.ylabel = ylabel
+        self._layout = QVBoxLayout(self)
+        self.canvas = None
+        self.x = array('i')
+        self.y = array('i')
+        # Which user and series the chart is showing, so callers know when they have to load everything again
+        self.loaded_for = None
+        self._background = None
+
+    def _build(self) -> None:
+        """
+        Makes the figure, canvas and line the first time they are needed.
+        """
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(figsize=(8, 6), dpi=100)
+        self.axes = self.figure.add_subplot(111)
+        self.axes.set_title(self.title)
+        self.axes.set_xlabel('Date')
+        self.axes.set_ylabel(self.ylabel)
+
+        # Formats dates
+        self.axes.xaxis.set_major_formatter(format_ordinal)
+        self.figure.subplots_adjust(bottom=0.2)
+
+        # The line is animated so normal draws leave it out of the saved background
+        (self.line,) = self.axes.plot([], [], animated=True)
+        self.canvas = FigureCanvas(self.figure)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        self._layout.addWidget(self.canvas)
+
+    def _on_draw(self, event) -> None:
+        """
+        After every full draw, save the background and put the line back on top.
+        """
+        self._background = self.canvas.copy_from_bbox(self.axes.bbox)
+        self.axes.draw_artist(self.line)
+
+    def _rescale(self) -> None:
+        """
+        Fits the axes around the data and does a full redraw.
+        """
+        if len(self.x) > 0:
+            left, right = min(self.x), max(self.x)
+            # Leave room on the right so the next few days of entries can be blitted without a rescale
+            self.axes.set_xlim(left - 1, right + max(7, (right - left) // 10))
+            # Adjusting limits of graph
+            self.axes.set_ylim(min(self.y) - 5, max(self.y) + 5)
+        # Rotate labels
+        for tick in self.axes.get_xticklabels():
+            tick.set_rotation(45)
+        self.canvas.draw_idle()
+
+    def set_series(self, x: Sequence[int], y: Sequence[int], title: Optional[str] = None,
+                   loaded_for: Optional[object] = None) -> None:
+        """
+        Swaps in a whole new series, e.g. when another exercise is picked.
+
+        Args:
+            x: Dates as day ordinals.
+            y: The values to plot.
+            title: New title for the graph, keeps the current one if None.
+            loaded_for: Tag for what's being shown, stored in loaded_for.
+        """
+        if self.canvas is None:
+            self._build()
+        self.x = array('i', x)
+        self.y = array('i', y)
+        self.loaded_for = loaded_for
+        if title is not None:
+            self.title = title
+            self.axes.set_title(title)
+        self.line.set_data(self.x, self.y)
+        self._rescale()
+
+    def append_point(self, x: int, y: int) -> None:
+        """
+        Adds one point to the end of the series. A point on the same date as the last one replaces it, like a second
+        weigh-in on the same day does.
+
+        Args:
+            x: Date as a day ordinal.
+            y: The value.
+        """
+        if self.canvas is None:
+            self.set_series([x], [y], loaded_for=self.loaded_for)
+            return
+        if len(self.x) > 0 and self.x[-1] == x:
+            self.y[-1] = y
+        else:
+            self.x.append(x)
+            self.y.append(y)
+        self.line.set_data(self.x, self.y)
+
+        left, right = self.axes.get_xlim()
+        bottom, top = self.axes.get_ylim()
+        if self._background is None or not (left <= x <= right and bottom <= y <= top):
+            self._rescale()
+            return
+        self.canvas.restore_region(self._background)
+        self.axes.draw_artist(self.line)
+        self.canvas.blit(self.axes.bbox)
+
+    def clear(self) -> None:
+        """
+        Empties the graph, used when another user logs in.
+        """
+        self.loaded_for = None
+        if self.canvas is not None:
+            self.set_series([], [])
@@ -0,0 +1,160 @@
+"""
+Test client for server.py. Sends one request and prints the JSON reply:
+
+    python client.py POST /login username=alice password=secret
+    python client.py GET /points user=alice tag=weight focus=weight
+    python client.py POST /sets user=alice 'entries={"Bench Press": "01/02/2024,135,5,3,felt good"}'
+
+Values that parse as JSON are sent as JSON, everything else as a string. Use --unix to talk to a server on a Unix
+socket.
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import socket
+import sys
+import urllib.parse
+from typing import Any, Dict, Optional, Tuple
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path: str):
+        super().__init__('localhost')
+        self.unix_path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.unix_path)
+
+
+def _target(method: str, path: str, params: Dict[str, Any]) -> Tuple[str, Optional[bytes]]:
+    if method == 'GET':
+        query = urllib.parse.urlencode(params)
+        return (f'{path}?{query}' if query else path), None
+    return path, json.dumps(params).encode('utf-8')
+
+
+class Client:
+    """
+    Blocking client that keeps one connection open to the server.
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, unix: Optional[str] = None):
+        """
+        Args:
+            host: Server address.
+            port: Server port.
+            unix: Unix socket path, used instead of host and port if given.
+        """
+        if unix is not None:
+            self.conn = _UnixConnection(unix)
+        else:
+            self.conn = http.client.HTTPConnection(host, port)
+
+    def request(self, method: str, path: str, **params: Any) -> Tuple[int, Any]:
+        """
+        Args:
+            method: 'GET' or 'POST'.
+            path: The endpoint, e.g. '/login'.
+            **params: The endpoint's parameters.
+
+        Returns:
+            The status code and the decoded JSON reply (text for /metrics).
+        """
+        target, body = _target(method, path, params)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        self.conn.request(method, target, body=body, headers=headers)
+        response = self.conn.getresponse()
+        return response.status, _decode(response.getheader('Content-Type', ''), response.read())
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class AsyncClient:
+    """
+    asyncio client that keeps one connection open, requests on it are sent one after another.
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, unix: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.unix = unix
+        self.reader = None
+        self.writer = None
+
+    async def connect(self) -> None:
+        if self.unix is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.unix)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method: str, path: str, **params: Any) -> Tuple[int, Any]:
+        """
+        Same as Client.request.
+        """
+        if self.writer is None:
+            await self.connect()
+        target, body = _target(method, path, params)
+        body = body or b''
+        self.writer.write(f'{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n'
+                          .encode('latin-1') + body)
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        content_type = ''
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+            elif name.strip().lower() == 'content-type':
+                content_type = value.strip()
+        return status, _decode(content_type, await self.reader.readexactly(length))
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.writer = None
+
+
+def _decode(content_type: str, data: bytes) -> Any:
+    # Everything but /metrics is JSON
+    if content_type.startswith('text/plain'):
+        return data.decode('utf-8')
+    return json.loads(data)
+
+
+def _value(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('method', choices=['GET', 'POST'])
+    parser.add_argument('path')
+    parser.add_argument('params', nargs='*', help='key=value pairs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None)
+    args = parser.parse_args(argv)
+
+    params = {}
+    for pair in args.params:
+        key, _, value = pair.partition('=')
+        params[key] = _value(value) if args.method == 'POST' else value
+    client = Client(args.host, args.port, args.unix)
+    try:
+        status, reply = client.request(args.method, args.path, **params)
+    finally:
+        client.close()
+    print(status, reply if isinstance(reply, str) else json.dumps(reply))
+    return 0 if status == 200 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
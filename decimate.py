@@ -0,0 +1,87 @@
+from array import array
+from typing import Sequence, Tuple
+
+
+def lttb(x: Sequence[int], y: Sequence[int], threshold: int) -> Tuple[array, array]:
+    """
+    Largest-triangle-three-buckets downsampling. Keeps the first and last points and, from each of threshold - 2
+    buckets in between, the point that makes the biggest triangle with the point kept before it and the average of
+    the next bucket. The shape of the line survives even when most points are dropped.
+
+    Args:
+        x: Dates as day ordinals, in order.
+        y: The values.
+        threshold: How many points to keep.
+
+    Returns:
+        The kept x and y values.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return array('i', x), array('i', y)
+
+    out_x = array('i', [x[0]])
+    out_y = array('i', [y[0]])
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        count = next_end - next_start
+        avg_x = sum(x[next_start:next_end]) / count
+        avg_y = sum(y[next_start:next_end]) / count
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax = x[a]
+        ay = y[a]
+        best = start
+        best_area = -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (y[j] - ay) - (ax - x[j]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        out_x.append(x[best])
+        out_y.append(y[best])
+        a = best
+
+    out_x.append(x[n - 1])
+    out_y.append(y[n - 1])
+    return out_x, out_y
+
+
+def min_max(x: Sequence[int], y: Sequence[int], buckets: int) -> Tuple[array, array]:
+    """
+    Min/max decimation. Splits the series into buckets and keeps each bucket's lowest and highest point (in date
+    order), so no spike disappears from the graph.
+
+    Args:
+        x: Dates as day ordinals, in order.
+        y: The values.
+        buckets: How many buckets, the result has at most twice this many points.
+
+    Returns:
+        The kept x and y values.
+    """
+    n = len(x)
+    if buckets < 1 or 2 * buckets >= n:
+        return array('i', x), array('i', y)
+
+    out_x = array('i')
+    out_y = array('i')
+    size = n / buckets
+    for i in range(buckets):
+        start = int(i * size)
+        end = int((i + 1) * size)
+        low = high = start
+        for j in range(start + 1, end):
+            if y[j] < y[low]:
+                low = j
+            elif y[j] > y[high]:
+                high = j
+        for j in sorted({low, high}):
+            out_x.append(x[j])
+            out_y.append(y[j])
+    return out_x, out_y
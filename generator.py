@@ -0,0 +1,148 @@
+import datetime
+import heapq
+import random
+from typing import Dict, List, Optional
+
+from catalog import WorkoutCatalog
+from history import to_ordinal
+from storage import Storage
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Days since an exercise was last done after which it counts as fully rested, and the weight given to ones never done
+RESTED_DAYS = 28
+
+
+class WorkoutGenerator:
+    """
+    Picks the exercises for a day's session from the user's planner.
+
+    Candidate pools for every muscle group are built once from the catalog (and again only after the catalog has
+    reloaded workouts.json). Each user's planner is resolved to a weekday -> groups table and their last-performed
+    date for every exercise is indexed the first time they generate a session, after that generating only touches
+    memory. Sets saved through processing.py are fed back with record_set so the index stays current.
+
+    Exercises are sampled without replacement, weighted by how many days it has been since they were last done, so
+    the ones that haven't been done in a while come up more often.
+    """
+    def __init__(self, storage: Storage, workouts: WorkoutCatalog, seed: Optional[int] = None):
+        """
+        Args:
+            storage: Where planners and histories are read from on a user's first session.
+            workouts: The workout catalog the pools are built from.
+            seed: Seed for the random number generator, for repeatable sessions.
+        """
+        self.storage = storage
+        self.workouts = workouts
+        self.rng = random.Random(seed)
+        self._records = None
+        self.pools: Dict[str, List[str]] = {}
+        self.plans: Dict[str, List[List[str]]] = {}
+        self.last_done: Dict[str, Dict[str, int]] = {}
+
+    def seed(self, seed: Optional[int]) -> None:
+        """
+        Re-seeds the random number generator.
+        """
+        self.rng.seed(seed)
+
+    def use_storage(self, storage: Storage) -> None:
+        """
+        Switches to another storage and drops every user's cached plan and index.
+        """
+        self.storage = storage
+        self.plans.clear()
+        self.last_done.clear()
+
+    def forget(self, user: str) -> None:
+        """
+        Drops a user's cached plan and index, e.g. after their planner changed.
+        """
+        self.plans.pop(user, None)
+        self.last_done.pop(user, None)
+
+    def _pools(self) -> Dict[str, List[str]]:
+        if self._records is None:
+            self.workouts.refresh()
+        # The catalog swaps in a new records dict when it reloads the file, so this notices without touching disk
+        if self.workouts.records is not self._records:
+            pools = {}
+            for workout_id, record in self.workouts.records.items():
+                pools.setdefault(record['group'], []).append(workout_id)
+            self.pools = pools
+            self._records = self.workouts.records
+        return self.pools
+
+    def _load_user(self, user: str) -> None:
+        record = self.storage.load_user(user)
+        planner = record.get('planner', {})
+        self.plans[user] = [list(planner.get(day, [])) for day in WEEKDAYS]
+        last_done = {}
+        for workout_id, lists in record.items():
+            if workout_id in ('info', 'planner', 'weight') or not isinstance(lists, dict) or not lists.get('dates'):
+                continue
+            last_done[workout_id] = max(to_ordinal(date) for date in lists['dates'])
+        self.last_done[user] = last_done
+
+    def plan(self, user: str) -> List[List[str]]:
+        """
+        Args:
+            user: The username of the user.
+
+        Returns:
+            The muscle groups planned for each weekday, Monday first.
+        """
+        if user not in self.plans:
+            self._load_user(user)
+        return self.plans[user]
+
+    def record_set(self, user: str, workout_id: str, ordinal: int) -> None:
+        """
+        Notes that a user did an exercise, so it is less likely to come up again right away.
+
+        Args:
+            user: The username of the user.
+            workout_id: The exercise.
+            ordinal: The date it was done, as a day ordinal.
+        """
+        last_done = self.last_done.get(user)
+        # Users without an index yet will read the set from storage when they get one
+        if last_done is not None and ordinal > last_done.get(workout_id, 0):
+            last_done[workout_id] = ordinal
+
+    def generate(self, user: str, day: str, per_group: int = 3, today: Optional[int] = None) -> List[str]:
+        """
+        Picks a session for one day.
+
+        Args:
+            user: The username of the user.
+            day: The day of the week (e.g. 'Monday').
+            per_group: How many exercises to pick from each muscle group planned that day.
+            today: Day ordinal the recency weights are measured from, defaults to today.
+
+        Returns:
+            The names of the picked exercises, group by group in planner order, or an empty list if nothing is planned.
+        """
+        if day not in WEEKDAYS:
+            return []
+        groups = self.plan(user)[WEEKDAYS.index(day)]
+        if not groups:
+            return []
+        pools = self._pools()
+        last_done = self.last_done[user]
+        if today is None:
+            today = datetime.date.today().toordinal()
+
+        picked = []
+        for group in groups:
+            pool = pools.get(group, [])
+            # Weighted sampling without replacement (Efraimidis-Spirakis): each exercise gets the key u ** (1 / w)
+            # and the largest keys win
+            keys = []
+            for workout_id in pool:
+                days = today - last_done[workout_id] if workout_id in last_done else RESTED_DAYS
+                weight = min(max(days, 0), RESTED_DAYS) + 1
+                keys.append((self.rng.random() ** (1 / weight), workout_id))
+            for _, workout_id in heapq.nlargest(per_group, keys):
+                picked.append(self.workouts.records[workout_id]['name'])
+        return picked
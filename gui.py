@@ -2,12 +2,24 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 from processing import *
+from workers import IOExecutor
+from charts import ProgressChart
+from instrument import timed_slot
 import datetime
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.dates import DateFormatter
-from matplotlib.figure import Figure
+import logging
 
+log = logging.getLogger(__name__)
+
+# Views on the goal page, label to (period, field) for get_rollup, None means every logged set
+GOAL_VIEWS = {
+    'Every set': None,
+    'Heaviest set per week': ('week', 'max_weight'),
+    'Estimated 1RM per week': ('week', 'e1rm'),
+    'Volume per week': ('week', 'volume'),
+    'Heaviest set per month': ('month', 'max_weight'),
+    'Estimated 1RM per month': ('month', 'e1rm'),
+    'Volume per month': ('month', 'volume'),
+}
 
 class MainWindow(QMainWindow):
     """
@@ -20,13 +32,15 @@ class MainWindow(QMainWindow):
         """
 
         super().__init__()
-        self.goal_graph_layout = QVBoxLayout()
         self.setWindowTitle("Workout planner")
         self.setFixedSize(1400, 1000)
 
         self.active_user = 'test'
         self.goal_selected = 'test'
 
+        # Runs processing calls on a background thread so file reads and writes don't freeze the window
+        self.io = IOExecutor(self)
+
         # Top Bar
         self._createMenuBar()
 
@@ -51,6 +65,34 @@ class MainWindow(QMainWindow):
         self._new_user_screen()
         self._goal_screen()
 
+        self.io.pending_changed.connect(self.on_pending_changed)
+
+    def closeEvent(self, event):
+        """
+        Lets any queued saves finish before the window closes
+        """
+        self.io.wait()
+        flush_writes()
+        super().closeEvent(event)
+
+    @timed_slot
+    def on_pending_changed(self, pending):
+        """
+        Shows whether there is still work being saved or loaded in the background
+        """
+        if pending > 0:
+            self.label_status.setText('Saving...')
+        else:
+            self.label_status.setText('All changes saved')
+
+    @timed_slot
+    def on_io_error(self, message):
+        """
+        Shows errors from background work instead of losing them on the worker thread
+        """
+        log.error('background task failed', extra={'fields': {'error': message}})
+        self.label_status.setText(f'Something went wrong: {message}')
+
     def _createMenuBar(self):
         """
         Creates a menu bar with file, edit, and help #Note No use for those functions yet
@@ -140,13 +182,14 @@ class MainWindow(QMainWindow):
         goal_button.setFixedWidth(75)
         goal_button.setStyleSheet('border: none; background-color: gray;')
 
-        print(self.active_user, 'in homescreen')
         # Welcome Label for user
         self.label_welcome = QLabel()
+        # Pending / saved state of background work
+        self.label_status = QLabel('')
 
         # Log out button
         logout_button = QPushButton("Logout")
-        logout_button.clicked.connect(lambda: self.stacked_widget.setCurrentIndex(0))
+        logout_button.clicked.connect(self.logout)
         logout_button.setFixedWidth(75)
 
         # Placing all navigation functions into the layout
@@ -156,6 +199,7 @@ class MainWindow(QMainWindow):
         navLayout.addStretch()
         navLayout.addWidget(self.label_welcome)
         navLayout.addStretch()
+        navLayout.addWidget(self.label_status)
         navLayout.addWidget(logout_button)
 
         # Workout Recommendations ----------------------------------------------------------
@@ -176,6 +220,10 @@ class MainWindow(QMainWindow):
         weigh_in_layout.addWidget(gen_weight_button)
         self.weigh_in_full_layout.addLayout(weigh_in_layout)
 
+        # One graph for the whole session, weigh-ins are added to it as they come in
+        self.weight_chart = ProgressChart('Weight Overtime', 'Weight')
+        self.weigh_in_full_layout.addWidget(self.weight_chart)
+
         # Main screen setting all layouts in place and in order
         mainLayout = QVBoxLayout()
         mainLayout.addWidget(gen_workout_button)
@@ -262,7 +310,7 @@ class MainWindow(QMainWindow):
 
         # Log out button
         logout_button = QPushButton("Logout")
-        logout_button.clicked.connect(lambda: self.stacked_widget.setCurrentIndex(0))
+        logout_button.clicked.connect(self.logout)
         logout_button.setFixedWidth(75)
 
         # Puts all the elements in the nav layout
@@ -279,16 +327,27 @@ class MainWindow(QMainWindow):
         self.goals_combo = QComboBox(self)
         # Pulls all workouts from file
         workout_list = pull_workouts()
-        print(workout_list)
+        log.debug('workouts loaded', extra={'fields': {'count': len(workout_list)}})
         # Adds all workouts to the combobox and connects them to the on selection changed function
         self.goals_combo.addItems(workout_list)
         self.goals_combo.currentTextChanged.connect(self.on_selection_changed)
 
+        # Picks between raw sets and the daily/weekly/monthly rollups
+        self.goals_view_combo = QComboBox(self)
+        self.goals_view_combo.addItems(list(GOAL_VIEWS))
+        self.goals_view_combo.currentTextChanged.connect(
+            lambda _: self.on_selection_changed(self.goals_combo.currentText()))
+
         self.goal_graph_label = QLabel('')
 
+        # One graph for the goal page, picking another exercise swaps its data
+        self.goal_chart = ProgressChart('Progress', 'Weight')
+
         self.goals_layout.addWidget(goals_label)
         self.goals_layout.addWidget(self.goals_combo)
+        self.goals_layout.addWidget(self.goals_view_combo)
         self.goals_layout.addWidget(self.goal_graph_label)
+        self.goals_layout.addWidget(self.goal_chart)
 
 
         # Main screen
@@ -302,6 +361,7 @@ class MainWindow(QMainWindow):
         outerLayout.addLayout(mainLayout)
         self.setLayout(outerLayout)
 
+    @timed_slot
     def login(self):
         """
         Handles the user login by validating them, then sends user to the home-screen.
@@ -310,13 +370,22 @@ class MainWindow(QMainWindow):
         """
         username = self.entry_username.text()
         password = self.entry_password.text()
-        # lambda: self.stacked_widget.setCurrentIndex(1)
-        login_check = run_login(username, password)
+        self.label_error.setText('Logging in...')
+        self.io.submit(run_login, username, password, key='login',
+                       on_done=lambda login_check: self._login_finished(username, login_check),
+                       on_error=self.label_error.setText)
 
+    @timed_slot
+    def _login_finished(self, username, login_check):
+        """
+        Moves to the home screen once run_login has come back from the background thread
+        """
         if login_check[0]:
             self.stacked_widget.setCurrentIndex(1)
+            if username != self.active_user:
+                self.weight_chart.clear()
+                self.goal_chart.clear()
             self.active_user = username
-            print(self.active_user)
             self.label_welcome.setText(f'Welcome {self.active_user}')
             self.entry_username.setText('')
             self.entry_password.setText('')
@@ -332,6 +401,15 @@ class MainWindow(QMainWindow):
             elif login_check[1] == 3:
                 self.label_error.setText('Your username and password do not match')
 
+    @timed_slot
+    def logout(self):
+        """
+        Saves anything still held back for the user, after the saves already queued, and goes back to the login page
+        """
+        self.io.submit(flush_writes, on_error=self.on_io_error)
+        self.stacked_widget.setCurrentIndex(0)
+
+    @timed_slot
     def create_account(self):
         """
         Handles the creation of the new users account, will check to see if that user already exists
@@ -340,11 +418,16 @@ class MainWindow(QMainWindow):
         :return:
         """
         username = self.entry_new_username.text()
-        print(username)
         password = self.entry_new_password.text()
-        print(password)
 
-        account_check = run_account_create(username, password)
+        self.io.submit(run_account_create, username, password, key='create_account',
+                       on_done=self._account_created, on_error=self.label_error_new.setText)
+
+    @timed_slot
+    def _account_created(self, account_check):
+        """
+        Goes back to the login screen once run_account_create has come back from the background thread
+        """
         if account_check[0]:
             self.stacked_widget.setCurrentIndex(0)
         else:
@@ -355,11 +438,28 @@ class MainWindow(QMainWindow):
             else:
                 self.label_error_new.setText('That username is taken, please pick another.')
 
+    @timed_slot
     def gen_workout(self):
         '''
         Generates a workout plan based on the day of the weak
 
-        also auto clears old information every click
+        The picking happens on the background thread, the old rows are cleared once the new plan is ready
+        :return:
+        '''
+        # Get today's weekday to find what workouts you are doing.
+        today = datetime.date.today()
+        str_weekday = today.strftime("%A")
+
+        def plan(day, user):
+            return [(workout, get_attributes(workout)) for workout in pick_workout(day, user)]
+
+        self.io.submit(plan, str_weekday, self.active_user, key='gen_workout', on_done=self._show_workout,
+                       on_error=self.on_io_error)
+
+    @timed_slot
+    def _show_workout(self, workout_plan):
+        '''
+        Builds the rows for a generated workout, also auto clears old information every click
         :return:
         '''
         try:
@@ -371,7 +471,7 @@ class MainWindow(QMainWindow):
             self.workout_layout.removeItem(self.add_workout_button)
 
         except:
-            print('Error clearing previous widgets')
+            log.debug('no previous workout widgets to clear')
             pass
 
         for i in reversed(range(self.workout_rows.count())):
@@ -380,23 +480,16 @@ class MainWindow(QMainWindow):
         for i in reversed(range(self.workout_layout.count())):
             self.workout_layout.itemAt(i).widget().deleteLater()
 
-        # Get today's weekday to find what workouts you are doing.
-        today = datetime.date.today()
-        str_weekday = today.strftime("%A")
-
         # Generating new widgets
         self.workout_rows = QFormLayout()
 
-        workout_list = pick_workout(str_weekday, self.active_user)
-
         # the dictionary made below allows us to take the inputs from the generated line edits.
         self.line_edits = {}
-        for workout in workout_list:
+        for workout, attributes in workout_plan:
             line_edit = QLineEdit()
             self.workout_rows.addRow(f'{workout}', line_edit)
             self.line_edits[workout] = line_edit
 
-            attributes = get_attributes(workout)
             self.workout_rows.addRow(
                 QLabel(f"Please add the follow information separating each by a comma in order: {attributes}"))
 
@@ -420,6 +513,7 @@ class MainWindow(QMainWindow):
         self.workout_layout.addWidget(self.workout_submit_button)
         self.workout_layout.addWidget(self.submit_info)
 
+    @timed_slot
     def add_workout(self):
         """
         Adds a new workout to the workout lists and validates input
@@ -438,6 +532,7 @@ class MainWindow(QMainWindow):
         else:
             self.a_w_r.setText('Please input one of the available exercises')
 
+    @timed_slot
     def workout_submit(self):
         """
         Submits the workout data and runs data validation
@@ -445,155 +540,110 @@ class MainWindow(QMainWindow):
         if the data passes the data validation it is saved to file else the user is prompted.
         :return:
         """
-        print('submit')
-        for workout, value in self.line_edits.items():
-            temp_dict = {}
-            temp_dict[workout] = value.text()
-            print('temp_dict', temp_dict)
-            check = check_edits(temp_dict, self.active_user)
-            print(check)
-            if check[0] == True:
-                print('check good')
-                self.submit_info.setText('Data has saved')
-            else:
-                print('check bad')
-                if check[1] == 1:
-                    self.submit_info.setText('You have added to many or to few variables, please match template exactly')
-                elif check[1] == 2:
-                    self.submit_info.setText('One of your dates is not in a valid format, please match something like '
-                                             '12/12/2024')
-                elif check[1] == 3:
-                    self.submit_info.setText('You inputted a non-number for weight')
-                elif check[1] == 4:
-                    self.submit_info.setText('You inputted a non-number for reps')
-                elif check[1] == 5:
-                    self.submit_info.setText('You inputted a non-number for sets')
+        entries = {workout: value.text() for workout, value in self.line_edits.items()}
+        self.submit_info.setText('Saving...')
+        self.io.submit(submit_session, self.active_user, entries, key='workout_submit',
+                       on_done=self._workout_submitted, on_error=self.submit_info.setText)
+
+    @timed_slot
+    def _workout_submitted(self, results):
+        """
+        Shows which rows were saved once submit_session has come back from the background thread
+        """
+        log.info('workout submitted', extra={'fields': {'user': self.active_user, 'results': results}})
+
+        errors = {
+            1: 'You have added to many or to few variables, please match template exactly',
+            2: 'One of your dates is not in a valid format, please match something like 12/12/2024',
+            3: 'You inputted a non-number for weight',
+            4: 'You inputted a non-number for reps',
+            5: 'You inputted a non-number for sets',
+            6: 'That workout is not one of the available exercises',
+        }
+        messages = [f'{workout}: {errors[code]}' for workout, code in results.items() if code != -1]
+        if messages:
+            self.submit_info.setText('\n'.join(messages))
+        else:
+            self.submit_info.setText('Data has saved')
 
+    @timed_slot
     def gen_weigh_in(self):
         """
         Logs the user's weight and generates a graph of user's weight progression
 
-        Uses matPlotLib
+        Uses matPlotLib, the weight is saved and the points are loaded on the background thread
         :return:
         """
-        try:
-            # Try top remove old graph if any.
-            self.weigh_in_full_layout.removeItem(self.graph_layout)
-            self.graph_layout.deleteLater()
-        except:
-            print('Could not remove graph')
-
         # Input weight value into file
         new_weight = self.weigh_entry.text()
         self.weigh_entry.setText('')
-        now = datetime.datetime.now()
-        date = now.strftime("%m/%d/%Y")
-        log_weight(new_weight, date, self.active_user)
-
-        # Generates graph
-        self.graph_layout = QVBoxLayout()
-
-        # Building matPlotLib stuff
-        figure = plt.Figure(figsize=(8, 6), dpi=100)
-        axes = figure.add_subplot(111)
-
-        # Get points from file
-        points = get_points('weight', 'weight',self.active_user)
-        dates = points[0]
-        weights = points[1]
-        weights = [int(x) for x in weights]
-
-        # Convert dates
-        date_objects = [datetime.datetime.strptime(date, "%m/%d/%Y") for date in dates]
-
-        # Plot points
-        axes.plot(date_objects, weights)
-        axes.set_title('Weight Overtime')
-        axes.set_xlabel('Date')
-        axes.set_ylabel('Weight')
-
-        # Formats dates
-        axes.xaxis.set_major_formatter(DateFormatter("%m/%d/%Y"))
-
-        # Rotate labels
-        for tick in axes.get_xticklabels():
-            tick.set_rotation(45)
-
-        figure.subplots_adjust(bottom=0.2)
-
-        # Adjusting limits of graph
-        axes.set_ylim(min(weights) - 5, max(weights) + 5)
-
-        canvas = FigureCanvas(figure)
-        self.graph_layout.addWidget(canvas)
-
-        self.weigh_in_full_layout.addLayout(self.graph_layout)
+        # Dates are stored as day ordinals
+        date = datetime.date.today().toordinal()
+        # The whole history is only loaded the first time, after that the new point is just added to the graph
+        load_all = self.weight_chart.loaded_for != self.active_user
+        # The weight graph never needs more points than it is pixels wide
+        width = self.weight_chart.width()
+
+        def save_and_load(weight, day, user):
+            log_weight(weight, day, user)
+            if load_all:
+                return get_plot_points('weight', 'weight', user, width)
+            return None
+
+        self.io.submit(save_and_load, new_weight, date, self.active_user,
+                       on_done=lambda points: self._draw_weigh_in(date, int(new_weight), points),
+                       on_error=self.on_io_error)
+
+    @timed_slot
+    def _draw_weigh_in(self, day, weight, points):
+        """
+        Updates the weight graph after gen_weigh_in has saved the weight. Either loads the full history into it or
+        just adds the new point.
+        :return:
+        """
+        if points is not None:
+            self.weight_chart.set_series(points[0], points[1], loaded_for=self.active_user)
+        else:
+            self.weight_chart.append_point(day, weight)
 
+    @timed_slot
     def on_selection_changed(self, selected_item):
         """
         Handles the event when a users selects a goal from the combo box. Then generates a graph to show user's
         progression.
 
-        Clears old graph
+        The points are loaded on the background thread, then swapped into the goal graph
         """
         self.goal_selected = selected_item
-        print(self.goal_selected)
-        try:
-            # Try top remove old graph if any.
-            self.goals_layout.removeItem(self.goal_graph_layout)
-            self.goal_graph_layout.deleteLater()
-        except:
-            print('Could not remove graph')
-
-        try:
-            for i in reversed(range(self.goal_graph_layout.count())):
-                self.goal_graph_layout.itemAt(i).widget().deleteLater()
-        except:
-            print('Failed to clear graph')
 
-        self.goal_graph_layout = QVBoxLayout()
+        # Raw points are downsampled to the goal chart's width
+        width = self.goal_chart.width()
+        view = GOAL_VIEWS[self.goals_view_combo.currentText()]
 
-        # Building matPlotLib stuff
-        figure = plt.Figure(figsize=(8, 6), dpi=100)
-        axes = figure.add_subplot(111)
+        def load(name, user):
+            if view is not None:
+                # Rollups are already one point per week or month
+                return get_rollup(get_workout_id(name), user, view[0], view[1])
+            return get_plot_points(get_workout_id(name), 'weight', user, width)
 
-        # Get Workout id
-        workout_id = get_workout_id(self.goal_selected)
+        self.io.submit(load, selected_item, self.active_user, key='goal_graph',
+                       on_done=lambda points: self._draw_goal_graph(selected_item, points),
+                       on_error=self.on_io_error)
 
-        # Get points from file
-        points = get_points(workout_id, 'weight',self.active_user)
+    @timed_slot
+    def _draw_goal_graph(self, selected_item, points):
+        """
+        Draws the progress graph from the points loaded by on_selection_changed
+        """
+        if selected_item != self.goal_selected:
+            # The user has already picked something else, that graph is on its way
+            return
         x = points[0]
         y = points[1]
-        y = [int(x) for x in y]
-        print(y)
 
+        # Swap the new exercise's data into the existing graph
+        self.goal_chart.set_series(x, y, title=f'{self.goal_selected} Progress ({self.goals_view_combo.currentText()})')
         if len(x) > 0 and len(y) > 0:
-            # Convert dates
-            date_objects = [datetime.datetime.strptime(date, "%m/%d/%Y") for date in x]
-
-            # Plot points
-            axes.plot(date_objects, y)
-            axes.set_title(f'{self.goal_selected} Progress')
-            axes.set_xlabel('Date')
-            axes.set_ylabel('Weight')
-
-            # Formats dates
-            axes.xaxis.set_major_formatter(DateFormatter("%m/%d/%Y"))
-
-            # Rotate labels
-            for tick in axes.get_xticklabels():
-                tick.set_rotation(45)
-
-            figure.subplots_adjust(bottom=0.2)
-            # Adjusting limits of graph
-
-            axes.set_ylim(min(y) - 5, max(y) + 5)
-
-            canvas = FigureCanvas(figure)
-            self.goal_graph_layout.addWidget(canvas)
-
-            self.goals_layout.addLayout(self.goal_graph_layout)
+            self.goal_graph_label.setText('')
         else:
             self.goal_graph_label.setText("This exercise doesn't have any data yet")
-            print('made it to here')
-            self.goals_layout.addLayout(self.goal_graph_layout)
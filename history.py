@@ -0,0 +1,310 @@
+import datetime
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import instrument
+
+MAGIC = b'WHS1'
+SIDECAR_MAGIC = b'WHSC'
+DATE_FORMAT = "%m/%d/%Y"
+
+
+@lru_cache(maxsize=8192)
+def parse_date(text: str) -> int:
+    """
+    Parses a date string like '12/12/2024' into a day ordinal. Older data stores dates as strings and the same few
+    hundred days come up over and over, so results are cached.
+
+    Args:
+        text: The date in mm/dd/yyyy format.
+
+    Returns:
+        The day ordinal.
+
+    Raises:
+        ValueError: If it isn't a valid date.
+    """
+    parts = text.split('/')
+    if len(parts) == 3 and all(part.isdigit() for part in parts) and len(parts[2]) == 4:
+        # Same dates strptime accepts for this format, without going through strptime
+        return datetime.date(int(parts[2]), int(parts[0]), int(parts[1])).toordinal()
+    return datetime.datetime.strptime(text, DATE_FORMAT).toordinal()
+
+
+def to_ordinal(value) -> int:
+    """
+    Turns a stored date into a day ordinal (datetime.date.toordinal). New data is stored as ordinals already, older
+    data as strings.
+
+    Args:
+        value: An ordinal already, or a date string like '12/12/2024'.
+
+    Returns:
+        The day ordinal.
+    """
+    if isinstance(value, int):
+        return value
+    if value.isdigit():
+        # An ordinal written out as digits, SQLite hands those back as text
+        return int(value)
+    return parse_date(value)
+
+
+def format_date(value) -> str:
+    """
+    Args:
+        value: A day ordinal or a date string.
+
+    Returns:
+        The date in mm/dd/yyyy format, for showing or exporting.
+    """
+    return datetime.date.fromordinal(to_ordinal(value)).strftime(DATE_FORMAT)
+
+
+def date_index(dates: Iterable) -> Dict[int, int]:
+    """
+    Args:
+        dates: Stored dates, ordinals or strings.
+
+    Returns:
+        Day ordinal to its position in dates, so an entry for a date can be found without a linear search.
+    """
+    return {to_ordinal(date): i for i, date in enumerate(dates)}
+
+
+def _to_int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return int(float(value))
+
+
+def _pad(length: int) -> int:
+    return (4 - length % 4) % 4
+
+
+class History:
+    """
+    Column layout of one workout's (or the weigh-in) history. Dates are day ordinals and every numeric attribute is
+    an int32 column, so graphs can use them directly without converting each point. Notes are interned strings.
+
+    A History read from bytes with from_buffer keeps pointing at that buffer instead of copying it.
+    """
+    def __init__(self, dates: Sequence[int], columns: Dict[str, Sequence[int]], notes: Optional[List[str]] = None,
+                 raw_notes: Optional[memoryview] = None):
+        self.dates = dates
+        self.columns = columns
+        self._notes = notes
+        self._raw_notes = raw_notes
+
+    @classmethod
+    def from_lists(cls, lists: Dict[str, list]) -> 'History':
+        """
+        Builds a history from the parallel lists stored in a user record.
+
+        Args:
+            lists: Attribute name to list of values, e.g. {'dates': [...], 'weight': [...], 'notes': [...]}.
+
+        Returns:
+            The history.
+        """
+        dates = array('i', [to_ordinal(date) for date in lists.get('dates', [])])
+        columns = {}
+        for attribute, values in lists.items():
+            if attribute in ('dates', 'notes'):
+                continue
+            columns[attribute] = array('i', [_to_int(value) for value in values])
+        notes = None
+        if 'notes' in lists:
+            notes = [sys.intern(str(note)) for note in lists['notes']]
+        return cls(dates, columns, notes)
+
+    @property
+    def notes(self) -> List[str]:
+        """
+        Returns:
+            The notes for every entry, decoded the first time they are asked for.
+        """
+        if self._notes is None:
+            if self._raw_notes is None or len(self._raw_notes) == 0:
+                self._notes = [''] * len(self.dates) if self._raw_notes is not None else []
+            else:
+                self._notes = [sys.intern(note) for note in bytes(self._raw_notes).decode('utf-8').split('\x00')]
+        return self._notes
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __getitem__(self, attribute: str) -> Sequence:
+        """
+        Args:
+            attribute: 'dates', 'notes' or one of the numeric attributes.
+
+        Returns:
+            That column, or an empty array if the history doesn't have it.
+        """
+        if attribute == 'dates':
+            return self.dates
+        if attribute == 'notes':
+            return self.notes
+        return self.columns.get(attribute, array('i'))
+
+    def to_bytes(self) -> bytes:
+        """
+        Layout (little-endian):
+            magic 'WHS1', entry count, column count, byte length of the notes (-1 if there are none),
+            each column name as a length-prefixed utf-8 string, padding to 4 bytes,
+            the dates column, each numeric column, and the notes joined with NUL bytes.
+
+        Returns:
+            The history in the binary sidecar layout.
+        """
+        names = list(self.columns)
+        notes = b''
+        notes_length = -1
+        if self._notes is not None or self._raw_notes is not None:
+            notes = '\x00'.join(self.notes).encode('utf-8')
+            notes_length = len(notes)
+        parts = [MAGIC, struct.pack('<IIi', len(self.dates), len(names), notes_length)]
+        header = 16
+        for name in names:
+            encoded = name.encode('utf-8')
+            parts.append(struct.pack('<H', len(encoded)) + encoded)
+            header += 2 + len(encoded)
+        parts.append(b'\x00' * _pad(header))
+        for column in [self.dates] + [self.columns[name] for name in names]:
+            data = array('i', column)
+            if sys.byteorder != 'little':
+                data.byteswap()
+            parts.append(data.tobytes())
+        parts.append(notes)
+        return b''.join(parts)
+
+    @classmethod
+    def from_buffer(cls, buffer) -> 'History':
+        """
+        Reads a history out of bytes written by to_bytes without copying the columns.
+
+        Args:
+            buffer: Anything supporting the buffer protocol, e.g. a slice of a memoryview over an mmap.
+
+        Returns:
+            The history, with columns that are memoryviews into the buffer.
+        """
+        view = memoryview(buffer)
+        if bytes(view[:4]) != MAGIC:
+            raise ValueError('Not a history buffer')
+        count, column_count, notes_length = struct.unpack_from('<IIi', view, 4)
+        offset = 16
+        names = []
+        for _ in range(column_count):
+            (length,) = struct.unpack_from('<H', view, offset)
+            names.append(bytes(view[offset + 2:offset + 2 + length]).decode('utf-8'))
+            offset += 2 + length
+        offset += _pad(offset)
+        size = count * 4
+
+        def column() -> Sequence[int]:
+            nonlocal offset
+            data = view[offset:offset + size]
+            offset += size
+            if sys.byteorder != 'little':
+                swapped = array('i', data.tobytes())
+                swapped.byteswap()
+                return swapped
+            return data.cast('i')
+
+        dates = column()
+        columns = {name: column() for name in names}
+        raw_notes = view[offset:offset + notes_length] if notes_length >= 0 else None
+        return cls(dates, columns, raw_notes=raw_notes)
+
+
+def write_sidecar(path: str, histories: Iterable[Tuple[str, Union[History, memoryview]]], stamp: Tuple[int, int]
+                  ) -> None:
+    """
+    Writes many histories into one file that Sidecar can map back in.
+
+    Layout: magic 'WHSC', the stamp (two int64), index length, then a utf-8 index of
+    'key<TAB>offset<TAB>length' lines, then each history's bytes.
+
+    Args:
+        path: Where to write the sidecar.
+        histories: (key, history) pairs. A history can also be given as the bytes Sidecar.raw returned for it, to
+            copy it over from an older sidecar without decoding it.
+        stamp: Identifies the data the histories were built from, e.g. the source file's (mtime_ns, size).
+    """
+    blobs = []
+    index_lines = []
+    offset = 0
+    for key, history in histories:
+        blob = history.to_bytes() if isinstance(history, History) else bytes(history)
+        blob += b'\x00' * _pad(len(blob))
+        index_lines.append(f'{key}\t{offset}\t{len(blob)}')
+        blobs.append(blob)
+        offset += len(blob)
+    index = '\n'.join(index_lines).encode('utf-8')
+    index += b' ' * _pad(len(index))
+    # Readers build the sidecar under a shared lock, so two threads of one process can be writing it at once
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(SIDECAR_MAGIC + struct.pack('<qqI', stamp[0], stamp[1], len(index)) + index)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+    if instrument.ENABLED:
+        instrument.count('bytes_written', 24 + len(index) + offset)
+
+
+class Sidecar:
+    """
+    A sidecar file mapped into memory. Histories read from it point straight into the mapping.
+    """
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        if bytes(view[:4]) != SIDECAR_MAGIC:
+            raise ValueError(f'{path} is not a history sidecar')
+        mtime, size, index_length = struct.unpack_from('<qqI', view, 4)
+        self.stamp = (mtime, size)
+        start = 24
+        base = start + index_length
+        self._index = {}
+        index = bytes(view[start:base]).decode('utf-8').rstrip(' ')
+        for line in index.split('\n') if index else []:
+            key, offset, length = line.split('\t')
+            self._index[key] = (base + int(offset), int(length))
+        self._view = view
+
+    def get(self, key: str) -> Optional[History]:
+        """
+        Args:
+            key: The key the history was written under.
+
+        Returns:
+            The history, or None if the sidecar doesn't have it.
+        """
+        if key not in self._index:
+            return None
+        offset, length = self._index[key]
+        return History.from_buffer(self._view[offset:offset + length])
+
+    def raw(self, key: str) -> Optional[memoryview]:
+        """
+        Args:
+            key: The key the history was written under.
+
+        Returns:
+            The history's bytes as stored, or None if the sidecar doesn't have it.
+        """
+        if key not in self._index:
+            return None
+        offset, length = self._index[key]
+        return self._view[offset:offset + length]
@@ -0,0 +1,268 @@
+"""
+Timing and I/O counters for processing functions, storage and GUI handlers.
+
+Set WORKOUT_METRICS=1 before starting the app to turn it on. When it is off the decorators hand back the function
+untouched and the counters are skipped behind a single flag check, so it costs next to nothing. When it is on:
+
+    - every function wrapped with timed records a latency histogram, as does every call on a storage backend opened
+      through storage.open_storage,
+    - storage counts bytes read and written and JSON documents parsed,
+    - WORKOUT_METRICS_FILE (default metrics.json) gets a JSON dump of everything at exit,
+    - render_prometheus gives the same numbers in Prometheus text format (server.py serves it at GET /metrics).
+
+Logging goes through the standard logging module as key=value lines, WORKOUT_LOG_LEVEL picks the level.
+"""
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+ENABLED = os.environ.get('WORKOUT_METRICS', '') not in ('', '0')
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+
+class Histogram:
+    """
+    Latency histogram: how many calls fell in each bucket, plus the count and total time.
+    """
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns:
+            Upper bound of the bucket the q-th quantile falls in.
+        """
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= target and count:
+                return bound
+        return 0.0
+
+
+_lock = threading.Lock()
+histograms: Dict[str, Histogram] = {}
+counters: Dict[str, float] = {}
+
+
+def observe(name: str, seconds: float) -> None:
+    """
+    Records one call's latency.
+    """
+    with _lock:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+
+def count(name: str, amount: float = 1) -> None:
+    """
+    Adds to a counter, e.g. count('bytes_read', 512). Call sites check ENABLED first.
+    """
+    with _lock:
+        counters[name] = counters.get(name, 0) + amount
+
+
+def load_json(f):
+    """
+    json.load that counts the bytes read and the parse.
+    """
+    if not ENABLED:
+        return json.load(f)
+    text = f.read()
+    count('bytes_read', len(text))
+    count('json_parses')
+    return json.loads(text)
+
+
+def loads_json(data):
+    """
+    json.loads that counts the bytes read and the parse.
+    """
+    if ENABLED:
+        count('bytes_read', len(data))
+        count('json_parses')
+    return json.loads(data)
+
+
+def write_json(f, obj) -> None:
+    """
+    Writes obj to f as JSON, counting the bytes written.
+    """
+    text = json.dumps(obj)
+    if ENABLED:
+        count('bytes_written', len(text))
+    f.write(text)
+
+
+def timed(fn: Optional[Callable] = None, name: Optional[str] = None) -> Callable:
+    """
+    Decorator that records how long every call takes, under name (module.function by default). Works on plain and
+    async functions. Returns the function itself when instrumentation is off.
+    """
+    if fn is None:
+        return lambda f: timed(f, name)
+    if not ENABLED:
+        return fn
+    # Only needed when on, inspect is slow to import
+    import inspect
+    metric = name or f'{fn.__module__}.{fn.__qualname__}'
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                observe(metric, time.perf_counter() - start)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            observe(metric, time.perf_counter() - start)
+    return wrapper
+
+
+def timed_methods(obj, names: Iterable[str], prefix: str):
+    """
+    Wraps the named methods of one object with timed, recorded as prefix.method. Used for the storage backends, whose
+    methods also call each other (e.g. update_user calls commit), so both the outer and inner calls are timed.
+
+    Returns:
+        The object, untouched when instrumentation is off.
+    """
+    if not ENABLED:
+        return obj
+    for name in names:
+        method = getattr(obj, name, None)
+        if callable(method):
+            setattr(obj, name, timed(method, f'{prefix}.{name}'))
+    return obj
+
+
+def timed_slot(fn: Callable) -> Callable:
+    """
+    timed for Qt slots. Qt passes every argument the signal has (e.g. clicked's checked flag) to a wrapper that takes
+    *args, so the extra ones are dropped here before calling the method.
+    """
+    if not ENABLED:
+        return fn
+    import inspect
+    parameters = inspect.signature(fn).parameters.values()
+    takes = len([p for p in parameters if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)])
+    metric = f'{fn.__module__}.{fn.__qualname__}'
+
+    @functools.wraps(fn)
+    def wrapper(*args):
+        start = time.perf_counter()
+        try:
+            return fn(*args[:takes])
+        finally:
+            observe(metric, time.perf_counter() - start)
+    return wrapper
+
+
+def snapshot() -> Dict:
+    """
+    Returns:
+        Every histogram and counter as plain data.
+    """
+    with _lock:
+        return {
+            'latency': {name: {'count': h.count, 'total_seconds': h.total, 'p50': h.quantile(0.5),
+                               'p99': h.quantile(0.99),
+                               'buckets': {str(bound): n for bound, n in zip(BUCKETS, h.counts)}}
+                        for name, h in sorted(histograms.items())},
+            'counters': dict(sorted(counters.items())),
+        }
+
+
+def dump(path: str) -> None:
+    """
+    Writes snapshot() to a JSON file.
+    """
+    with open(path, 'w') as f:
+        json.dump(snapshot(), f, indent=2)
+
+
+def _metric_name(name: str) -> str:
+    return 'workout_' + ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def render_prometheus() -> str:
+    """
+    Returns:
+        Every histogram and counter in the Prometheus text exposition format.
+    """
+    lines: List[str] = []
+    with _lock:
+        if histograms:
+            lines.append('# TYPE workout_latency_seconds histogram')
+        for name, h in sorted(histograms.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS, h.counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'workout_latency_seconds_bucket{{function="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'workout_latency_seconds_sum{{function="{name}"}} {h.total}')
+            lines.append(f'workout_latency_seconds_count{{function="{name}"}} {h.count}')
+        for name, value in sorted(counters.items()):
+            metric = _metric_name(name) + '_total'
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class KeyValueFormatter(logging.Formatter):
+    """
+    Formats records as key=value pairs, with anything passed in extra={'fields': {...}} added on the end.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        parts = [f'time={self.formatTime(record, "%Y-%m-%dT%H:%M:%S")}', f'level={record.levelname}',
+                 f'logger={record.name}', f'msg={json.dumps(record.getMessage())}']
+        for key, value in getattr(record, 'fields', {}).items():
+            parts.append(f'{key}={json.dumps(value, default=str)}')
+        if record.exc_info:
+            parts.append(f'exc={json.dumps(self.formatException(record.exc_info))}')
+        return ' '.join(parts)
+
+
+def configure_logging() -> None:
+    """
+    Sends log records to stderr as key=value lines, at the level in WORKOUT_LOG_LEVEL (INFO by default).
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(KeyValueFormatter())
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(os.environ.get('WORKOUT_LOG_LEVEL', 'INFO').upper())
+
+
+if ENABLED:
+    atexit.register(lambda: dump(os.environ.get('WORKOUT_METRICS_FILE', 'metrics.json')))
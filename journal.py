@@ -0,0 +1,265 @@
+import atexit
+import json
+import os
+import threading
+from typing import Any, Dict, List, Tuple
+
+import instrument
+from history import History, date_index, to_ordinal
+from storage import Storage, apply_weight
+
+
+class JournaledStorage(Storage):
+    """
+    Keeps userdata.json as a snapshot and appends every change to a log file next to it instead of rewriting the
+    snapshot. The log is fsynced in batches and a background thread folds it back into the snapshot once it gets
+    long. The snapshot and the log are merged in memory when the storage is opened, so reads never touch disk.
+
+    Log lines look like:
+        {"op": "user", "user": ..., "record": {...}}
+        {"op": "set", "user": ..., "workout": ..., "index": n, "entry": {...}}
+        {"op": "weight", "user": ..., "date": ..., "weight": ...}
+
+    Every op can be replayed twice without changing the result ("set" only applies if the history is still n long),
+    so a crash between replacing the snapshot and clearing the log is harmless.
+    """
+    atomic_batches = True
+
+    def __init__(self, path: str = 'userdata.json', batch_size: int = 32, flush_interval: float = 1.0,
+                 compact_after: int = 1000):
+        """
+        Loads the snapshot, replays the log and starts the background thread.
+
+        Args:
+            path: The snapshot file, the log goes in path + '.log'.
+            batch_size: Fsync the log after this many unsynced entries.
+            flush_interval: Longest time in seconds an entry waits before being fsynced.
+            compact_after: Fold the log into the snapshot once it has this many entries.
+        """
+        self.path = path
+        self.log_path = path + '.log'
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact_after = compact_after
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        # Column histories built from the in-memory data, dropped whenever the data behind them changes
+        self._histories = {}
+        # Day ordinal -> position in each user's weigh-in lists, built on a user's first weigh-in
+        self._weight_index = {}
+
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.userdata = instrument.load_json(f)
+        else:
+            self.userdata = {}
+        self.log_entries = self._replay()
+        self._unsynced = 0
+        self._log = open(self.log_path, 'a')
+
+        self._worker = threading.Thread(target=self._background, name='journal-compactor', daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def _replay(self) -> int:
+        """
+        Applies the log on top of the snapshot, stopping at a torn last line left by a crash.
+
+        Returns:
+            How many entries were applied.
+        """
+        if not os.path.exists(self.log_path):
+            return 0
+        count = 0
+        good_bytes = 0
+        with open(self.log_path, 'rb') as f:
+            for line in f:
+                try:
+                    op = instrument.loads_json(line)
+                except ValueError:
+                    break
+                self._apply(op)
+                count += 1
+                good_bytes += len(line)
+        # Drop anything after the last complete line so new entries don't get glued onto it
+        if good_bytes != os.path.getsize(self.log_path):
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(good_bytes)
+        return count
+
+    def _apply(self, op: Dict) -> None:
+        """
+        Applies one log entry to the in-memory data.
+        """
+        kind = op['op']
+        if kind == 'user':
+            self.userdata[op['user']] = op['record']
+            self._weight_index.pop(op['user'], None)
+            self._histories = {key: history for key, history in self._histories.items() if key[0] != op['user']}
+        elif kind == 'set':
+            self._histories.pop((op['user'], op['workout']), None)
+            history = self.userdata[op['user']].setdefault(op['workout'], {})
+            if len(history.get('dates', [])) == op['index']:
+                for attribute, value in op['entry'].items():
+                    history.setdefault(attribute, []).append(value)
+        elif kind == 'weight':
+            self._histories.pop((op['user'], 'weight'), None)
+            target_data = self.userdata[op['user']]['weight']
+            index = self._weight_index.get(op['user'])
+            if index is None:
+                index = self._weight_index[op['user']] = date_index(target_data['dates'])
+            apply_weight(self.userdata[op['user']], to_ordinal(op['date']), op['weight'], index)
+
+    def _append(self, *ops: Dict) -> None:
+        """
+        Applies entries in memory and writes them to the log in one write. Caller holds the lock.
+        """
+        lines = []
+        for op in ops:
+            self._apply(op)
+            lines.append(json.dumps(op) + '\n')
+        data = ''.join(lines)
+        if instrument.ENABLED:
+            instrument.count('bytes_written', len(data))
+        self._log.write(data)
+        self._unsynced += len(ops)
+        self.log_entries += len(ops)
+        if self._unsynced >= self.batch_size:
+            self._sync()
+        if self.log_entries >= self.compact_after:
+            self._wake.set()
+
+    def _sync(self) -> None:
+        """
+        Pushes the log to disk. Caller holds the lock.
+        """
+        if self._unsynced:
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._unsynced = 0
+
+    def _background(self) -> None:
+        """
+        Fsyncs entries that have waited too long and compacts the log when it gets long.
+        """
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            with self._lock:
+                if self._closed:
+                    return
+                self._sync()
+                if self.log_entries >= self.compact_after:
+                    self._compact()
+
+    def _compact(self) -> None:
+        """
+        Writes the merged data out as the new snapshot and empties the log. Caller holds the lock.
+        """
+        self._sync()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            instrument.write_json(f, self.userdata)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._log.truncate(0)
+        self._log.seek(0)
+        os.fsync(self._log.fileno())
+        self.log_entries = 0
+
+    def flush(self) -> None:
+        """
+        Forces every entry written so far onto disk.
+        """
+        with self._lock:
+            self._sync()
+
+    def compact(self) -> None:
+        """
+        Folds the log into the snapshot right away.
+        """
+        with self._lock:
+            self._compact()
+
+    def users(self) -> List[str]:
+        with self._lock:
+            return list(self.userdata)
+
+    def has_user(self, user: str) -> bool:
+        with self._lock:
+            return user in self.userdata
+
+    def load_user(self, user: str) -> Dict:
+        with self._lock:
+            return json.loads(json.dumps(self.userdata[user]))
+
+    def save_user(self, user: str, record: Dict) -> None:
+        record = json.loads(json.dumps(record))
+        with self._lock:
+            self._append({'op': 'user', 'user': user, 'record': record})
+
+    def get_planner(self, user: str) -> Dict[str, List[str]]:
+        with self._lock:
+            return {day: list(groups) for day, groups in self.userdata[user]['planner'].items()}
+
+    def _set_ops(self, user: str, rows: List[Tuple[str, Dict[str, Any]]], lengths: Dict) -> List[Dict]:
+        """
+        Log entries for appending sets. lengths tracks (user, workout) -> history length across several calls whose
+        entries are appended together. Caller holds the lock.
+        """
+        ops = []
+        for workout_id, entry in rows:
+            key = (user, workout_id)
+            if key not in lengths:
+                lengths[key] = len(self.userdata[user].get(workout_id, {}).get('dates', []))
+            ops.append({'op': 'set', 'user': user, 'workout': workout_id, 'index': lengths[key], 'entry': entry})
+            lengths[key] += 1
+        return ops
+
+    def append_sets(self, user: str, rows: List[Tuple[str, Dict[str, Any]]]) -> None:
+        with self._lock:
+            self._append(*self._set_ops(user, rows, {}))
+
+    def log_weight(self, user: str, date, weight: int) -> None:
+        with self._lock:
+            self._append({'op': 'weight', 'user': user, 'date': to_ordinal(date), 'weight': weight})
+
+    def write_batch(self, ops: List[Tuple]) -> None:
+        with self._lock:
+            entries = []
+            lengths = {}
+            for op in ops:
+                if op[1] not in self.userdata:
+                    raise KeyError(op[1])
+                if op[0] == 'sets':
+                    entries.extend(self._set_ops(op[1], op[2], lengths))
+                else:
+                    entries.append({'op': 'weight', 'user': op[1], 'date': to_ordinal(op[2]), 'weight': op[3]})
+            # One write to the log for the whole batch
+            self._append(*entries)
+
+    def get_points(self, user: str, tag: str, focus: str) -> Tuple[List, List]:
+        with self._lock:
+            target_data = self.userdata[user].get(tag, {})
+            return list(target_data.get('dates', [])), list(target_data.get(focus, []))
+
+    def get_history(self, user: str, tag: str) -> History:
+        with self._lock:
+            history = self._histories.get((user, tag))
+            if history is None:
+                history = History.from_lists(self.userdata[user].get(tag, {}))
+                self._histories[(user, tag)] = history
+            return history
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._sync()
+            self._closed = True
+        self._wake.set()
+        self._worker.join()
+        self._log.close()
@@ -0,0 +1,30 @@
+import contextlib
+import os
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on this platform (Windows), locking turns into a no-op
+    fcntl = None
+
+
+@contextlib.contextmanager
+def file_lock(path: str, shared: bool = False) -> Iterator[None]:
+    """
+    Holds an advisory lock on a lock file for the length of the with block. Every process that goes through the
+    storage layer takes these locks, so they see each other's writes as whole units.
+
+    Args:
+        path: The lock file, created if it doesn't exist.
+        shared: Take a shared (read) lock instead of an exclusive (write) lock.
+    """
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
@@ -1,17 +1,20 @@
 from gui import *
-import pandas as pd
+from instrument import configure_logging
+import logging
 import os
 
+log = logging.getLogger(__name__)
+
 def setup() -> None:
     """
     Establishes the login csv if it doesn't already exist.
     """
     if os.path.exists('login.csv'):
-        print('login file is present')
+        log.debug('login file is present')
     else:
-        print('New login file made')
-        df = pd.DataFrame({'Users': [], 'Passwords': []})
-        df.to_csv('login.csv')
+        log.info('new login file made')
+        with open('login.csv', 'w', newline='') as f:
+            f.write(',Users,Passwords\n')
 
 
 def main():
@@ -25,6 +28,7 @@ def main():
 
 
 if __name__ == '__main__':
+    configure_logging()  # Log lines go to stderr as key=value pairs
     setup()  # Sets up the login csv
     main()  # Runs the main application
     
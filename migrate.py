@@ -0,0 +1,73 @@
+"""
+Copies user data from one storage backend to another, e.g. to split the monolithic userdata.json into per-user shards:
+
+    python migrate.py json:userdata.json sharded:userdata.d
+
+With --sparse the empty histories older versions added for every workout a user never logged are left out, since
+records now only hold the workouts that have sets.
+
+Each side is backend:path, with the backend names from storage.BACKENDS (json, sqlite, journal, binary, sharded).
+"""
+import argparse
+import sys
+from typing import Dict
+
+from storage import Storage, open_storage
+
+
+def _drop_empty(record: Dict) -> Dict:
+    return {key: value for key, value in record.items()
+            if key in ('info', 'weight', 'planner') or not isinstance(value, dict) or value.get('dates')}
+
+
+def migrate(source: Storage, target: Storage, overwrite: bool = False, sparse: bool = False) -> int:
+    """
+    Copies every user record from one storage to another.
+
+    Args:
+        source: Storage to read from.
+        target: Storage to write to.
+        overwrite: Replace users that already exist in the target instead of skipping them.
+        sparse: Leave out workouts without any logged sets.
+
+    Returns:
+        How many users were copied.
+    """
+    copied = 0
+    existing = set() if overwrite else set(target.users())
+    # all_records reads the source once (one parse of the json file) instead of once per user
+    for user, record in source.all_records():
+        if user in existing:
+            print(f'Skipping {user}, already in target')
+            continue
+        target.save_user(user, _drop_empty(record) if sparse else record)
+        copied += 1
+    return copied
+
+
+def _open(spec: str) -> Storage:
+    kind, _, path = spec.partition(':')
+    return open_storage(kind, path or None)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='backend:path to read from, e.g. json:userdata.json')
+    parser.add_argument('target', help='backend:path to write to, e.g. sharded:userdata.d')
+    parser.add_argument('--overwrite', action='store_true', help='replace users already in the target')
+    parser.add_argument('--sparse', action='store_true', help='leave out workouts the user never logged')
+    args = parser.parse_args()
+
+    source = _open(args.source)
+    target = _open(args.target)
+    try:
+        copied = migrate(source, target, args.overwrite, args.sparse)
+    finally:
+        source.close()
+        target.close()
+    print(f'Copied {copied} users from {args.source} to {args.target}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,186 @@
-import datetime
+import contextlib
+import itertools
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+from cache import CachedStorage
+from catalog import catalog
+from decimate import lttb, min_max
+from generator import WorkoutGenerator
+from history import History, to_ordinal
+from instrument import timed
+from rollups import Rollup
+from storage import Storage, open_storage
+from users import directory
+from validation import validate_entry
+
+log = logging.getLogger(__name__)
+
+# Where user data is read from and written to, picked by the WORKOUT_STORAGE environment variable. Recently used
+# records are kept in memory, see CachedStorage.from_env for the settings.
+storage = CachedStorage.from_env(open_storage())
+
+# Picks sessions from the planner, WORKOUT_SEED makes the picks repeatable
+generator = WorkoutGenerator(storage, catalog, seed=os.environ.get('WORKOUT_SEED'))
+
+
+def use_storage(backend: Storage) -> None:
+    """
+    Swaps the storage backend processing functions read from and write to.
+
+    Args:
+        backend: The storage to use from now on.
+    """
+    global storage, _async_storage
+    if _async_storage is not None:
+        _async_storage.close()
+        _async_storage = None
+    storage.close()
+    storage = backend
+    with _cache_lock:
+        _plot_cache.clear()
+        _rollups.clear()
+    generator.use_storage(backend)
+
+
+# asyncio driver for storage, made by the first async_ call
+_async_storage = None
+
+
+# The caches below are least recently used first and hold at most this many entries each
+PLOT_CACHE_SIZE = 256
+ROLLUP_CACHE_SIZE = 256
+WRITE_STAMP_SIZE = 4096
+
+# Guards the caches below. The GUI fills them from its I/O thread while the main thread logs sets.
+_cache_lock = threading.RLock()
+
+# Downsampled graph points, (user, tag, focus, width, method) -> (x, y). Cleared for a user whenever they log something.
+_plot_cache: 'OrderedDict[Tuple, Tuple]' = OrderedDict()
+
+# Stamp of every user's last write, unique across users, so a cache filled from a read that a write overtook can tell
+# the data moved underneath it. A user missing from it reads as 0.
+_write_stamps: 'OrderedDict[str, int]' = OrderedDict()
+_next_stamp = itertools.count(1)
+
+# Writes started but not finished per user. A read that overlaps one may or may not see it, so nothing it builds is
+# cached.
+_writes_in_flight: Dict[str, int] = {}
+
+
+def _cache_get(cache: OrderedDict, key: Hashable) -> Optional[object]:
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+
+def _cache_put(cache: OrderedDict, key: Hashable, value: object, limit: int) -> None:
+    """
+    Adds to one of the caches, dropping the least recently used entries past limit. Caller holds _cache_lock.
+    """
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > limit:
+        cache.popitem(last=False)
+
+
+def _write_stamp(user: str) -> int:
+    with _cache_lock:
+        return _write_stamps.get(user, 0)
+
+
+def _forget_plots(user: str) -> None:
+    """
+    Moves the user's write stamp on and drops their downsampled points. Caller holds _cache_lock.
+    """
+    _cache_put(_write_stamps, user, next(_next_stamp), WRITE_STAMP_SIZE)
+    for key in [key for key in _plot_cache if key[0] == user]:
+        del _plot_cache[key]
+
+
+@contextlib.contextmanager
+def _writing(user: str) -> Iterator[None]:
+    """
+    Wraps a write to storage for the user. The stamp moves on both before and after it, and while it runs nothing is
+    cached for the user, so a graph or rollup built from a read that raced the write isn't kept.
+    """
+    with _cache_lock:
+        _writes_in_flight[user] = _writes_in_flight.get(user, 0) + 1
+        _forget_plots(user)
+    try:
+        yield
+    finally:
+        with _cache_lock:
+            if _writes_in_flight[user] == 1:
+                del _writes_in_flight[user]
+            else:
+                _writes_in_flight[user] -= 1
+            _forget_plots(user)
+
+
+def _cacheable(user: str, stamp: int) -> bool:
+    """
+    True if nothing was written for the user since stamp was taken and no write is under way. Caller holds
+    _cache_lock.
+    """
+    return _write_stamps.get(user, 0) == stamp and user not in _writes_in_flight
+
+
+def _cache_plot(key: Tuple, points: Tuple, stamp: int) -> None:
+    """
+    Caches downsampled points, unless the user logged something since stamp was taken.
+    """
+    with _cache_lock:
+        if _cacheable(key[0], stamp):
+            _cache_put(_plot_cache, key, points, PLOT_CACHE_SIZE)
 
-import pandas as pd
-import json
-import random
-from typing import Dict, List, Tuple
 
+# Progress rollups, (user, workout id) -> Rollup. Built from the full history the first time they are asked for, then
+# every set logged through this module is added to them as it is saved.
+_rollups: 'OrderedDict[Tuple[str, str], Rollup]' = OrderedDict()
 
+
+def _rollup_series(key: Tuple[str, str], period: str, field: str) -> Optional[Tuple[Sequence[int], Sequence[int]]]:
+    with _cache_lock:
+        rollup = _cache_get(_rollups, key)
+        return None if rollup is None else rollup.series(period, field)
+
+
+def _build_rollup(key: Tuple[str, str], history: History, stamp: int, period: str,
+                  field: str) -> Tuple[Sequence[int], Sequence[int]]:
+    """
+    Builds a rollup from a history read after stamp was taken and returns its series. It is only cached if no set
+    was written for the user in the meantime: later sets are added to cached rollups as they are saved, so one built
+    from a read that raced a write could end up missing that set or counting it twice.
+    """
+    rollup = Rollup.from_history(history)
+    with _cache_lock:
+        if _cacheable(key[0], stamp) and key not in _rollups:
+            _cache_put(_rollups, key, rollup, ROLLUP_CACHE_SIZE)
+        return rollup.series(period, field)
+
+
+def _sets_saved(user: str, rows: List[Tuple[str, Dict]]) -> None:
+    """
+    Brings the in-memory caches up to date after sets were written for a user. Called inside _writing, after the
+    write.
+    """
+    for workout_id, entry in rows:
+        ordinal = to_ordinal(entry['dates'])
+        generator.record_set(user, workout_id, ordinal)
+        with _cache_lock:
+            rollup = _rollups.get((user, workout_id))
+            # Rollups that haven't been built yet will pick the set up from the history when they are
+            if rollup is not None and 'weight' in entry:
+                rollup.add(ordinal, int(entry['weight']), int(entry.get('reps', 1)), int(entry.get('sets', 1)))
+
+
+@timed
 def run_login(username: str, password: str) -> Tuple[bool, int]:
     """
     Authenticates a user by checking the provided username and password against data stored on file.
@@ -22,33 +197,26 @@ def run_login(username: str, password: str) -> Tuple[bool, int]:
                 2: No user found
                 3: Incorrect password
     """
-    print('run login')
-    df = pd.read_csv('login.csv')
-    users = df['Users'].tolist()
-    users = [str(user) for user in users]
-    check = username in users
-
     if username == '':
         return False, 0
 
     if password == '':
         return False, 1
 
-    if check:
-        print('User in system')
-        row = df.loc[df['Users'] == username]
-        key = row['Passwords'].tolist()
-        key = key[0]
+    key = directory.password_for(username)
+    if key is not None:
         if password == key:
-            check_exercise(username)
+            log.info('login', extra={'fields': {'user': username, 'ok': True}})
             return True, -1
         else:
+            log.info('login', extra={'fields': {'user': username, 'ok': False, 'reason': 'wrong password'}})
             return False, 3
     else:
-        print('No user by that username in system')
+        log.info('login', extra={'fields': {'user': username, 'ok': False, 'reason': 'no such user'}})
         return False, 2
 
 
+@timed
 def run_account_create(username: str, password: str) -> Tuple[bool, int]:
     """
     Creates a new user account by validating the provided username and password, and adding the user to the system.
@@ -63,17 +231,12 @@ def run_account_create(username: str, password: str) -> Tuple[bool, int]:
             - The second value is an integer indicating the result of the account creation.
                 - The second value is generated but using the validate password function above.
     """
-    print('Run account create')
     login_check = run_login(username, password)
     if not login_check[0] and login_check[1] == 2:
-        df = pd.read_csv('login.csv')
-        df.loc[len(df)] = [len(df) + 1, username, password]
-        df.to_csv('login.csv', index=False)
-
-        with open('userdata.json', 'r') as f:
-            userdata = json.load(f)
+        if not directory.add(username, password):
+            return False, 3
 
-        userdata[f'{username}'] = {
+        record = {
             'info': {},
             'weight': {
                 'weight': [],
@@ -90,53 +253,18 @@ def run_account_create(username: str, password: str) -> Tuple[bool, int]:
             }
         }
 
-        with open('userdata.json', 'w') as f:
-            f.write(json.dumps(userdata))
-        check_exercise(username)
+        storage.create_user(username, record)
+        log.info('account created', extra={'fields': {'user': username}})
         return True, -1
     else:
         return False, login_check[1]
 
 
-def check_exercise(user: str) -> None:
-    """
-        Checks to see if user has all the workout in profile
-
-        Args:
-            user: The username of the user.
-
-        If user is missing an exercise, they will be added.
-    """
-    with open('userdata.json', 'r') as f:
-        userdata = json.load(f)
-    with open('workouts.json', 'r') as f:
-        workouts = json.load(f)
-
-    workout_keys = workouts.keys()
-    workout_keys = list(workout_keys)
-
-    target_data = userdata[user]
-    target_keys = target_data.keys()
-    target_keys = list(target_keys)
-
-    difference_list = [workout for workout in workout_keys if workout not in target_keys]
-    if len(difference_list) == 0:
-        print('All workouts up to date')
-    else:
-        print(f'Adding {len(difference_list)} to profile.')
-
-    for workout in difference_list:
-        target_data[workout] = {}
-        for attribute in workouts[workout]['attributes']:
-            target_data[workout].update({f"{attribute}": []})
-
-    with open('userdata.json', 'w') as f:
-        f.write(json.dumps(userdata))
-
-
+@timed
 def pick_workout(day: str, user: str) -> List[str]:
     """
-    Selects a random workout for a given day based on the user's workout planner.
+    Selects random workouts for a given day based on the user's workout planner, three from every muscle group
+    planned that day. Exercises that haven't been done in a while are more likely to be picked.
 
     Args:
         day: The day of the week (e.g., 'Monday', 'Tuesday').
@@ -145,29 +273,13 @@ def pick_workout(day: str, user: str) -> List[str]:
     Returns:
         A list of selected workouts for the day, or ['Rest day'] if no workouts are scheduled.
     """
-    weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-    if day in weekdays:
-        with open('workouts.json', 'r') as f:
-            workouts = json.load(f)
-        with open('userdata.json', 'r') as f:
-            userdata = json.load(f)
-        planner = userdata[user]['planner']
-        for d in planner:
-            if d == day:
-                # For now, we will only be looking at the one value that is in the workout planner. Eventually update
-                # to run through list of all workouts for that planned day and generate off of that.
-                group = planner[d][0]
-                group_list = []
-                for workout in workouts:
-                    if workouts[workout]['group'] == group:
-                        group_list.append(workouts[workout]['name'])
-                selected_workouts = random.sample(group_list, 3)
-                return selected_workouts
-
-    else:
+    selected_workouts = generator.generate(user, day)
+    if not selected_workouts:
         return ['Rest day']
+    return selected_workouts
 
 
+@timed
 def get_attributes(workout_name: str) -> str:
     """
     Retrieves the list of attributes for a specific workout.
@@ -178,19 +290,16 @@ def get_attributes(workout_name: str) -> str:
     Returns:
         A comma-separated string of attributes for the workout.
     """
-    with open('workouts.json', 'r') as f:
-        workouts = json.load(f)
-
-    for workout in workouts:
-        if workouts[workout]['name'] == workout_name:
-            attributes = workouts[workout]['attributes']
-            att_str = ''
-            for attribute in attributes:
-                clean = attribute.capitalize()
-                att_str += clean + ', '
-            return att_str
+    record = catalog.record_for(workout_name)
+    if record is not None:
+        att_str = ''
+        for attribute in record['attributes']:
+            clean = attribute.capitalize()
+            att_str += clean + ', '
+        return att_str
 
 
+@timed
 def check_workout(workout_name: str) -> bool:
     """
     Checks if a workout exists in the system.
@@ -201,15 +310,49 @@ def check_workout(workout_name: str) -> bool:
     Returns:
         True if the workout exists, False otherwise.
     """
-    with open('workouts.json', 'r') as f:
-        workouts = json.load(f)
-    for workout in workouts:
-        if workouts[workout]['name'] == workout_name:
-            return True
-        else:
-            return False
+    return catalog.id_for(workout_name) is not None
+
+
+def _session_rows(entries: Dict[str, str]) -> Tuple[Dict[str, int], List[Tuple[str, Dict]]]:
+    """
+    Validates a workout session for submit_session and async_submit_session.
+
+    Returns:
+        Workout name to its validate_entry code, and (workout id, entry) rows for the valid ones, ready to save.
+    """
+    results = {}
+    rows = []
+    for workout, text in entries.items():
+        code, values = validate_entry(workout, text)
+        results[workout] = code
+        if code == -1:
+            workout_id = catalog.id_for(workout)
+            attributes = catalog.get(workout_id)['attributes']
+            rows.append((workout_id, dict(zip(attributes, values))))
+    return results, rows
+
+
+@timed
+def submit_session(user: str, entries: Dict[str, str]) -> Dict[str, int]:
+    """
+    Validates every row of a workout session and saves all the valid ones in a single write.
+
+    Args:
+        user: The username of the user.
+        entries: Workout name to the comma-separated string the user typed for it.
+
+    Returns:
+        Workout name to its code from validate_entry, -1 meaning the row was saved.
+    """
+    results, rows = _session_rows(entries)
+    if rows:
+        with _writing(user):
+            storage.append_sets(user, rows)
+            _sets_saved(user, rows)
+    return results
 
 
+@timed
 def check_edits(data: Dict[str, str], user: str) -> Tuple[bool, int]:
     """
     Validates and processes the workout data submitted by the user.
@@ -220,52 +363,18 @@ def check_edits(data: Dict[str, str], user: str) -> Tuple[bool, int]:
 
     Returns:
         A tuple where:
-            - The first value is a boolean indicating whether the data was successfully processed.
-            - The second value is an integer code indicating the validation result.
-    """
-    check = 0
-    print(data, user)
-    for workout in data:
-        print(workout)
-        values = data[workout].split(',')
-        values = [x.strip() for x in values]
-        print(len(values))
-        if len(values) == 5:
-            try:
-                date = datetime.datetime.strptime(values[0], "%m/%d/%Y")
-                # values[0] = date
-            except:
-                check += 1
-                return False, 2
-            try:
-                num = int(values[1])
-                values[1] = num
-            except:
-                check += 1
-                return False, 3
-            try:
-                num = int(values[2])
-                values[2] = num
-            except:
-                check += 1
-                return False, 4
-            try:
-                num = int(values[3])
-                values[3] = num
-            except:
-                check += 1
-                return False, 5
-            if check == 0:
-                send_to_file(workout, values, user)
-                return True, -1
-            else:
-                return False, 1
-        else:
-            check += 1
-            return False, 1
+            - The first value is a boolean indicating whether every row was valid and saved.
+            - The second value is the first error code from validate_entry, or -1.
+    """
+    results = submit_session(user, data)
+    for code in results.values():
+        if code != -1:
+            return False, code
+    return True, -1
 
 
 # Update to use dictionaries not lists for data input
+@timed
 def send_to_file(workout: str, value: List[str], user: str) -> None:
     """
         Saves workout data to the user's profile.
@@ -275,26 +384,16 @@ def send_to_file(workout: str, value: List[str], user: str) -> None:
             value: A list of values (date, weight, reps, sets, notes).
             user: The username of the user.
     """
-
-    with open('userdata.json', 'r') as f:
-        userdata = json.load(f)
-    with open('workouts.json', 'r') as f:
-        workouts = json.load(f)
-    targetData = userdata[user]
-    for w in workouts:
-        if workouts[w]['name'] == workout:
-            workout_id = w
-    targetData[workout_id]['dates'].append(value[0])
-    targetData[workout_id]['weight'].append(value[1])
-    targetData[workout_id]['reps'].append(value[2])
-    targetData[workout_id]['sets'].append(value[3])
-    targetData[workout_id]['notes'].append(value[4])
-
-    with open('userdata.json', 'w') as f:
-        f.write(json.dumps(userdata))
+    workout_id = catalog.id_for(workout)
+    attributes = catalog.get(workout_id)['attributes']
+    entry = dict(zip(attributes, value))
+    with _writing(user):
+        storage.append_set(user, workout_id, entry)
+        _sets_saved(user, [(workout_id, entry)])
 
 
-def get_points(tag: str, focus: str, user: str) -> Tuple[List[str], List[int]]:
+@timed
+def get_points(tag: str, focus: str, user: str) -> Tuple[Sequence[int], Sequence[int]]:
     """
     Retrieves workout data points (e.g., weight, reps) for a given user and workout tag.
     This is for building the graphs
@@ -306,42 +405,93 @@ def get_points(tag: str, focus: str, user: str) -> Tuple[List[str], List[int]]:
 
     Returns:
         A tuple where:
-            - The first value is a list of dates.
-            - The second value is a list of corresponding data points (e.g., weight, reps).
+            - The first value is an int array of dates as day ordinals (datetime.date.toordinal).
+            - The second value is an int array of the corresponding data points (e.g., weight, reps).
     """
-    with open('userdata.json', 'r') as f:
-        userdata = json.load(f)
-    targetData = userdata[user][tag]
-    for field in targetData:
-        if field == focus:
-            y = targetData[focus]
-        if field == 'dates':
-            x = targetData['dates']
-    return x, y
+    history = storage.get_history(user, tag)
+    return history.dates, history[focus]
 
 
+@timed
+def get_plot_points(tag: str, focus: str, user: str, width: int,
+                    method: str = 'lttb') -> Tuple[Sequence[int], Sequence[int]]:
+    """
+    Same as get_points, but thinned out to about one point per pixel of the graph so long histories stay quick to
+    draw. Results are cached until the user logs something new.
+
+    Args:
+        tag: The workout tag (e.g., 'weight').
+        focus: The focus of the data (e.g., 'weight', 'reps').
+        user: The username of the user.
+        width: Width of the graph in pixels.
+        method: 'lttb' (largest-triangle-three-buckets) or 'minmax' (lowest and highest point per bucket).
+
+    Returns:
+        A tuple of dates (day ordinals) and values, with at most width points.
+    """
+    key = (user, tag, focus, width, method)
+    points = _cache_get(_plot_cache, key)
+    if points is None:
+        stamp = _write_stamp(user)
+        points = _downsample(*get_points(tag, focus, user), width, method)
+        _cache_plot(key, points, stamp)
+    return points
+
+
+def _downsample(x: Sequence[int], y: Sequence[int], width: int, method: str) -> Tuple[Sequence[int], Sequence[int]]:
+    if method == 'minmax':
+        return min_max(x, y, width // 2)
+    return lttb(x, y, width)
+
+
+@timed
+def get_rollup(tag: str, user: str, period: str, field: str) -> Tuple[Sequence[int], Sequence[int]]:
+    """
+    Retrieves pre-aggregated progress for a workout, one point per day, week or month.
+
+    Args:
+        tag: The workout tag.
+        user: The username of the user.
+        period: 'day', 'week' or 'month'.
+        field: 'max_weight' (heaviest set), 'volume' (weight x reps x sets) or 'e1rm' (best estimated one-rep max).
+
+    Returns:
+        A tuple of the first day of every bucket (day ordinals) and the value for that bucket.
+    """
+    key = (user, tag)
+    series = _rollup_series(key, period, field)
+    if series is None:
+        stamp = _write_stamp(user)
+        series = _build_rollup(key, storage.get_history(user, tag), stamp, period, field)
+    return series
+
+
+@timed
 def log_weight(weight: float, date: str, user: str) -> None:
     """
     Logs a user's weight for a specific date.
 
     Args:
         weight: The weight to log.
-        date: The date of the weight entry.
+        date: The date of the weight entry, as a day ordinal or a mm/dd/yyyy string.
         user: The username of the user.
     """
-    with open('userdata.json', 'r') as f:
-        userdata = json.load(f)
-    targetData = userdata[user]['weight']
-    if date in targetData['dates']:
-        index = targetData['dates'].index(date)
-        targetData['weight'][index] = weight
-    else:
-        targetData['dates'].append(date)
-        targetData['weight'].append(int(weight))
-    with open('userdata.json', 'w') as f:
-        f.write(json.dumps(userdata))
+    with _writing(user):
+        storage.log_weight(user, to_ordinal(date), int(weight))
+
+
+@timed
+def flush_writes() -> None:
+    """
+    Makes sure every write so far is saved, including ones the storage is holding back (write-back caching, or the
+    journal's batched fsyncs). Called on logout and when the window closes.
+    """
+    flush = getattr(storage, 'flush', None)
+    if flush is not None:
+        flush()
 
 
+@timed
 def pull_workouts() -> List[str]:
     """
     Retrieves a list of all workout names.
@@ -349,14 +499,10 @@ def pull_workouts() -> List[str]:
     Returns:
         A list of workout names.
     """
-    with open('workouts.json', 'r') as f:
-        workouts = json.load(f)
-    out_list = []
-    for workout in workouts:
-        out_list.append(workouts[workout]['name'])
-    return out_list
+    return list(catalog.all_names())
 
 
+@timed
 def get_workout_id(name: str) -> str:
     """
     Retrieves the workout ID for a given workout name.
@@ -367,9 +513,100 @@ def get_workout_id(name: str) -> str:
     Returns:
         The ID of the workout.
     """
-    with open('workouts.json', 'r') as f:
-        workouts = json.load(f)
+    return catalog.id_for(name)
+
+
+# asyncio versions of the functions above, for servers and scripts that serve many users from one process. Storage
+# calls run on a worker thread and writes from requests in flight at the same time share one flush to disk. Like the
+# blocking versions they share the caches in this module, so they must all run on the same event loop.
+
+def _async_driver():
+    global _async_storage
+    if _async_storage is None:
+        # Imported here so the GUI doesn't pay for asyncio at startup
+        from async_storage import AsyncStorage
+        _async_storage = AsyncStorage(storage)
+    return _async_storage
+
+
+@timed
+async def async_run_login(username: str, password: str) -> Tuple[bool, int]:
+    """
+    run_login, off the event loop.
+    """
+    return await _async_driver().run(run_login, username, password)
+
+
+@timed
+async def async_run_account_create(username: str, password: str) -> Tuple[bool, int]:
+    """
+    run_account_create, off the event loop.
+    """
+    return await _async_driver().run(run_account_create, username, password)
+
+
+@timed
+async def async_pick_workout(day: str, user: str) -> List[str]:
+    """
+    pick_workout, off the event loop (the first session for a user reads their record).
+    """
+    return await _async_driver().run(pick_workout, day, user)
+
 
-    for workout in workouts:
-        if workouts[workout]['name'] == name:
-            return workout
+@timed
+async def async_submit_session(user: str, entries: Dict[str, str]) -> Dict[str, int]:
+    """
+    submit_session, with the write group committed together with other requests' writes.
+    """
+    results, rows = _session_rows(entries)
+    if rows:
+        with _writing(user):
+            await _async_driver().append_sets(user, rows)
+            _sets_saved(user, rows)
+    return results
+
+
+@timed
+async def async_log_weight(weight: float, date, user: str) -> None:
+    """
+    log_weight, with the write group committed together with other requests' writes.
+    """
+    with _writing(user):
+        await _async_driver().log_weight(user, to_ordinal(date), int(weight))
+
+
+@timed
+async def async_get_points(tag: str, focus: str, user: str) -> Tuple[Sequence[int], Sequence[int]]:
+    """
+    get_points, off the event loop.
+    """
+    history = await _async_driver().get_history(user, tag)
+    return history.dates, history[focus]
+
+
+@timed
+async def async_get_plot_points(tag: str, focus: str, user: str, width: int,
+                                method: str = 'lttb') -> Tuple[Sequence[int], Sequence[int]]:
+    """
+    get_plot_points, off the event loop.
+    """
+    key = (user, tag, focus, width, method)
+    points = _cache_get(_plot_cache, key)
+    if points is None:
+        stamp = _write_stamp(user)
+        points = _downsample(*await async_get_points(tag, focus, user), width, method)
+        _cache_plot(key, points, stamp)
+    return points
+
+
+@timed
+async def async_get_rollup(tag: str, user: str, period: str, field: str) -> Tuple[Sequence[int], Sequence[int]]:
+    """
+    get_rollup, off the event loop.
+    """
+    key = (user, tag)
+    series = _rollup_series(key, period, field)
+    if series is None:
+        stamp = _write_stamp(user)
+        series = _build_rollup(key, await _async_driver().get_history(user, tag), stamp, period, field)
+    return series
@@ -0,0 +1,240 @@
+"""
+Runs a transform over every user record on several processes, for offline jobs over the whole user base:
+
+    python recompute.py recompute:ordinal_dates [--backend json] [--workers 4] [--checkpoint dates.ckpt]
+
+The transform is given as module:function and is called like the change function of Storage.update_user: it gets a
+user's record, changes it in place and returns False if there was nothing to change. It has to be importable by the
+worker processes and safe to run twice on the same record, because a job that is stopped part way through is picked
+up from its checkpoint and redoes whatever it hadn't saved yet. Two come with this module: ordinal_dates (turns
+dates still stored as mm/dd/yyyy strings into day ordinals) and sparse (drops workouts without any logged sets).
+
+Users are split into chunks that the workers transform in parallel. On the json, sharded and sqlite backends each
+worker reads its own chunk straight from storage, the others can't be opened by several processes so the chunks are
+read here and sent over. Changed records come back here and are saved every --save-every seconds with one
+Storage.commit_many (a single all-or-nothing rewrite on the json backend). A record that someone else changed while
+it was being worked on is transformed again from the fresh copy. After every save the users in it are added to the
+checkpoint file, which is removed once the job finishes.
+"""
+import argparse
+import concurrent.futures
+import importlib
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from history import to_ordinal
+from storage import open_storage, record_version
+
+# Backends several processes can read at once
+SHARED_BACKENDS = ('json', 'sharded', 'sqlite')
+
+
+def ordinal_dates(record: Dict) -> bool:
+    """
+    Transform that stores every date in the record as a day ordinal.
+    """
+    changed = False
+    for key, lists in record.items():
+        if key in ('info', 'planner') or not isinstance(lists, dict):
+            continue
+        dates = lists.get('dates', [])
+        if any(isinstance(date, str) for date in dates):
+            lists['dates'] = [to_ordinal(date) for date in dates]
+            changed = True
+    return changed
+
+
+def sparse(record: Dict) -> bool:
+    """
+    Transform that drops the empty histories older versions added for every workout in the catalog.
+    """
+    empty = [key for key, lists in record.items()
+             if key not in ('info', 'weight', 'planner') and isinstance(lists, dict) and not lists.get('dates')]
+    for key in empty:
+        del record[key]
+    return bool(empty)
+
+
+def load_transform(spec: str) -> Callable[[Dict], Optional[bool]]:
+    """
+    Args:
+        spec: module:function, e.g. recompute:sparse.
+
+    Returns:
+        The function.
+    """
+    module, _, name = spec.partition(':')
+    if not name:
+        raise ValueError(f'Transform should look like module:function, got {spec!r}')
+    return getattr(importlib.import_module(module), name)
+
+
+def transform_chunk(kind: str, path: str, spec: str, users: List[str],
+                    records: Optional[List[Tuple[str, Dict]]] = None) -> List[Tuple[str, Dict, int]]:
+    """
+    Runs in a worker process. Transforms one chunk of users.
+
+    Args:
+        kind: Storage backend name.
+        path: Storage path.
+        spec: The transform as module:function.
+        users: The users in the chunk.
+        records: The chunk's (user, record) pairs, read here from storage if not given.
+
+    Returns:
+        (user, changed record, version it was read at) for every record the transform changed.
+    """
+    transform = load_transform(spec)
+    storage = None
+    if records is None:
+        storage = open_storage(kind, path)
+        records = storage.load_users(users)
+    changes = []
+    try:
+        for user, record in records:
+            version = record_version(record)
+            if transform(record) is not False:
+                changes.append((user, record, version))
+    finally:
+        if storage is not None:
+            storage.close()
+    return changes
+
+
+def _read_checkpoint(path: Optional[str], spec: str) -> List[str]:
+    if path is None or not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        checkpoint = json.load(f)
+    if checkpoint['transform'] != spec:
+        raise ValueError(f'{path} is a checkpoint for {checkpoint["transform"]}, not {spec}')
+    return checkpoint['done']
+
+
+def _write_checkpoint(path: str, spec: str, done: List[str]) -> None:
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'transform': spec, 'done': done}, f)
+    os.replace(tmp_path, path)
+
+
+def recompute(kind: str, path: Optional[str], spec: str, workers: Optional[int] = None,
+              chunk_size: Optional[int] = None, save_every: float = 10.0, checkpoint: Optional[str] = None,
+              dry_run: bool = False, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+    """
+    Applies a transform to every user record, spread over worker processes.
+
+    Args:
+        kind: Storage backend name, from storage.BACKENDS.
+        path: Storage path, None for the backend's default.
+        spec: The transform as module:function.
+        workers: Number of worker processes, one per core if None.
+        chunk_size: Users sent to a worker at a time. Defaults to 100, or for the json backend (where reading any
+            chunk parses the whole file) to a quarter of each worker's share.
+        save_every: Seconds between saving finished chunks and the checkpoint. On the json backend every save
+            rewrites the file, so saving after each chunk would stop the job from scaling.
+        checkpoint: File recording which users are done, so a stopped job can carry on where it left off.
+        dry_run: Transform and count the changes but don't save anything.
+        progress: Called with (users done, total users) after every chunk.
+
+    Returns:
+        Counts of users 'seen', 'changed', 'conflicts' (transformed again because they changed during the job) and
+        'skipped' (already done according to the checkpoint).
+    """
+    transform = load_transform(spec)
+    storage = open_storage(kind, path)
+    path = storage.path
+    shared = kind in SHARED_BACKENDS
+    workers = workers or os.cpu_count() or 1
+    done = _read_checkpoint(checkpoint, spec)
+    finished = set(done)
+    users = [user for user in storage.users() if user not in finished]
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(users) // (4 * workers))) if kind == 'json' else 100
+    chunks = [users[i:i + chunk_size] for i in range(0, len(users), chunk_size)]
+    counts = {'seen': 0, 'changed': 0, 'conflicts': 0, 'skipped': len(finished)}
+    total = len(users) + len(finished)
+    # Transformed but not saved yet
+    unsaved_changes = []
+    unsaved_users = []
+
+    def save() -> None:
+        if not dry_run:
+            conflicts = storage.commit_many(unsaved_changes) if unsaved_changes else []
+            for user in conflicts:
+                storage.update_user(user, transform)
+            counts['conflicts'] += len(conflicts)
+        done.extend(unsaved_users)
+        if checkpoint is not None and not dry_run:
+            _write_checkpoint(checkpoint, spec, done)
+        unsaved_changes.clear()
+        unsaved_users.clear()
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            running = {}
+            next_chunk = 0
+            last_save = time.monotonic()
+            while running or next_chunk < len(chunks):
+                # Keep a couple of chunks per worker in flight, so the records sent over don't all sit in memory
+                while next_chunk < len(chunks) and len(running) < 2 * workers:
+                    chunk = chunks[next_chunk]
+                    records = None if shared else list(storage.load_users(chunk))
+                    running[pool.submit(transform_chunk, kind, path, spec, chunk, records)] = chunk
+                    next_chunk += 1
+                finished_futures, _ = concurrent.futures.wait(running,
+                                                              return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished_futures:
+                    chunk = running.pop(future)
+                    changes = future.result()
+                    unsaved_changes.extend(changes)
+                    unsaved_users.extend(chunk)
+                    counts['seen'] += len(chunk)
+                    counts['changed'] += len(changes)
+                    if progress is not None:
+                        progress(len(done) + len(unsaved_users), total)
+                if time.monotonic() - last_save >= save_every:
+                    save()
+                    last_save = time.monotonic()
+            save()
+    finally:
+        storage.close()
+
+    if checkpoint is not None and os.path.exists(checkpoint) and not dry_run:
+        os.remove(checkpoint)
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('transform', help='module:function to apply, e.g. recompute:sparse')
+    parser.add_argument('--backend', default=None, help='storage backend, defaults to WORKOUT_STORAGE or json')
+    parser.add_argument('--path', default=None, help='storage path, defaults to WORKOUT_DATA or the backend default')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, one per core by default')
+    parser.add_argument('--chunk', type=int, default=None, help='users sent to a worker at a time')
+    parser.add_argument('--save-every', type=float, default=10.0, help='seconds between saves and checkpoints')
+    parser.add_argument('--checkpoint', default=None, help='file to resume from and record progress in')
+    parser.add_argument('--dry-run', action='store_true', help="count what would change but don't save it")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+
+    def progress(done: int, total: int) -> None:
+        elapsed = time.perf_counter() - start
+        print(f'\r{done}/{total} users, {done / max(elapsed, 1e-9):.0f} users/s', end='', file=sys.stderr, flush=True)
+
+    kind = args.backend or os.environ.get('WORKOUT_STORAGE', 'json')
+    counts = recompute(kind, args.path, args.transform, args.workers, args.chunk, args.save_every, args.checkpoint,
+                       args.dry_run, progress)
+    print(file=sys.stderr)
+    verb = 'would change' if args.dry_run else 'changed'
+    print(f'{counts["seen"]} users transformed, {counts["changed"]} {verb}, {counts["conflicts"]} redone after '
+          f'conflicts, {counts["skipped"]} skipped from the checkpoint', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import datetime
+from array import array
+from typing import Dict, Sequence, Tuple
+
+from history import History
+
+PERIODS = ('day', 'week', 'month')
+FIELDS = ('max_weight', 'volume', 'e1rm')
+
+
+def estimate_1rm(weight: int, reps: int) -> float:
+    """
+    Estimated one-rep max using the Epley formula, weight * (1 + reps / 30).
+
+    Args:
+        weight: Weight lifted.
+        reps: Reps done with it.
+
+    Returns:
+        The estimated one-rep max, or just the weight for a single rep.
+    """
+    if reps <= 1:
+        return float(weight)
+    return weight * (1 + reps / 30)
+
+
+def bucket_start(ordinal: int, period: str) -> int:
+    """
+    Args:
+        ordinal: A date as a day ordinal.
+        period: 'day', 'week' (weeks start on Monday) or 'month'.
+
+    Returns:
+        The day ordinal of the first day of the bucket the date falls in.
+    """
+    if period == 'day':
+        return ordinal
+    date = datetime.date.fromordinal(ordinal)
+    if period == 'week':
+        return ordinal - date.weekday()
+    if period == 'month':
+        return date.replace(day=1).toordinal()
+    raise ValueError(f'Unknown period: {period}')
+
+
+class Bucket:
+    """
+    Aggregates of every set logged in one day, week or month.
+    """
+    __slots__ = ('max_weight', 'volume', 'e1rm', 'count')
+
+    def __init__(self):
+        self.max_weight = 0
+        self.volume = 0
+        self.e1rm = 0.0
+        self.count = 0
+
+    def add(self, weight: int, reps: int, sets: int) -> None:
+        self.max_weight = max(self.max_weight, weight) if self.count else weight
+        self.volume += weight * reps * sets
+        self.e1rm = max(self.e1rm, estimate_1rm(weight, reps)) if self.count else estimate_1rm(weight, reps)
+        self.count += 1
+
+
+class Rollup:
+    """
+    Daily, weekly and monthly aggregates of one user's history for one exercise: heaviest weight, total volume
+    (weight x reps x sets) and best estimated one-rep max.
+
+    It is built once from the history and then kept up to date one set at a time with add, so reading a trend only
+    touches one value per bucket instead of every set ever logged.
+    """
+    def __init__(self):
+        self.buckets: Dict[str, Dict[int, Bucket]] = {period: {} for period in PERIODS}
+
+    @classmethod
+    def from_history(cls, history: History) -> 'Rollup':
+        """
+        Args:
+            history: The exercise's history, needs weight, reps and sets columns.
+
+        Returns:
+            The rollup of every set in it.
+        """
+        rollup = cls()
+        weights = history['weight']
+        reps = history['reps']
+        sets = history['sets']
+        # Exercises without a weight (e.g. cardio) have nothing to roll up
+        for i in range(min(len(history.dates), len(weights))):
+            rollup.add(history.dates[i], weights[i], reps[i] if i < len(reps) else 1, sets[i] if i < len(sets) else 1)
+        return rollup
+
+    def add(self, ordinal: int, weight: int, reps: int, sets: int) -> None:
+        """
+        Adds one logged set to the day, week and month it belongs to.
+
+        Args:
+            ordinal: Date of the set as a day ordinal.
+            weight: Weight lifted.
+            reps: Reps per set.
+            sets: Number of sets.
+        """
+        for period in PERIODS:
+            start = bucket_start(ordinal, period)
+            bucket = self.buckets[period].get(start)
+            if bucket is None:
+                bucket = self.buckets[period][start] = Bucket()
+            bucket.add(weight, reps, sets)
+
+    def series(self, period: str, field: str) -> Tuple[Sequence[int], Sequence[int]]:
+        """
+        Args:
+            period: 'day', 'week' or 'month'.
+            field: 'max_weight', 'volume' or 'e1rm'.
+
+        Returns:
+            The first day of every bucket (day ordinals, in order) and the field's value for each bucket, ready to
+            plot like get_points.
+        """
+        if field not in FIELDS:
+            raise ValueError(f'Unknown field: {field}')
+        buckets = self.buckets[period]
+        starts = sorted(buckets)
+        return array('i', starts), array('i', [round(getattr(buckets[start], field)) for start in starts])
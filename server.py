@@ -0,0 +1,276 @@
+"""
+Headless server that exposes processing.py over HTTP, for scripts, kiosks and load tests:
+
+    python server.py [--host 127.0.0.1] [--port 8765] [--unix /tmp/workout.sock] [--backend journal]
+
+Endpoints (JSON in and out, parameters go in the query string or the JSON body):
+    POST /login         username, password           -> {"ok": bool, "code": int}
+    POST /accounts      username, password           -> {"ok": bool, "code": int}
+    GET  /session       user, day                    -> {"workouts": [{"name": str, "attributes": str}, ...]}
+    POST /sets          user, entries {name: "text"} -> {"results": {name: code}}
+    POST /weigh-ins     user, weight, date (ordinal or mm/dd/yyyy, optional) -> {"ok": true}
+    GET  /points        user, tag, focus, width (optional, up to 4096) -> {"dates": [ordinals], "values": [ints]}
+    GET  /metrics       latency histograms and I/O counters in Prometheus text format (needs WORKOUT_METRICS=1)
+
+Codes are the same ones processing.py returns to the GUI. The server keeps one storage open for its whole life, the
+journal backend by default so all user data stays in memory, and the catalog is loaded once. Connections are handled
+by asyncio and kept alive, and requests go through processing.py's async_ functions, so storage reads run off the
+event loop and writes from concurrent requests are group committed.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import sys
+import urllib.parse
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import instrument
+import processing
+from history import parse_date
+from storage import open_storage
+
+log = logging.getLogger(__name__)
+
+# Widest graph /points will downsample for, so clients can't fill the plot cache with arbitrary widths
+MAX_WIDTH = 4096
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class BadRequest(Exception):
+    """
+    Raised by an endpoint when a parameter is missing or has the wrong type.
+    """
+
+
+def _param(params: Dict[str, Any], name: str, kind: type = str, default: Any = None) -> Any:
+    if name not in params:
+        if default is not None:
+            return default
+        raise BadRequest(f'missing parameter: {name}')
+    try:
+        return kind(params[name])
+    except (TypeError, ValueError):
+        raise BadRequest(f'bad value for {name}')
+
+
+def _date(params: Dict[str, Any], name: str) -> int:
+    """
+    Reads a date parameter given as a day ordinal or as mm/dd/yyyy, checked like validate_entry checks typed dates.
+    Defaults to today.
+    """
+    value = params.get(name)
+    if value is None:
+        return datetime.date.today().toordinal()
+    try:
+        if isinstance(value, int) or str(value).isdigit():
+            # Out of range ordinals raise here instead of when the date is shown
+            return datetime.date.fromordinal(int(value)).toordinal()
+        return parse_date(str(value))
+    except (OverflowError, ValueError):
+        raise BadRequest(f'bad value for {name}, expected mm/dd/yyyy')
+
+
+async def login(params: Dict[str, Any]) -> Dict:
+    ok, code = await processing.async_run_login(_param(params, 'username'), _param(params, 'password'))
+    return {'ok': ok, 'code': code}
+
+
+async def create_account(params: Dict[str, Any]) -> Dict:
+    ok, code = await processing.async_run_account_create(_param(params, 'username'), _param(params, 'password'))
+    return {'ok': ok, 'code': code}
+
+
+async def session(params: Dict[str, Any]) -> Dict:
+    day = _param(params, 'day', default=datetime.date.today().strftime('%A'))
+    workouts = await processing.async_pick_workout(day, _param(params, 'user'))
+    return {'workouts': [{'name': name, 'attributes': processing.get_attributes(name)} for name in workouts]}
+
+
+async def submit_sets(params: Dict[str, Any]) -> Dict:
+    entries = _param(params, 'entries', dict)
+    return {'results': await processing.async_submit_session(_param(params, 'user'), entries)}
+
+
+async def weigh_in(params: Dict[str, Any]) -> Dict:
+    date = _date(params, 'date')
+    await processing.async_log_weight(_param(params, 'weight', float), date, _param(params, 'user'))
+    return {'ok': True}
+
+
+async def points(params: Dict[str, Any]) -> Dict:
+    user = _param(params, 'user')
+    tag = _param(params, 'tag', default='weight')
+    focus = _param(params, 'focus', default='weight')
+    if 'width' in params:
+        # Below 3 points the downsampling keeps every point anyway
+        width = min(max(_param(params, 'width', int), 3), MAX_WIDTH)
+        x, y = await processing.async_get_plot_points(tag, focus, user, width)
+    else:
+        x, y = await processing.async_get_points(tag, focus, user)
+    return {'dates': list(x), 'values': list(y)}
+
+
+async def metrics(params: Dict[str, Any]) -> str:
+    return instrument.render_prometheus()
+
+
+# (method, path) -> endpoint
+ROUTES: Dict[Tuple[str, str], Callable[[Dict[str, Any]], Awaitable[Any]]] = {
+    ('POST', '/login'): login,
+    ('POST', '/accounts'): create_account,
+    ('GET', '/session'): session,
+    ('POST', '/sets'): submit_sets,
+    ('POST', '/weigh-ins'): weigh_in,
+    ('GET', '/points'): points,
+    ('GET', '/metrics'): metrics,
+}
+
+
+class Server:
+    """
+    Speaks just enough HTTP/1.1 (keep-alive, Content-Length bodies) to serve the endpoints in ROUTES.
+    """
+    def __init__(self):
+        self.requests = 0
+
+    async def dispatch(self, method: str, target: str, body: bytes) -> Tuple[int, Any]:
+        """
+        Args:
+            method: The HTTP method.
+            target: The request path with its query string.
+            body: The request body, JSON or empty.
+
+        Returns:
+            The status code and the JSON response (or text, for /metrics).
+        """
+        url = urllib.parse.urlsplit(target)
+        endpoint = ROUTES.get((method, url.path))
+        if endpoint is None:
+            if any(path == url.path for _, path in ROUTES):
+                return 405, {'error': f'{method} not allowed on {url.path}'}
+            return 404, {'error': f'no endpoint {url.path}'}
+
+        params: Dict[str, Any] = dict(urllib.parse.parse_qsl(url.query))
+        if body:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                return 400, {'error': 'body is not JSON'}
+            if not isinstance(payload, dict):
+                return 400, {'error': 'body must be a JSON object'}
+            params.update(payload)
+
+        try:
+            return 200, await endpoint(params)
+        except BadRequest as e:
+            return 400, {'error': str(e)}
+        except KeyError as e:
+            return 404, {'error': f'not found: {e}'}
+        except Exception as e:
+            return 500, {'error': f'{type(e).__name__}: {e}'}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serves one connection until the client closes it or asks to.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    # Without the length there's no telling where the next request starts, so close afterwards
+                    await self.respond(writer, 400, {'error': 'bad Content-Length header'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self.dispatch(method, target, body)
+                self.requests += 1
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool) -> None:
+        """
+        Writes one response, JSON or (for a str payload) plain text.
+        """
+        if isinstance(payload, str):
+            data = payload.encode('utf-8')
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            data = json.dumps(payload).encode('utf-8')
+            content_type = 'application/json'
+        head = [f'HTTP/1.1 {status} {REASONS[status]}', f'Content-Type: {content_type}',
+                f'Content-Length: {len(data)}']
+        if not keep_alive:
+            head.append('Connection: close')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+        await writer.drain()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765, unix: Optional[str] = None) -> None:
+        """
+        Listens until cancelled.
+
+        Args:
+            host: Address to listen on.
+            port: TCP port, 0 picks a free one.
+            unix: Listen on this Unix socket path instead of TCP.
+        """
+        if unix is not None:
+            server = await asyncio.start_unix_server(self.handle, path=unix)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        for sock in server.sockets:
+            log.info('listening', extra={'fields': {'address': str(sock.getsockname())}})
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help='listen on a Unix socket path instead of TCP')
+    parser.add_argument('--backend', default='journal', help='storage backend, journal keeps everything in memory')
+    parser.add_argument('--path', default=None, help='storage path, defaults to WORKOUT_DATA or the backend default')
+    args = parser.parse_args(argv)
+
+    instrument.configure_logging()
+    processing.use_storage(open_storage(args.backend, args.path))
+    # Load the catalog up front instead of on the first request
+    processing.catalog.refresh()
+    try:
+        asyncio.run(Server().serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        processing.storage.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import urllib.parse
+from typing import Dict, List
+
+import instrument
+from locking import file_lock
+from storage import Storage, record_version
+
+
+class ShardedStorage(Storage):
+    """
+    Gives every user their own JSON file under a directory, spread over hash buckets so no directory gets too big:
+
+        userdata.d/<first two hex digits of sha1(username)>/<url-quoted username>.json
+
+    A write only rewrites the one user's file (through a temp file and a rename, so a reader never sees half a file),
+    which means different users never touch each other's bytes and can be written at the same time. Each shard has
+    its own lock file, so processes sharing the directory only ever wait on writers of the same user.
+    """
+    def __init__(self, path: str = 'userdata.d'):
+        """
+        Args:
+            path: The directory holding the shards, created if it doesn't exist.
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def shard_path(self, user: str) -> str:
+        """
+        Args:
+            user: The username of the user.
+
+        Returns:
+            The file that holds that user's record.
+        """
+        bucket = hashlib.sha1(user.encode('utf-8')).hexdigest()[:2]
+        return os.path.join(self.path, bucket, urllib.parse.quote(user, safe='') + '.json')
+
+    def users(self) -> List[str]:
+        names = []
+        for bucket in sorted(os.listdir(self.path)):
+            bucket_path = os.path.join(self.path, bucket)
+            if not os.path.isdir(bucket_path):
+                continue
+            for filename in sorted(os.listdir(bucket_path)):
+                if filename.endswith('.json'):
+                    names.append(urllib.parse.unquote(filename[:-len('.json')]))
+        return names
+
+    def has_user(self, user: str) -> bool:
+        return os.path.exists(self.shard_path(user))
+
+    def _read(self, path: str) -> Dict:
+        with open(path, 'r') as f:
+            return instrument.load_json(f)
+
+    def _write(self, path: str, record: Dict) -> None:
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            instrument.write_json(f, record)
+        os.replace(tmp_path, path)
+
+    def load_user(self, user: str) -> Dict:
+        path = self.shard_path(user)
+        if not os.path.exists(path):
+            raise KeyError(user)
+        with file_lock(path + '.lock', shared=True):
+            return self._read(path)
+
+    def save_user(self, user: str, record: Dict) -> None:
+        path = self.shard_path(user)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with file_lock(path + '.lock'):
+            self._write(path, record)
+
+    def commit(self, user: str, record: Dict, version: int) -> bool:
+        path = self.shard_path(user)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with file_lock(path + '.lock'):
+            if os.path.exists(path) and record_version(self._read(path)) != version:
+                return False
+            record.setdefault('info', {})['version'] = version + 1
+            self._write(path, record)
+        return True
@@ -0,0 +1,722 @@
+import importlib
+import json
+import os
+import random
+import sqlite3
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import instrument
+from history import History, Sidecar, date_index, format_date, to_ordinal, write_sidecar
+from locking import file_lock
+
+
+class ConflictError(Exception):
+    """
+    Raised when a user's record kept changing under an update until it ran out of retries.
+    """
+
+
+def record_version(record: Dict) -> int:
+    """
+    Args:
+        record: A user record.
+
+    Returns:
+        The record's version counter, bumped on every committed write. It lives in the record's info block.
+    """
+    return record.get('info', {}).get('version', 0)
+
+
+def apply_sets(record: Dict, rows: List[Tuple[str, Dict[str, Any]]]) -> None:
+    """
+    Appends logged sets to a user record in place. Records only hold the workouts the user has logged, a workout's
+    history is created by its first set.
+
+    Args:
+        record: The user's record.
+        rows: (workout id, entry) pairs.
+    """
+    for workout_id, entry in rows:
+        history = record.get(workout_id)
+        if history is None:
+            history = record[workout_id] = {attribute: [] for attribute in entry}
+        for attribute, value in entry.items():
+            history[attribute].append(value)
+
+
+def apply_weight(record: Dict, ordinal: int, weight: int, index: Optional[Dict[int, int]] = None) -> None:
+    """
+    Records a weigh-in in a user record in place, replacing any earlier weigh-in on the same day.
+
+    Args:
+        record: The user's record.
+        ordinal: The date as a day ordinal.
+        weight: The weight.
+        index: date_index of the record's weigh-ins, kept up to date here. Callers that hold the record in memory
+            between writes (the journal, the cache) keep it too, so a weigh-in is a dict lookup. Without it the
+            dates are scanned, which costs about as much as the decode of the record those callers just did.
+    """
+    target_data = record['weight']
+    if index is None:
+        index = date_index(target_data['dates'])
+    position = index.get(ordinal)
+    if position is not None:
+        target_data['dates'][position] = ordinal
+        target_data['weight'][position] = weight
+    else:
+        index[ordinal] = len(target_data['dates'])
+        target_data['dates'].append(ordinal)
+        target_data['weight'].append(weight)
+
+
+def apply_writes(record: Dict, ops: List[Tuple], weight_index: Optional[Dict[int, int]] = None) -> None:
+    """
+    Applies write operations (see Storage.write_batch) for one user to their record in place.
+
+    Args:
+        record: The user's record.
+        ops: The user's operations.
+        weight_index: As for apply_weight. Without it the weigh-in index is built once for all the ops.
+    """
+    for op in ops:
+        if op[0] == 'sets':
+            apply_sets(record, op[2])
+        else:
+            if weight_index is None:
+                weight_index = date_index(record['weight']['dates'])
+            apply_weight(record, to_ordinal(op[2]), op[3], weight_index)
+
+
+class Storage:
+    """
+    Interface processing.py uses to read and write user data. Subclasses only have to provide load_user, save_user
+    and users, everything else has a default built on top of those that a backend can override with something
+    cheaper.
+    """
+    # True if write_batch saves either every operation or none of them, even across users
+    atomic_batches = False
+
+    def users(self) -> List[str]:
+        """
+        Returns:
+            Every username that has data stored.
+        """
+        raise NotImplementedError
+
+    def has_user(self, user: str) -> bool:
+        """
+        Args:
+            user: The username of the user.
+
+        Returns:
+            True if the user has a record.
+        """
+        return user in self.users()
+
+    def load_user(self, user: str) -> Dict:
+        """
+        Args:
+            user: The username of the user.
+
+        Returns:
+            The user's full record, in the same shape as an entry of userdata.json.
+        """
+        raise NotImplementedError
+
+    def save_user(self, user: str, record: Dict) -> None:
+        """
+        Replaces the user's full record.
+
+        Args:
+            user: The username of the user.
+            record: The record to store.
+        """
+        raise NotImplementedError
+
+    def create_user(self, user: str, record: Dict) -> None:
+        """
+        Stores the record for a brand-new user.
+
+        Args:
+            user: The username of the user.
+            record: The starting record (info, weight and planner).
+        """
+        self.save_user(user, record)
+
+    def get_planner(self, user: str) -> Dict[str, List[str]]:
+        """
+        Args:
+            user: The username of the user.
+
+        Returns:
+            The user's weekly planner, day name to list of groups.
+        """
+        return self.load_user(user)['planner']
+
+    def load_versioned(self, user: str) -> Tuple[Dict, int]:
+        """
+        Args:
+            user: The username of the user.
+
+        Returns:
+            The user's record and the version it was read at, for passing to commit.
+        """
+        record = self.load_user(user)
+        return record, record_version(record)
+
+    def commit(self, user: str, record: Dict, version: int) -> bool:
+        """
+        Saves the record only if nobody has committed a change to the user since it was read (compare-and-swap).
+        Backends that can't be shared between processes just save it.
+
+        Args:
+            user: The username of the user.
+            record: The changed record.
+            version: The version load_versioned returned.
+
+        Returns:
+            True if the record was saved, False if it changed in the meantime.
+        """
+        record.setdefault('info', {})['version'] = version + 1
+        self.save_user(user, record)
+        return True
+
+    def commit_many(self, changes: List[Tuple[str, Dict, int]]) -> List[str]:
+        """
+        commit for several users at once. Backends that can write them all in one go do it all-or-nothing.
+
+        Args:
+            changes: (user, changed record, version it was read at) triples.
+
+        Returns:
+            The users that weren't saved because their record changed in the meantime.
+        """
+        return [user for user, record, version in changes if not self.commit(user, record, version)]
+
+    def update_user(self, user: str, change: Callable[[Dict], Optional[bool]], retries: int = 50) -> Dict:
+        """
+        Read-modify-write of one user's record that retries if another writer got there first.
+
+        Args:
+            user: The username of the user.
+            change: Changes the record in place. Returning False means there was nothing to change.
+            retries: How many conflicts to put up with before giving up.
+
+        Returns:
+            The record as it was saved.
+        """
+        for attempt in range(retries):
+            record, version = self.load_versioned(user)
+            if change(record) is False:
+                return record
+            if self.commit(user, record, version):
+                return record
+            # Back off a little so writers that collided don't collide again straight away
+            time.sleep(random.uniform(0, 0.002 * (attempt + 1)))
+        raise ConflictError(f'Gave up updating {user} after {retries} conflicting writes')
+
+    def append_set(self, user: str, workout_id: str, entry: Dict[str, Any]) -> None:
+        """
+        Adds one logged set to a workout's history.
+
+        Args:
+            user: The username of the user.
+            workout_id: The workout id.
+            entry: Attribute name to value, e.g. {'dates': '12/12/2024', 'weight': 135, ...}.
+        """
+        self.append_sets(user, [(workout_id, entry)])
+
+    def append_sets(self, user: str, rows: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """
+        Adds several logged sets in one write.
+
+        Args:
+            user: The username of the user.
+            rows: (workout id, entry) pairs, with entries shaped like in append_set.
+        """
+        self.update_user(user, lambda record: apply_sets(record, rows))
+
+    def log_weight(self, user: str, date, weight: int) -> None:
+        """
+        Records a weigh-in, replacing any earlier weigh-in on the same date.
+
+        Args:
+            user: The username of the user.
+            date: The date of the weigh-in, as a day ordinal (a date string is converted). It is stored as an ordinal.
+            weight: The weight to store.
+        """
+        ordinal = to_ordinal(date)
+        self.update_user(user, lambda record: apply_weight(record, ordinal, weight))
+
+    def write_batch(self, ops: List[Tuple]) -> None:
+        """
+        Applies several writes at once, possibly for different users, with as few commits as the backend can manage.
+        Used to group writes that arrive at the same time into one flush. Each user's writes are saved together or
+        not at all, across users only if atomic_batches is set.
+
+        Args:
+            ops: ('sets', user, rows) like append_sets, or ('weight', user, date, weight) like log_weight.
+        """
+        by_user = {}
+        for op in ops:
+            by_user.setdefault(op[1], []).append(op)
+        for user, user_ops in by_user.items():
+            self.update_user(user, lambda record, user_ops=user_ops: apply_writes(record, user_ops))
+
+    def get_points(self, user: str, tag: str, focus: str) -> Tuple[List, List]:
+        """
+        Args:
+            user: The username of the user.
+            tag: The workout id, or 'weight' for weigh-ins.
+            focus: The attribute to return next to the dates.
+
+        Returns:
+            The dates and the matching values of the focus attribute, empty if the user never logged the workout.
+        """
+        target_data = self.load_user(user).get(tag, {})
+        return target_data.get('dates', []), target_data.get(focus, [])
+
+    def all_records(self) -> Iterator[Tuple[str, Dict]]:
+        """
+        Walks every user's record, for reports over the whole user base.
+
+        Returns:
+            (username, record) pairs, one user at a time.
+        """
+        return self.load_users(self.users())
+
+    def load_users(self, users: List[str]) -> Iterator[Tuple[str, Dict]]:
+        """
+        Args:
+            users: The usernames to read.
+
+        Returns:
+            (username, record) pairs, one user at a time.
+        """
+        for user in users:
+            yield user, self.load_user(user)
+
+    def get_history(self, user: str, tag: str) -> History:
+        """
+        Args:
+            user: The username of the user.
+            tag: The workout id, or 'weight' for weigh-ins.
+
+        Returns:
+            The history in column form, ready to plot. Empty if the user never logged the workout.
+        """
+        return History.from_lists(self.load_user(user).get(tag, {}))
+
+    def close(self) -> None:
+        """
+        Releases anything the backend is holding open.
+        """
+        pass
+
+
+class JSONStorage(Storage):
+    """
+    The original layout, every user in one JSON file that is read and rewritten whole.
+
+    Several processes can share the file: reads take a shared lock on path + '.lock', writes take an exclusive one
+    and replace the file through a rename, and commit refuses to write over a version it didn't read.
+
+    Histories are kept in a binary sidecar (path + '.hist') that is mapped into memory, so drawing a graph doesn't
+    parse the JSON or any dates. The first graph builds it from the whole file, after that every write re-encodes
+    only the users it changed and copies the other histories over as they are.
+    """
+    atomic_batches = True
+
+    def __init__(self, path: str = 'userdata.json'):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.sidecar_path = path + '.hist'
+        self._sidecar = None
+        if not os.path.exists(path):
+            with file_lock(self.lock_path):
+                if not os.path.exists(path):
+                    self._write({}, [])
+
+    def _read(self) -> Dict:
+        with file_lock(self.lock_path, shared=True):
+            with open(self.path, 'r') as f:
+                return instrument.load_json(f)
+
+    def _write(self, userdata: Dict, changed: List[str]) -> None:
+        """
+        Replaces the file through a rename so nobody reads it half written, then brings the sidecar up to date.
+        Caller holds the exclusive lock.
+
+        Args:
+            userdata: Every user's record.
+            changed: The users whose records changed since the file was read.
+        """
+        old_stamp = self._stamp() if os.path.exists(self.path) else None
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            instrument.write_json(f, userdata)
+        os.replace(tmp_path, self.path)
+        self._update_sidecar(userdata, set(changed), old_stamp)
+
+    def users(self) -> List[str]:
+        return list(self._read())
+
+    def load_user(self, user: str) -> Dict:
+        return self._read()[user]
+
+    def all_records(self) -> Iterator[Tuple[str, Dict]]:
+        # One parse of the file instead of one per user
+        return iter(self._read().items())
+
+    def load_users(self, users: List[str]) -> Iterator[Tuple[str, Dict]]:
+        userdata = self._read()
+        return ((user, userdata[user]) for user in users)
+
+    def save_user(self, user: str, record: Dict) -> None:
+        with file_lock(self.lock_path):
+            with open(self.path, 'r') as f:
+                userdata = instrument.load_json(f)
+            userdata[user] = record
+            self._write(userdata, [user])
+
+    def commit(self, user: str, record: Dict, version: int) -> bool:
+        with file_lock(self.lock_path):
+            with open(self.path, 'r') as f:
+                userdata = instrument.load_json(f)
+            if user in userdata and record_version(userdata[user]) != version:
+                return False
+            record.setdefault('info', {})['version'] = version + 1
+            userdata[user] = record
+            self._write(userdata, [user])
+        return True
+
+    def commit_many(self, changes: List[Tuple[str, Dict, int]]) -> List[str]:
+        # One read and one rewrite of the file for all of them
+        with file_lock(self.lock_path):
+            with open(self.path, 'r') as f:
+                userdata = instrument.load_json(f)
+            conflicts = []
+            for user, record, version in changes:
+                if user in userdata and record_version(userdata[user]) != version:
+                    conflicts.append(user)
+                    continue
+                record.setdefault('info', {})['version'] = version + 1
+                userdata[user] = record
+            if len(conflicts) < len(changes):
+                self._write(userdata, [user for user, _, _ in changes if user not in conflicts])
+        return conflicts
+
+    def write_batch(self, ops: List[Tuple]) -> None:
+        # One read and one rewrite of the file for the whole batch
+        with file_lock(self.lock_path):
+            with open(self.path, 'r') as f:
+                userdata = instrument.load_json(f)
+            by_user = {}
+            for op in ops:
+                by_user.setdefault(op[1], []).append(op)
+            for user, user_ops in by_user.items():
+                record = userdata[user]
+                apply_writes(record, user_ops)
+                record.setdefault('info', {})['version'] = record_version(record) + 1
+            self._write(userdata, list(by_user))
+
+    def _open_sidecar(self) -> Optional[Sidecar]:
+        try:
+            return Sidecar(self.sidecar_path)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _update_sidecar(self, userdata: Dict, changed: set, old_stamp: Optional[Tuple[int, int]]) -> None:
+        """
+        Rewrites the sidecar for the file just written, re-encoding only the changed users' histories. Caller holds
+        the exclusive lock.
+        """
+        self._sidecar = None
+        old = self._open_sidecar()
+        if old is None or old.stamp != old_stamp:
+            # Nothing up to date to copy from, the next get_history builds it from scratch
+            try:
+                os.remove(self.sidecar_path)
+            except FileNotFoundError:
+                pass
+            return
+
+        def histories() -> Iterator[Tuple[str, Any]]:
+            for name, record in userdata.items():
+                for key, lists in record.items():
+                    if key in ('info', 'planner'):
+                        continue
+                    blob = None if name in changed else old.raw(f'{name}/{key}')
+                    yield f'{name}/{key}', History.from_lists(lists) if blob is None else blob
+
+        write_sidecar(self.sidecar_path, histories(), self._stamp())
+
+    def _stamp(self) -> Tuple[int, int]:
+        info = os.stat(self.path)
+        return info.st_mtime_ns, info.st_size
+
+    def get_history(self, user: str, tag: str) -> History:
+        if self._sidecar is None or self._sidecar.stamp != self._stamp():
+            # Under the lock, so a writer can't swap the file and the sidecar between the checks
+            with file_lock(self.lock_path, shared=True):
+                stamp = self._stamp()
+                self._sidecar = self._open_sidecar()
+                if self._sidecar is None or self._sidecar.stamp != stamp:
+                    with open(self.path, 'r') as f:
+                        userdata = instrument.load_json(f)
+                    write_sidecar(self.sidecar_path,
+                                  ((f'{name}/{key}', History.from_lists(lists))
+                                   for name, record in userdata.items()
+                                   for key, lists in record.items() if key not in ('info', 'planner')),
+                                  stamp)
+                    self._sidecar = Sidecar(self.sidecar_path)
+        history = self._sidecar.get(f'{user}/{tag}')
+        if history is None:
+            return History.from_lists({})
+        return history
+
+
+class SQLiteStorage(Storage):
+    """
+    Keeps user data in SQLite with one row per logged set or weigh-in, so logging only inserts a row and the graphs
+    only read the rows for one user and workout.
+
+    Every write bumps the version counter in the user's info, and commit checks it and rewrites the user inside one
+    BEGIN IMMEDIATE transaction, so the database can be shared by several processes like the json backend.
+    """
+    atomic_batches = True
+
+    def __init__(self, path: str = 'userdata.db'):
+        self.path = path
+        # Other processes may hold the write lock for a moment, wait for them instead of failing. The GUI opens the
+        # connection on the main thread and uses it from its I/O worker, so it can't be tied to one thread.
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                name TEXT PRIMARY KEY,
+                info TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE TABLE IF NOT EXISTS planner (
+                user TEXT NOT NULL,
+                day TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                grp TEXT NOT NULL,
+                PRIMARY KEY (user, day, position)
+            );
+            CREATE TABLE IF NOT EXISTS weight_log (
+                user TEXT NOT NULL,
+                date TEXT NOT NULL,
+                weight NOT NULL,
+                PRIMARY KEY (user, date)
+            );
+            CREATE TABLE IF NOT EXISTS workout_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user TEXT NOT NULL,
+                workout TEXT NOT NULL,
+                date TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS workout_log_user ON workout_log (user, workout, id);
+        """)
+        self.conn.commit()
+
+    def users(self) -> List[str]:
+        return [row[0] for row in self.conn.execute('SELECT name FROM users ORDER BY rowid')]
+
+    def has_user(self, user: str) -> bool:
+        return self.conn.execute('SELECT 1 FROM users WHERE name = ?', (user,)).fetchone() is not None
+
+    def get_planner(self, user: str) -> Dict[str, List[str]]:
+        planner = {day: [] for day in ('Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday',
+                                       'Saturday')}
+        rows = self.conn.execute('SELECT day, grp FROM planner WHERE user = ? ORDER BY day, position', (user,))
+        for day, group in rows:
+            planner.setdefault(day, []).append(group)
+        return planner
+
+    def load_user(self, user: str) -> Dict:
+        row = self.conn.execute('SELECT info FROM users WHERE name = ?', (user,)).fetchone()
+        if row is None:
+            raise KeyError(user)
+        dates, weights = self.get_points(user, 'weight', 'weight')
+        record = {
+            'info': instrument.loads_json(row[0]),
+            'weight': {'weight': weights, 'dates': dates},
+            'planner': self.get_planner(user),
+        }
+        rows = self.conn.execute('SELECT workout, data FROM workout_log WHERE user = ? ORDER BY id', (user,))
+        for workout, data in rows:
+            entry = instrument.loads_json(data)
+            history = record.setdefault(workout, {attribute: [] for attribute in entry})
+            for attribute, value in entry.items():
+                history[attribute].append(value)
+        return record
+
+    def save_user(self, user: str, record: Dict) -> None:
+        with self.conn:
+            self._replace_user(user, record)
+
+    def _replace_user(self, user: str, record: Dict) -> None:
+        """
+        Rewrites every row of the user. Caller holds the transaction.
+        """
+        for table in ('planner', 'weight_log', 'workout_log'):
+            self.conn.execute(f'DELETE FROM {table} WHERE user = ?', (user,))
+        self.conn.execute('INSERT OR REPLACE INTO users (name, info) VALUES (?, ?)',
+                          (user, json.dumps(record.get('info', {}))))
+        self._insert_planner(user, record.get('planner', {}))
+        weight = record.get('weight', {'dates': [], 'weight': []})
+        self.conn.executemany('INSERT OR REPLACE INTO weight_log (user, date, weight) VALUES (?, ?, ?)',
+                              [(user, d, w) for d, w in zip(weight['dates'], weight['weight'])])
+        for workout, history in record.items():
+            if workout in ('info', 'weight', 'planner'):
+                continue
+            attributes = list(history)
+            rows = [(user, workout, values[0], json.dumps(dict(zip(attributes, values))))
+                    for values in zip(*[history[attribute] for attribute in attributes])]
+            if instrument.ENABLED:
+                instrument.count('bytes_written', sum(len(row[3]) for row in rows))
+            self.conn.executemany('INSERT INTO workout_log (user, workout, date, data) VALUES (?, ?, ?, ?)', rows)
+
+    def _insert_planner(self, user: str, planner: Dict[str, List[str]]) -> None:
+        self.conn.executemany('INSERT INTO planner (user, day, position, grp) VALUES (?, ?, ?, ?)',
+                              [(user, day, i, group) for day, groups in planner.items()
+                               for i, group in enumerate(groups)])
+
+    def create_user(self, user: str, record: Dict) -> None:
+        with self.conn:
+            self.conn.execute('INSERT INTO users (name, info) VALUES (?, ?)',
+                              (user, json.dumps(record.get('info', {}))))
+            self._insert_planner(user, record.get('planner', {}))
+
+    def commit(self, user: str, record: Dict, version: int) -> bool:
+        return not self.commit_many([(user, record, version)])
+
+    def commit_many(self, changes: List[Tuple[str, Dict, int]]) -> List[str]:
+        # BEGIN IMMEDIATE takes the write lock before the versions are read, so nothing can be logged between the
+        # check and the rewrite
+        conflicts = []
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            for user, record, version in changes:
+                row = self.conn.execute('SELECT info FROM users WHERE name = ?', (user,)).fetchone()
+                if row is not None and json.loads(row[0]).get('version', 0) != version:
+                    conflicts.append(user)
+                    continue
+                record.setdefault('info', {})['version'] = version + 1
+                self._replace_user(user, record)
+        return conflicts
+
+    def _bump_version(self, user: str) -> None:
+        """
+        Moves the user's version counter on, so a commit over a record read before this write fails. Caller holds
+        the transaction.
+        """
+        cursor = self.conn.execute("UPDATE users SET info = json_set(info, '$.version', "
+                                   "COALESCE(json_extract(info, '$.version'), 0) + 1) WHERE name = ?", (user,))
+        if cursor.rowcount == 0:
+            raise KeyError(user)
+
+    def append_sets(self, user: str, rows: List[Tuple[str, Dict[str, Any]]]) -> None:
+        with self.conn:
+            self._insert_sets(user, rows)
+            self._bump_version(user)
+
+    def _insert_sets(self, user: str, rows: List[Tuple[str, Dict[str, Any]]]) -> None:
+        rows = [(user, workout_id, entry['dates'], json.dumps(entry)) for workout_id, entry in rows]
+        if instrument.ENABLED:
+            instrument.count('bytes_written', sum(len(row[3]) for row in rows))
+        self.conn.executemany('INSERT INTO workout_log (user, workout, date, data) VALUES (?, ?, ?, ?)', rows)
+
+    def log_weight(self, user: str, date, weight: int) -> None:
+        with self.conn:
+            self._insert_weight(user, date, weight)
+            self._bump_version(user)
+
+    def write_batch(self, ops: List[Tuple]) -> None:
+        # Everything in one transaction
+        with self.conn:
+            for op in ops:
+                if op[0] == 'sets':
+                    self._insert_sets(op[1], op[2])
+                else:
+                    self._insert_weight(op[1], op[2], op[3])
+            for user in {op[1] for op in ops}:
+                self._bump_version(user)
+
+    def _insert_weight(self, user: str, date, weight: int) -> None:
+        ordinal = to_ordinal(date)
+        # Move a weigh-in stored under the old string date over to the ordinal, keeping its place
+        self.conn.execute('UPDATE OR IGNORE weight_log SET date = ? WHERE user = ? AND date = ?',
+                          (ordinal, user, format_date(ordinal)))
+        self.conn.execute('INSERT INTO weight_log (user, date, weight) VALUES (?, ?, ?) '
+                          'ON CONFLICT (user, date) DO UPDATE SET weight = excluded.weight',
+                          (user, ordinal, weight))
+
+    def get_points(self, user: str, tag: str, focus: str) -> Tuple[List, List]:
+        if tag == 'weight':
+            rows = self.conn.execute('SELECT date, weight FROM weight_log WHERE user = ? ORDER BY rowid', (user,))
+        else:
+            rows = self.conn.execute('SELECT date, json_extract(data, ?) FROM workout_log '
+                                     'WHERE user = ? AND workout = ? ORDER BY id', (f'$.{focus}', user, tag))
+        x = []
+        y = []
+        for date, value in rows:
+            # The date columns have text affinity, ordinals come back as strings of digits
+            x.append(int(date) if date.isdigit() else date)
+            y.append(value)
+        return x, y
+
+    def get_history(self, user: str, tag: str) -> History:
+        if tag == 'weight':
+            rows = self.conn.execute('SELECT date, weight FROM weight_log WHERE user = ? ORDER BY rowid', (user,))
+            lists = {'dates': [], 'weight': []}
+            for date, weight in rows:
+                lists['dates'].append(date)
+                lists['weight'].append(weight)
+            return History.from_lists(lists)
+        rows = self.conn.execute('SELECT data FROM workout_log WHERE user = ? AND workout = ? ORDER BY id',
+                                 (user, tag))
+        lists = {}
+        for (data,) in rows:
+            for attribute, value in instrument.loads_json(data).items():
+                lists.setdefault(attribute, []).append(value)
+        return History.from_lists(lists)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+# The public Storage methods, timed on every opened backend when instrumentation is on
+STORAGE_METHODS = [name for name, value in vars(Storage).items() if callable(value) and not name.startswith('_')]
+
+# Backend name to (module, class, default path). Modules are imported when the backend is opened.
+BACKENDS = {
+    'json': ('storage', 'JSONStorage', 'userdata.json'),
+    'sqlite': ('storage', 'SQLiteStorage', 'userdata.db'),
+    'journal': ('journal', 'JournaledStorage', 'userdata.json'),
+    'binary': ('binstore', 'BinaryStorage', 'userdata.bin'),
+    'sharded': ('sharded', 'ShardedStorage', 'userdata.d'),
+}
+
+
+def open_storage(kind: Optional[str] = None, path: Optional[str] = None) -> Storage:
+    """
+    Opens one of the storage backends.
+
+    Args:
+        kind: Backend name from BACKENDS, defaults to the WORKOUT_STORAGE environment variable or 'json'.
+        path: Where the backend keeps its data, defaults to WORKOUT_DATA or the backend's usual file.
+
+    Returns:
+        The opened storage.
+    """
+    kind = kind or os.environ.get('WORKOUT_STORAGE', 'json')
+    if kind not in BACKENDS:
+        raise ValueError(f'Unknown storage backend {kind!r}, pick one of {", ".join(BACKENDS)}')
+    module, name, default_path = BACKENDS[kind]
+    backend = getattr(importlib.import_module(module), name)
+    storage = backend(path or os.environ.get('WORKOUT_DATA') or default_path)
+    # Recorded as storage.<backend>.<method>. Calls that hand back an iterator are timed up to when it is returned.
+    return instrument.timed_methods(storage, STORAGE_METHODS, f'storage.{kind}')
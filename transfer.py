@@ -0,0 +1,251 @@
+"""
+Bulk import and export of logged sets, one set per row, as CSV or JSONL:
+
+    python transfer.py import gym_log.csv
+    python transfer.py export backup.jsonl [--user alice]
+
+Rows have the columns user, workout (the workout's name as shown in the app), dates (mm/dd/yyyy) and the rest of the
+workout's attributes from the catalog (weight, reps, sets and notes, or time, pace, distance and notes for cardio). A
+CSV header lists every attribute used in the catalog and rows leave the ones their workout doesn't have empty.
+Imported rows go through the same checks as sets typed into the app, bad rows are reported with their line number and
+skipped. Files are streamed a row at a time and written in batches, so memory use doesn't grow with the size of the
+file. Use - for stdin/stdout, the format is picked from the file extension unless --format is given.
+"""
+import argparse
+import csv
+import json
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from catalog import catalog
+from history import format_date
+from storage import Storage, open_storage
+from validation import validate_values
+
+COLUMNS = ['user', 'workout']
+
+# validate_entry error codes, plus the ones only an import can hit
+ERRORS = {
+    1: 'too many or too few values',
+    2: "date isn't in mm/dd/yyyy format",
+    3: 'weight is not a number',
+    4: 'reps is not a number',
+    5: 'sets is not a number',
+    6: "workout isn't in the catalog",
+    7: 'no such user',
+    8: "row couldn't be read",
+}
+
+
+def read_rows(f: TextIO, fmt: str) -> Iterator[Tuple[int, Optional[Dict]]]:
+    """
+    Args:
+        f: The open file.
+        fmt: 'csv' (with a header row) or 'jsonl'.
+
+    Yields:
+        (line number, row) pairs, the row is None if the line couldn't be parsed.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+
+def validate_rows(rows: Iterable[Tuple[int, Optional[Dict]]], storage: Storage
+                  ) -> Iterator[Tuple[int, int, Optional[Tuple[str, str, Dict]]]]:
+    """
+    Args:
+        rows: (line number, row) pairs from read_rows.
+        storage: Used to check the users exist.
+
+    Yields:
+        (line number, error code, set) triples. The code is -1 and the set is (user, workout id, entry) for a valid
+        row, otherwise the set is None.
+    """
+    # One read of the user list instead of a has_user call per user
+    known_users = set(storage.users())
+    for line_number, row in rows:
+        if row is None:
+            yield line_number, 8, None
+            continue
+        user = str(row.get('user', ''))
+        if user not in known_users:
+            yield line_number, 7, None
+            continue
+
+        workout = str(row.get('workout', ''))
+        record = catalog.record_for(workout)
+        if record is None:
+            yield line_number, 6, None
+            continue
+        values = [row.get(attribute) for attribute in record['attributes']]
+        if any(value is None for value in values[:-1]):
+            yield line_number, 1, None
+            continue
+        code, values = validate_values(workout, [str(value).strip() if value is not None else ''
+                                                 for value in values])
+        if code != -1:
+            yield line_number, code, None
+            continue
+        yield line_number, -1, (user, catalog.id_for(workout), dict(zip(record['attributes'], values)))
+
+
+def import_rows(rows: Iterable[Tuple[int, Optional[Dict]]], storage: Storage, batch_size: int = 500,
+                errors: TextIO = sys.stderr) -> Tuple[int, int]:
+    """
+    Validates rows and saves the good ones, batch_size sets per write.
+
+    Args:
+        rows: (line number, row) pairs from read_rows.
+        storage: Where to save the sets.
+        batch_size: Most sets held in memory before they are written.
+        errors: Where bad rows are reported.
+
+    Returns:
+        How many sets were saved and how many rows were rejected.
+    """
+    saved = 0
+    rejected = 0
+    pending: Dict[str, List[Tuple[str, Dict]]] = {}
+    held = 0
+    for line_number, code, row in validate_rows(rows, storage):
+        if code != -1:
+            rejected += 1
+            errors.write(f'line {line_number}: {ERRORS[code]}\n')
+            continue
+        user, workout_id, entry = row
+        pending.setdefault(user, []).append((workout_id, entry))
+        held += 1
+        if held >= batch_size:
+            saved += _flush(pending, storage)
+            held = 0
+    saved += _flush(pending, storage)
+    return saved, rejected
+
+
+def _flush(pending: Dict[str, List[Tuple[str, Dict]]], storage: Storage) -> int:
+    # One write for the whole batch, however many users it covers
+    if pending:
+        storage.write_batch([('sets', user, sets) for user, sets in pending.items()])
+    count = sum(len(sets) for sets in pending.values())
+    pending.clear()
+    return count
+
+
+def export_rows(storage: Storage, users: Optional[List[str]] = None) -> Iterator[Dict]:
+    """
+    Args:
+        storage: Where to read the sets from.
+        users: Only export these users, everyone if None.
+
+    Yields:
+        One row per logged set, in the import layout, with every attribute stored for the workout.
+    """
+    records = storage.all_records() if users is None else storage.load_users(users)
+    for user, record in records:
+        for workout_id in catalog.ids():
+            lists = record.get(workout_id)
+            if not lists:
+                continue
+            name = catalog.get(workout_id)['name']
+            attributes = list(lists)
+            for values in zip(*lists.values()):
+                row = {'user': user, 'workout': name}
+                row.update(zip(attributes, values))
+                # Written out the way they are typed in, whether stored as ordinals or strings
+                row['dates'] = format_date(row['dates'])
+                yield row
+
+
+def csv_columns() -> List[str]:
+    """
+    Returns:
+        The CSV header: user, workout and every attribute used by a workout in the catalog.
+    """
+    columns = list(COLUMNS)
+    for workout_id in catalog.ids():
+        for attribute in catalog.get(workout_id)['attributes']:
+            if attribute not in columns:
+                columns.append(attribute)
+    return columns
+
+
+def write_rows(rows: Iterable[Dict], f: TextIO, fmt: str) -> int:
+    """
+    Args:
+        rows: Rows from export_rows.
+        f: The open file.
+        fmt: 'csv' or 'jsonl'.
+
+    Returns:
+        How many rows were written.
+    """
+    count = 0
+    if fmt == 'csv':
+        # Attributes the catalog no longer lists couldn't be imported again anyway
+        writer = csv.DictWriter(f, fieldnames=csv_columns(), extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            f.write(json.dumps(row) + '\n')
+            count += 1
+    return count
+
+
+def _format(path: str, fmt: Optional[str]) -> str:
+    if fmt is not None:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('file', help='file to read or write, - for stdin/stdout')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default=None)
+    parser.add_argument('--batch', type=int, default=500, help='sets saved per write when importing')
+    parser.add_argument('--user', action='append', help='only export this user, can be given more than once')
+    parser.add_argument('--backend', default=None, help='storage backend, defaults to WORKOUT_STORAGE or json')
+    parser.add_argument('--path', default=None, help='storage path, defaults to WORKOUT_DATA or the backend default')
+    args = parser.parse_args(argv)
+
+    fmt = _format(args.file, args.format)
+    storage = open_storage(args.backend, args.path)
+    try:
+        if args.command == 'import':
+            f = sys.stdin if args.file == '-' else open(args.file, 'r', newline='')
+            try:
+                saved, rejected = import_rows(read_rows(f, fmt), storage, args.batch)
+            finally:
+                if f is not sys.stdin:
+                    f.close()
+            print(f'Imported {saved} sets, rejected {rejected} rows', file=sys.stderr)
+            return 1 if rejected else 0
+
+        f = sys.stdout if args.file == '-' else open(args.file, 'w', newline='')
+        try:
+            written = write_rows(export_rows(storage, args.user), f, fmt)
+        finally:
+            if f is not sys.stdout:
+                f.close()
+        print(f'Exported {written} sets', file=sys.stderr)
+        return 0
+    finally:
+        storage.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
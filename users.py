@@ -0,0 +1,148 @@
+import csv
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from locking import file_lock
+
+
+class UserDirectory:
+    """
+    Username to password index over login.csv. The file is read once and new accounts are appended to it instead of
+    rewriting it, so logging in and creating an account don't depend on how many accounts there are. If something
+    else changes the file it is read again on the next lookup.
+
+    Several front-ends can share the file: lookups take a shared lock on path + '.lock' and add takes an exclusive
+    one around the check for the username and the append, so two of them can't both create the same account.
+    """
+    def __init__(self, path: str = 'login.csv'):
+        """
+        Sets up an empty directory, the file is loaded on first use
+
+        Args:
+            path: Location of the login csv.
+        """
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.passwords = {}
+        self._stamp = None
+        self._count = 0
+        # False if the last row isn't terminated, the next add has to start a new line
+        self._ends_with_newline = True
+        self._lock = threading.Lock()
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            info = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return info.st_mtime_ns, info.st_size
+
+    def _refresh(self) -> None:
+        """
+        Loads the csv if it hasn't been loaded yet or was changed by someone else. Only reads, a missing file is an
+        empty directory. Caller holds the lock and the file lock.
+        """
+        stamp = self._file_stamp()
+        if stamp is not None and stamp == self._stamp:
+            return
+        if stamp is None:
+            self.passwords = {}
+            self._count = 0
+            self._ends_with_newline = True
+            self._stamp = None
+            return
+
+        passwords = {}
+        count = 0
+        with open(self.path, 'r', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            user_col = header.index('Users')
+            password_col = header.index('Passwords')
+            for row in reader:
+                if len(row) <= max(user_col, password_col):
+                    continue
+                count += 1
+                # The first row for a name wins, like the old DataFrame lookup
+                passwords.setdefault(row[user_col], row[password_col])
+        with open(self.path, 'rb') as f:
+            ends_with_newline = True
+            if stamp[1] > 0:
+                f.seek(-1, os.SEEK_END)
+                ends_with_newline = f.read(1) == b'\n'
+
+        self.passwords = passwords
+        self._count = count
+        self._ends_with_newline = ends_with_newline
+        self._stamp = stamp
+
+    def _read(self) -> None:
+        # Lookups, under the shared lock so they don't read half an appended row
+        with file_lock(self.lock_path, shared=True):
+            self._refresh()
+
+    def exists(self, username: str) -> bool:
+        """
+        Args:
+            username: The username to look for.
+
+        Returns:
+            True if there is an account with that username.
+        """
+        with self._lock:
+            self._read()
+            return username in self.passwords
+
+    def password_for(self, username: str) -> Optional[str]:
+        """
+        Args:
+            username: The username to look for.
+
+        Returns:
+            The stored password, or None if there is no such user.
+        """
+        with self._lock:
+            self._read()
+            return self.passwords.get(username)
+
+    def add(self, username: str, password: str) -> bool:
+        """
+        Adds an account by appending one row to the csv.
+
+        Args:
+            username: The new username.
+            password: The new password.
+
+        Returns:
+            False if the username is already taken, True otherwise.
+        """
+        with self._lock, file_lock(self.lock_path):
+            # Read again under the exclusive lock, another front-end may have just added the same name
+            self._refresh()
+            if username in self.passwords:
+                return False
+            with open(self.path, 'a', newline='') as f:
+                if self._stamp is None:
+                    f.write(',Users,Passwords\n')
+                elif not self._ends_with_newline:
+                    f.write('\n')
+                csv.writer(f, lineterminator='\n').writerow([self._count + 1, username, password])
+            self.passwords[username] = password
+            self._count += 1
+            self._ends_with_newline = True
+            self._stamp = self._file_stamp()
+            return True
+
+    def all(self) -> Dict[str, str]:
+        """
+        Returns:
+            A copy of the username to password index.
+        """
+        with self._lock:
+            self._read()
+            return dict(self.passwords)
+
+
+# Accounts behind run_login and run_account_create. login.csv is read on first use and again only when it changes
+directory = UserDirectory()
@@ -0,0 +1,59 @@
+from typing import List, Tuple
+
+from catalog import catalog
+from history import parse_date
+from instrument import timed
+
+
+@timed
+def validate_entry(workout: str, text: str) -> Tuple[int, List]:
+    """
+    Checks one row of workout data typed in by the user.
+
+    Args:
+        workout: The workout name.
+        text: Comma-separated values in the order of the workout's attributes (date, weight, reps, sets, notes).
+
+    Returns:
+        A tuple where:
+            - The first value is -1 if the row is valid, otherwise an error code:
+                1: Too many or too few values
+                2: Date isn't in mm/dd/yyyy format
+                3: Weight is not a number
+                4: Reps is not a number
+                5: Sets is not a number
+                6: The workout isn't in the catalog
+            - The second value is the parsed values (date as a day ordinal), ready for send_to_file.
+    """
+    return validate_values(workout, [x.strip() for x in text.split(',')])
+
+
+@timed
+def validate_values(workout: str, values: List) -> Tuple[int, List]:
+    """
+    Same checks as validate_entry, for values that are already split up (e.g. a row of an imported file).
+
+    Args:
+        workout: The workout name.
+        values: The values in the order of the workout's attributes (date, weight, reps, sets, notes).
+
+    Returns:
+        The error code (-1 if valid) and the parsed values, as in validate_entry.
+    """
+    record = catalog.record_for(workout)
+    if record is None:
+        return 6, []
+    values = list(values)
+    if len(values) != len(record['attributes']):
+        return 1, values
+    try:
+        # Dates are stored as day ordinals, so the parse is kept instead of thrown away
+        values[0] = parse_date(values[0])
+    except ValueError:
+        return 2, values
+    for i in range(1, 4):
+        try:
+            values[i] = int(values[i])
+        except ValueError:
+            return i + 2, values
+    return -1, values
@@ -0,0 +1,95 @@
+from typing import Any, Callable, Dict, Optional, Set
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class TaskSignals(QObject):
+    """
+    Signals for one background task. They are created on the GUI thread, so slots connected to them run back on the
+    GUI thread even though the task emits them from the worker.
+    """
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+
+class Task(QRunnable):
+    """
+    One processing call to run off the GUI thread.
+    """
+    def __init__(self, fn: Callable, args: tuple):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.signals = TaskSignals()
+        # The executor keeps the Python object alive, so Qt mustn't delete it
+        self.setAutoDelete(False)
+
+    def run(self) -> None:
+        try:
+            result = self.fn(*self.args)
+        except Exception as e:
+            self.signals.failed.emit(f'{type(e).__name__}: {e}')
+        else:
+            self.signals.finished.emit(result)
+
+
+class IOExecutor(QObject):
+    """
+    Runs processing.py calls (which read and write files) on a background thread so the window never freezes.
+
+    All tasks run one at a time on a single worker, in the order they were submitted, so a weigh-in is always saved
+    before the graph that shows it is loaded. Tasks submitted with a key replace a task with the same key that
+    hasn't started yet, so clicking Submit twice or scrolling through the goal list only does the last one.
+    """
+    # Number of tasks queued or running, for showing pending/saved state
+    pending_changed = pyqtSignal(int)
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._tasks: Set[Task] = set()
+        self._keyed: Dict[str, Task] = {}
+
+    def submit(self, fn: Callable, *args: Any, on_done: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[str], None]] = None, key: Optional[str] = None) -> None:
+        """
+        Queues a call to run on the worker.
+
+        Args:
+            fn: The function to call.
+            *args: Arguments for fn.
+            on_done: Called on the GUI thread with fn's return value.
+            on_error: Called on the GUI thread with a description of the exception if fn raises.
+            key: Tasks with the same key are coalesced, a queued one is dropped in favour of this one.
+        """
+        if key is not None and key in self._keyed:
+            old = self._keyed.pop(key)
+            # tryTake only succeeds if the task hasn't started, a running one is left to finish
+            if self.pool.tryTake(old):
+                self._tasks.discard(old)
+
+        task = Task(fn, args)
+        if on_done is not None:
+            task.signals.finished.connect(on_done)
+        if on_error is not None:
+            task.signals.failed.connect(on_error)
+        task.signals.finished.connect(lambda _: self._task_done(task, key))
+        task.signals.failed.connect(lambda _: self._task_done(task, key))
+        if key is not None:
+            self._keyed[key] = task
+        self._tasks.add(task)
+        self.pool.start(task)
+        self.pending_changed.emit(len(self._tasks))
+
+    def _task_done(self, task: Task, key: Optional[str]) -> None:
+        if key is not None and self._keyed.get(key) is task:
+            del self._keyed[key]
+        self._tasks.discard(task)
+        self.pending_changed.emit(len(self._tasks))
+
+    def wait(self) -> None:
+        """
+        Blocks until every queued task has run, used when the window closes so no write is lost.
+        """
+        self.pool.waitForDone()